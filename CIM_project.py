@@ -8,16 +8,25 @@
 ###############################################################################################
 
 import os.path
+import time, uuid
 import numpy as np, pickle
-import cv2
-import gaugan
 from PIL import Image
 import streamlit as st
 from streamlit_drawable_canvas import st_canvas
-import pytube
-import stqdm
-from moviepy.editor import *
-import moviepy.video.io.ffmpeg_tools as ffmpg
+from cim.compositing import make_background
+from cim.palette import LabelPalette, content_hash
+from cim.gaugan_cache import GauGANCache
+from cim.pipeline import sort_files, list_frames, save_uploaded_images, save_drawing
+from cim.workspace import Workspace, cleanup_workspaces
+from cim.jobs import JobQueue, gaugan_job, render_job, QUEUED, RUNNING, DONE
+from cim.preview import make_preview, cached_preview, available_renditions
+from cim.timeline import Timeline
+from cim.effects import DEFAULT_EFFECTS
+from cim.youtube_audio import YouTubeAudioCache
+from cim.encoder import FFmpegError
+from cim.disk_cache import atomic_write
+from cim import tracing
+# cv2, moviepy, gaugan and pytube are imported by the functions that use them, so the app starts faster
 
 ###############################################################################################
 ######################### BACKEND FUNCTIONS
@@ -38,6 +47,15 @@ def load_colors():
 colors, colors_hex = load_colors()
 
 
+@st.cache(allow_output_mutation=True)
+def load_palette() -> LabelPalette:
+    """
+    The GauGAN colors' palette and its lookup table are built once for all the sessions
+    :return: LabelPalette of the GauGAN colors
+    """
+    return LabelPalette(colors)
+
+
 def convert_to_hex(rgb):
     """
     This function converts RGB color value into HEX value
@@ -48,218 +66,94 @@ def convert_to_hex(rgb):
     return '#{:02x}{:02x}{:02x}'.format(r, g, b)
 
 @st.cache(allow_output_mutation=True)
-def countering():
+def youtube_audio_cache() -> YouTubeAudioCache:
     """
-    This function along with enabling the cache allows to save state in streamlit
-    :return: empty list that will be recalled from the cache
+    One cache of the YouTube soundtracks for all the sessions, so a video's soundtrack is downloaded once
+    :return: the YouTubeAudioCache object
     """
-    return []
+    return YouTubeAudioCache('youtube_audio_cache')
 
+@st.cache(allow_output_mutation=True)
+def job_queue():
+    """
+    This function along with enabling the cache shares one background job queue between all sessions.
+    Old workspaces are cleaned up when the queue starts.
+    :return: the JobQueue object
+    """
+    cleanup_workspaces()
+    return JobQueue()
 
-counter = countering()
+
+def workspace() -> Workspace:
+    """
+    Every session works in its own directories, so concurrent users don't overwrite each other's frames
+    :return: the session's Workspace
+    """
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return Workspace(st.session_state.session_id)
 
 
-def make_canvas() -> np.array:
+def make_canvas(height=512, width=512) -> np.array:
     '''
     Make initial canvas sea and sky that fits the requirements for GauGAN
-    :return: Initial default draw - a numpy array with the dimensions 512x512x3
+    :param height: canvas height in pixels
+    :param width: canvas width in pixels
+    :return: Initial default draw - a numpy array with the dimensions height x width x 3
     '''
-    # Create canvas of zeros 512*512*3
-    img = np.zeros((512,512,3), np.uint8)
-    # Set 300 upper pixels to sky color
-    img[0:300, 0:512] = colors['Sky']
-    # Set the rest pixels to sea color
-    img[300:512, 0:512] = colors['Sea']
-    # Return canvas
-    return img
+    # Upper 300/512 of the canvas is sky, the rest is sea
+    return make_background(colors, height, width)
 
 
-def sort_files(path: str) -> list:
-
-    '''
-    Sort files in ascending order of creation time.
-    Use for sorting drawings to make nature photos out of them,
-    and for sorting drawings/pictures to make a movie out of them.
-    :param path: directory path.
-    :return: list of files
-    '''
-    # Make list of file names given the path
-    path = path+'/'
-    files = os.listdir(path)
-    # Join path with each file
-    files = [path+f for f in files]
-    # Sort the files inplace using key=os.path.getmtime
-    files.sort(key=os.path.getmtime)
-    # Return sorted files
-    return files
-
-
-def make_nature(styles_dict: dict,foldername='tmp',processedfoldername='Processed_imgs',styles=[1]):
-    """
-    Process drawings in GauGAN
-    :param styles_dict: dictionary of styles where keys are the style's name and the values are the style's number
-    :param foldername: The directory that the drawings will be read from
-    :param processedfoldername: The directory where the processed drawings will be saved
-    :param styles: the styles the user has chosen to process in GauGAN
-    :return:
+def job_running(job_key: str) -> bool:
     """
-    # initialize counters for success/failure of process
-    success,failure = 0,0
-
-    # Sort files by creation time in drawings directory.
-    files = sort_files(foldername)
-    # Loop files
-    for i in stqdm.stqdm(range(len(files))):
-        p = files[i]
-        for j in stqdm.stqdm(range(len(styles))):
-            # Read each file
-            with open(p, "rb") as f:
-                # Get processed image back from GauGAN server.
-                image = gaugan.processImage(f.read(), style=styles_dict[styles[j]])
-            # Open the processed file for writing add style num to img name
-            saving_path = processedfoldername+"/"+os.path.split(p[:-4])[-1]+'%s.jpg'%j
-
-            # Load the error image that can be received as result in case of colors issue
-            error_detector = cv2.imread('error_detector.png')
-
-            if np.array_equal(image,error_detector): # If the process in GauGAN server failed
-                failure += 1
-            else:
-                if not os.path.exists(processedfoldername):
-                    os.makedirs(processedfoldername) # create the processed in GauGAN folder if it doesn't exist
-
-                with open(saving_path, "wb") as f: # Save the processed drawing
-                    # Write the processed file.
-                    f.write(image)
-                success += 1
-    if success>0:
-        st.success("%s Files were processed successfully!"%success)
-    if failure>0:
-        st.warning("%s Files failed to be processed due to an error!")
-
+    :param job_key: the session state key of the job's id
+    :return: True if the session's last job of this kind is queued or running
+    """
+    job_id = st.session_state.get(job_key)
+    status = job_queue().status(job_id) if job_id is not None else None
+    return status is not None and status['status'] in (QUEUED, RUNNING)
 
 
-def make_seret(processed_files_directory='files/',fps=5):
+def show_job(job_key: str):
     """
-    This function creates the initial movie in AVI format using opencv.
-    The movie frame rate will be dfined by the fps variable.
-    :param processed_files_directory: The drawings/pictures that will be composited
-    :param fps: frames per second
-    :return:
-    """
-    # Sort files in processed images directory
-    files = sort_files(processed_files_directory)
-    # Create list as container for the movie.
-    img_array = []
-    # For each file
-    for file in files:
-        file_format = file.split(".")
-        if file_format[-1] == 'jpg': # verify that we will include jpg files only in the movie
-            # Read the file
-            img = cv2.imread(file)
-            # Extract height, width, channels from image
-            height, width, layers = img.shape
-            # size = (width, height)
-            size = (width, height)
-            # Append image to movie container
-            img_array.append(img)
-    # Create a video writer for the movie
-    out = cv2.VideoWriter(processed_files_directory+'initial.avi', cv2.VideoWriter_fourcc(*'DIVX'), fps, size)
-    # For each image in container
-    for image in img_array:
-        # Write image by video writer
-        out.write(image)
-    # Release video writer.
-    out.release()
-
-
-def make_movie(processed_files_directory='files/', WITH_SUBTITLES=False, WITH_AUDIO=False):
-    """
-    Based on the product of the make_seret function, this function will create the final movie,
-    with audio/subtitles/both.
-    :param processed_files_directory: The directory in which the final movie will be saved
-    :param WITH_SUBTITLES: boolean
-    :param WITH_AUDIO: boolean
-    :return:
+    Show the status and progress of the session's last job, and keep polling it until it finishes
+    :param job_key: the session state key of the job's id
+    :return: the job's status dictionary, None if there is no such job
     """
-    # Declare the text for sub-titles
-
-    if WITH_SUBTITLES: # if the user is willing to have subtitles in the movie
-        with open(processed_files_directory+'subtitles.txt', 'r', encoding='utf8') as f:
-            txt = f.read() # read the subtitles file
-        # Split text to lines.
-        subtitles = txt.split('\n')
-        # Declare  VideoFileClip from the movie that I already have.
-        clip = VideoFileClip(processed_files_directory + "initial.avi")
-        # Declare duration of one sub-title as total duration of the video divided by number of lines.
-        duration = clip.duration/len(subtitles)
-        # Set start to zero.
-        start=0
-        # Set container for the clips.
-        videos=[]
-        # Loop all sub-titles
-        for line in subtitles:
-            # Make text clip from the reversed Hebrew text
-            txt_clip = TextClip(line[::-1], fontsize=30, color='yellow', font='Calibri')
-            # Set position to the bottom of screen.
-            txt_clip = txt_clip.set_position('bottom').set_duration(duration)
-            # Make sub clip of the movie with same duration as text clip.
-            sub_clip = clip.subclip(start,start+duration)
-            # Set CompositeVideoClip from the text clip and sub clip.
-            video = CompositeVideoClip([sub_clip, txt_clip])
-            # Insert the video to the clips container
-            videos.append(video)
-            # Set start time for next sub-title.
-            start+=duration
-        # Concatenate all clips of the container.
-        res = concatenate_videoclips(videos)
-        clip = res # now the clip is res
-    else:
-        clip = VideoFileClip(processed_files_directory+ "initial.avi") # the clip won't have subtitles
-
-
-    # Set audio clip from mp3 file.
-    if WITH_AUDIO: # if the user has chosen to include soundtrack in the movie
-        f = 'audio.mp3' # change to mp3 soundtrack file of the movie
-        # set the duration of the audioclip to max(duration of clip), even if the audioclip is longer
-        audioclip = AudioFileClip(processed_files_directory+f)
-
-        # check if the clip length is bigger than the
-        if clip.duration > audioclip.duration:
-            number_of_duplicated = int(np.ceil(clip.duration/audioclip.duration))
-            # duplicate the audioclip in order to later fit the movie's duration
-            audioclip = concatenate_audioclips([AudioFileClip(processed_files_directory+f) for i in range(number_of_duplicated)])
-
-        # Now fit the audioclip duration to the movie's
-        audioclip = audioclip.set_duration(clip.duration)
-
-        # Set audio for the container.
-        if not WITH_SUBTITLES: # if the user wanted to have audio included without subtitles
-            videoclip = clip.set_audio(audioclip)
-        else: # if the user wanted to have both audio and subtitles
-            videoclip = res.set_audio(audioclip)
-    else:
-        videoclip = clip # if the user didn't want audio in the movie
+    job_id = st.session_state.get(job_key)
+    status = job_queue().status(job_id) if job_id is not None else None
+    if status is None:
+        return None
+    if status['status'] in (QUEUED, RUNNING):
+        if status['status'] == QUEUED:
+            st.info("Waiting for a free worker...")
+        else:
+            st.info("%s..."%(status['stage'] or "Working"))
+        st.progress(int(status['progress']*100))
+        # Poll the job again in a second
+        time.sleep(1)
+        st.experimental_rerun()
+    elif status['status'] != DONE:
+        st.error("Unexpected error has occured, please try again! (%s)"%status['error'])
+    return status
 
-    # Write the video file.
-    f = 'final_movie.mp4' # change to the desired movie filename
-    videoclip.write_videofile(processed_files_directory+f)
 
-def download_audio_from_youtube(youtube_link: str):
+def download_audio_from_youtube(youtube_link: str, foldername='files'):
     """
     This function will extract the audio from youtube video
     :param youtube_link: The youtube video link
+    :param foldername: The directory where the audio will be saved as audio.mp3
     :return:
     """
-    with st.spinner("Extracting audio from Youtube..."):
+    with st.spinner("Extracting audio from Youtube..."), tracing.stage('download_audio_from_youtube'):
         try:
-            a = pytube.YouTube(youtube_link).streams.first().download('files/','video_for_audio') # Download video from youtube
-            b = ffmpg.ffmpeg_extract_audio('files/video_for_audio.mp4','files/audio.mp3')         # extract sound and save as mp3
-            os.remove('files/video_for_audio.mp4')                                                # remove unecessary video
-            # Release the process from the downloaded files
-            del a, b
+            # Only the video's audio stream is downloaded (straight into the mp3 encode), once per video
+            downloaded = youtube_audio_cache().fetch(youtube_link, os.path.join(foldername,'audio.mp3'))
+            tracing.annotate(bytes_downloaded=downloaded, cached=downloaded == 0)
             st.success("Sound was extracted successfully from the youtube video!")
         except:
+            tracing.annotate(status='error')
             st.error("Unexpected error has occured, please try again!")
 
 
@@ -281,66 +175,34 @@ def draw(canvas_result,automatic_save,manual_save):
     if canvas_result is not None and canvas_result.image_data is not None and (automatic_save or manual_save):
         # Receive the user's drawing with the dimensions: 512X512X4
         img_data = canvas_result.image_data
-        # the user's drawing is in RGBA mode with floats instead of integers - convert to uint8 type and to RGB format
-        im = Image.fromarray(img_data.astype(np.uint8)[:,:,:3]).convert('RGB') # convert to dimensions 512X512X3
-        # initialize a copy of the user's drawing.
-        add_bg = np.array(im, dtype='uint8') # initalize a copy
         # allow the user to know that the saving is in progress.
         with st.spinner("Saving image..."):
             # the drawing is lack of the GauGAN background because streamlit_drawable_canvas library doesn't allow it yet.
-            # Because of that the background will be added manually - o(n^3) at the moment.
-            for i in range(add_bg.shape[0]):
-                for j in range(add_bg.shape[1]):
-                    if list(add_bg[i,j]) != [0,0,0]: # if the current RGB value is not (0,0,0) (black) -
-                        for k in range(add_bg.shape[2]): # then make sure we don't have white values (255)
-                            if add_bg[i,j][k] == 255: # we will fill them with the relevant background color position
-                                add_bg[i,j][k] = colors['Sky'][k] if i<300 else colors['Sea'][k]
-                    else: # else, we do indeed have RGB value of (0,0,0), then replace it by its entirety to the relevant
-                        # background color.
-                        add_bg[i,j] = colors['Sky'] if i<300 else colors['Sea']
-
-            # Create PIL object of the manually added background with drawing on the canvas
-            add_bg = Image.fromarray(add_bg)
-            # Assign the path where the file will be saved
-            if not os.path.exists("tmp/"):
-                os.makedirs("tmp/")
-            file_path = f"tmp/pic%s.png"%(len(counter))
-            # Increase the counter by adding dummy element into the counter list
-            counter.append(0)
-            # Save the drawing in PNG format
-
-            add_bg.save(file_path, "PNG")
-            st.success("Image saved successfully. Keep drawing!!")
-
-def save_uploadedfiles(uploadedfiles: list, foldername: str, process=True):
+            # Because of that the background is added manually: transparent/black pixels and white values are
+            # replaced by the background color, using whole-array operations.
+            # The drawing is then snapped to the GauGAN colors and saved as a palette PNG - the session's next drawing
+            file_path = save_drawing(img_data, make_canvas(*img_data.shape[:2]), load_palette(),
+                                     workspace().next_drawing_path())
+            if file_path is None: # the same drawing was already saved
+                if manual_save:
+                    st.info("The drawing didn't change since it was last saved")
+            else:
+                st.success("Image saved successfully. Keep drawing!!")
+
+def save_uploadedfiles(uploadedfiles: list, foldername: str, process=True, size=(512,512), mode='stretch'):
     """
     If the user has chosen to upload files instead of creating drawings, this function will
     receive the list of files and save them into the given folder name
     :param uploadedfiles: A list of the uploaded files
     :param foldername: The directory where the files will be saved
     :param process: Whether to process prepare the files for processing or not
+    :param size: the pictures' (width, height)
+    :param mode: how the pictures are fitted to the size - 'stretch', 'letterbox' or 'crop'
     :return: Success message if all went correctly
     """
-    # make sure the foldername exists
-    if not os.path.exists(foldername+"/"):
-        os.makedirs(foldername+"/")
-    # Go over each file
-    for i, file in enumerate(uploadedfiles):
-        if process:
-            # define the picture filename according to the counter i, png file for processing with GauGAN
-            joined_path = os.path.join(foldername,"%s.png"%i)
-        else:
-            # define the picture filename according to the counter i, jpg file if processing is skipped
-            joined_path = os.path.join(foldername,"%s.jpg"%i)
-        # open the file
-        resized = Image.open(file)
-        # make sure to have the picture in 512X512 resolution
-        resized = resized.resize((512,512))
-        # save the file
-        if process:
-            resized.save(joined_path)
-        else:
-            resized.save(joined_path, "JPEG")
+    # The pictures are decoded and resized on all the cores
+    with st.spinner("Saving %s files..."%len(uploadedfiles)):
+        save_uploaded_images(uploadedfiles, foldername, process, size, mode)
     return st.success("Files were saved successfully")
 
 
@@ -400,17 +262,23 @@ def edit():
     if select_action == "Upload Files":
         # Accept multiple files from the user - with jpg/png format only.
         lst = st.file_uploader("Upload",type=['jpg','png'],accept_multiple_files=True)
+        # How the pictures are fitted to the movie's frame size
+        st.sidebar.subheader("Pictures Size")
+        width = st.sidebar.number_input("Width", 64, 4096, 512, 64)
+        height = st.sidebar.number_input("Height", 64, 4096, 512, 64)
+        resize_modes = {"Stretch": 'stretch', "Letterbox": 'letterbox', "Center crop": 'crop'}
+        mode = resize_modes[st.sidebar.selectbox("Fit", list(resize_modes.keys()))]
 
         # If the user has uploaded GauGAN pictures and he wants to process them in GauGAN
         if st.button("Save For GauGAN Processing"):
             if lst: # then save the files in the folder from which the pictures will be processed
-                save_uploadedfiles(lst,"tmp")
+                save_uploadedfiles(lst,workspace().drawings,size=(width,height),mode=mode)
             else: # if the user has chosen this option but didn't upload any file
                 st.error("Please select files")
         # If the user wants to avoid the GauGAN processing:
         elif st.button("Save Without GauGAN Processing"):
             if lst: # then take the pictures as if they were processed in GauGAN
-                save_uploadedfiles(lst,"files", process=False)
+                save_uploadedfiles(lst,workspace().files, process=False, size=(width,height), mode=mode)
             else: # if the user has chosen this option but didn't upload any file
                 st.error("Please select files")
 
@@ -430,21 +298,147 @@ def process():
     # Allow the user to choose the keys from the styles dictionary
     styles = st.multiselect("Styles: ",list(styles_dict.keys()),"Afternoon 1")
 
+    # Allow the user to choose how many requests are sent to GauGAN at the same time
+    st.sidebar.subheader("Parallel GauGAN requests")
+    max_workers = st.sidebar.slider("", 1, 16, 4)
+
+    # Results of previously processed drawings are taken from the cache
+    cache = GauGANCache('gaugan_cache')
+
     # set the directory where the pictures will be imported from
-    DIR = 'tmp/'
+    ws = workspace()
+    DIR = ws.drawings
     # Calculate the number of files that are going to be processed
-    number_of_files = len([name for name in os.listdir(DIR) if os.path.isfile(os.path.join(DIR, name))])
+    number_of_files = len(sort_files(DIR))
     # Show it in the sidebar
     st.sidebar.subheader("Total pictures to process: %s"%number_of_files)
     # If the user has chosen to process them:
     if st.button("Start processing with GauGAN"):
-        if number_of_files > 0:
-            # Then process it: take the directory where the going-to-be-imported pictures exist,
-            # Process them, and save them in 'files' directory.
-            make_nature(styles_dict,DIR[:-1],'files',styles)
+        if job_running('gaugan_job'): # one processing at a time per session
+            st.warning("The pictures are already being processed, please wait.")
+        elif number_of_files > 0:
+            # Then process it in the background: take the directory where the going-to-be-imported pictures exist,
+            # Process them, and save them in the session's 'files' directory.
+            st.session_state.gaugan_job = job_queue().submit('gaugan', gaugan_job, dict(styles_dict), DIR, ws.files,
+                                                             styles, max_workers=max_workers,
+                                                             cache_directory=cache.directory)
         else: # the number of files is zero
             st.warning("There are no files to process.")
 
+    # Show the progress of the processing, and its results once it's done
+    status = show_job('gaugan_job')
+    if status is not None and status['status'] == DONE:
+        success,failure = status['result']
+        if success>0:
+            st.success("%s Files were processed successfully!"%success)
+        if failure>0:
+            st.warning("%s Files failed to be processed due to an error!"%failure)
+
+    # Show the GauGAN results cache status, and allow the user to empty it
+    st.sidebar.write("------------------------------")
+    st.sidebar.subheader("GauGAN cache")
+    st.sidebar.write("%s results, %.1f MB"%(len(cache),cache.size()/1024**2))
+    st.sidebar.write("Hits: %s, Misses: %s"%(cache.hits,cache.misses))
+    if st.sidebar.button("Purge cache"):
+        cache.purge()
+        st.sidebar.success("The cache was purged")
+
+
+def save_input(key: str, content: bytes, path: str) -> bool:
+    """
+    Save one of the movie's inputs (the subtitles, the uploaded soundtrack) unless the file already holds it - the page
+    runs again every second while a job is running, and the file is only written when the input changed
+    :param key: the input's name, e.g. 'audio'
+    :param content: the file content
+    :param path: where to save it
+    :return: True if the file was written
+    """
+    if 'saved_inputs' not in st.session_state:
+        st.session_state.saved_inputs = {}
+    try:
+        stat = os.stat(path)
+        written = (content_hash(content), path, stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        written = None
+    if written is not None and st.session_state.saved_inputs.get(key) == written:
+        return False
+    atomic_write(path, content)
+    stat = os.stat(path) # the file's own signature, so a file written by anything else (e.g. from YouTube) is replaced
+    st.session_state.saved_inputs[key] = (content_hash(content), path, stat.st_mtime_ns, stat.st_size)
+    return True
+
+
+def save_subtitles(subtitles: str, timed=False, foldername='files'):
+    """
+    Save the movie's subtitles: timed subtitles in subtitles.srt, or lines in subtitles.txt.
+    The other subtitles file is removed, so the movie uses the subtitles that were saved last.
+    :param subtitles: the subtitles file content
+    :param timed: True for SRT content, False for subtitles lines
+    :param foldername: The directory where the subtitles will be saved
+    :return:
+    """
+    if not os.path.exists(foldername+"/"):
+        os.makedirs(foldername+"/")
+    path, other = ('subtitles.srt', 'subtitles.txt') if timed else ('subtitles.txt', 'subtitles.srt')
+    save_input('subtitles', subtitles.encode('utf-8'), os.path.join(foldername, path))
+    if os.path.isfile(os.path.join(foldername, other)):
+        os.remove(os.path.join(foldername, other))
+
+
+def snapshot_inputs(foldername: str, with_subtitles: bool, with_audio: bool) -> dict:
+    """
+    Copy the movie's subtitles and soundtrack for a render job, so the job reads files that don't change while it
+    runs - the user may save other ones meanwhile
+    :param foldername: the movie's directory
+    :param with_subtitles: True if the movie has subtitles
+    :param with_audio: True if the movie has a soundtrack
+    :return: the render job's subtitles_file and audio_file options
+    """
+    snapshot = os.path.join(foldername, '.render') # hidden, so the frame manifest ignores it
+    os.makedirs(snapshot, exist_ok=True)
+    options = {}
+    inputs = [('subtitles_file', ['subtitles.srt', 'subtitles.txt'] if with_subtitles else []),
+              ('audio_file', ['audio.mp3'] if with_audio else [])]
+    for option, names in inputs:
+        for name in names:
+            if os.path.isfile(os.path.join(foldername, name)):
+                with open(os.path.join(foldername, name), 'rb') as f:
+                    atomic_write(os.path.join(snapshot, name), f.read())
+                options[option] = os.path.join(snapshot, name)
+                break
+    return options
+
+
+def edit_timeline(foldername: str, fps: float) -> bool:
+    """
+    Let the user hold frames longer than 1/fps and crossfade between frames
+    :param foldername: the frames' directory
+    :param fps: frames per second - the default duration of a frame
+    :return: True if the timeline isn't the plain 1/fps per frame timeline
+    """
+    timeline = Timeline(foldername)
+    if st.checkbox("Edit frame timing (hold frames longer, crossfade between them)"):
+        crossfade = st.slider("Crossfade between all the frames (seconds):",0.0,2.0,float(timeline.crossfade),0.1)
+        if crossfade != timeline.crossfade:
+            timeline.crossfade = crossfade
+            timeline.save()
+        frames = list_frames(foldername)
+        if frames:
+            # One frame at a time: its duration and its crossfade into the next frame
+            frame = st.selectbox("Frame", frames, format_func=os.path.basename)
+            st.image(frame, width=160)
+            duration, frame_crossfade = timeline.timing(os.path.basename(frame), fps)
+            duration = st.number_input("Show this frame for (seconds):", 0.05, 600.0, float(duration), 0.5)
+            frame_crossfade = st.number_input("Crossfade into the next frame (seconds):", 0.0, 600.0,
+                                              float(frame_crossfade), 0.1)
+            if st.button("Apply to this frame"):
+                timeline.set(os.path.basename(frame), duration, min(frame_crossfade, duration))
+            if st.button("Reset all the frames' timing"):
+                timeline.frames = {}
+                timeline.save()
+        st.write("---------")
+    return timeline.customized
+
 
 def create_movie():
     """
@@ -452,8 +446,8 @@ def create_movie():
     :return:
     """
     st.title("Create The Movie")
-    files = sort_files('files/')
-    total_frames = np.sum([True if file.split(".")[-1]=='jpg' else False for file in files])
+    ws = workspace()
+    total_frames = len(list_frames(ws.files))
     st.sidebar.write("Total frames detected: %s"%total_frames)
 
     with_subtitles = st.checkbox("Enable Subtitles")
@@ -465,11 +459,14 @@ def create_movie():
         # Allow him to choose to create subtitles or import them
         option = st.radio("",["Write your subtitles","Upload subtitles"])
         if option == "Upload subtitles":
-            # Upload txt file
-            txt = st.file_uploader("Upload", type=["txt"])
+            # Upload txt file (a line per equal slice of the movie) or srt file (timed subtitles)
+            st.write("A txt file's lines split the movie equally, a srt file's subtitles keep their own timing.")
+            txt = st.file_uploader("Upload", type=["txt","srt"])
             if txt:
                 subtitles = txt.read()
                 if subtitles: # if it was read successfully
+                    save_subtitles(subtitles.decode('utf-8-sig'), timed=txt.name.lower().endswith('.srt'),
+                                   foldername=ws.files)
                     subtitles_selected = True # subtitles loaded successfully
                     st.success("Subtitles were loaded successfully")
         elif option == "Write your subtitles":
@@ -478,8 +475,7 @@ def create_movie():
             subtitles = st.text_area("Write the subtitles here:")
             if subtitles:
                 # Write the subtitles hard-coded to the file subtitles.txt
-                with open('files/subtitles.txt','w', encoding='utf-8') as f: #
-                    f.write(str(subtitles))
+                save_subtitles(str(subtitles), foldername=ws.files)
                 subtitles_selected = True # subtitles loaded successfully
                 st.success("Subtitles were loaded successfully")
         st.write("---------")
@@ -487,6 +483,7 @@ def create_movie():
     # If the user has chosen to add audio to the movie
     with_audio = st.checkbox("Enable Audio")
     audio_selected = False
+    audio_crossfade = 0.0
 
     if with_audio:
         st.write("---------")
@@ -496,8 +493,7 @@ def create_movie():
             # Receive the mp3 file from the user
             audio_file = st.file_uploader("Upload", type=["mp3"])
             if audio_file:
-                with open('files/audio.mp3','wb') as f:
-                    f.write(audio_file.getbuffer()) # write it in the processed files directory
+                save_input('audio', audio_file.getvalue(), ws.file('audio.mp3')) # in the processed files directory
                 audio_selected = True # Audio imported successfully
                 st.success("Audio was imported successfully")
         elif select_action == "Extract from Youtube video":
@@ -509,17 +505,49 @@ def create_movie():
             if process_button:
                 # check if the youtube link is correct
                 if youtube_link[:32] == 'https://www.youtube.com/watch?v=' and len(youtube_link)==43:
-                    download_audio_from_youtube(youtube_link)
+                    download_audio_from_youtube(youtube_link, ws.files)
                     audio_selected = True
                 else: # if it's not correct, let the user know
                     st.error("Invalid youtube link, please try again")
+        # Allow the user to smooth the point where a short soundtrack starts over
+        audio_crossfade = st.slider("Crossfade when the soundtrack loops (seconds):",0.0,5.0,0.0,0.5)
         st.write("---------")
 
     # Allow the user to choose the frame rate
     fps = st.slider("Frames per second:",0.5,20.0,3.0,0.5)
-
-    if st.button("Start!"):
-        if total_frames > 0:
+    # The frames' own durations and crossfades
+    custom_timing = edit_timeline(ws.files, fps)
+
+    # Single-pass rendering streams the frames into one encode, incremental rendering only encodes again the parts
+    # of the movie that changed since the last render; the two-stage rendering is kept as a fallback
+    if custom_timing: # only the incremental rendering follows the frames' timing, the other options would ignore it
+        st.info("The movie is rendered incrementally while the frames' timing is customized - reset the timing "
+                "for the other rendering options")
+        single_pass = incremental = True
+    else:
+        single_pass = st.checkbox("Fast single-pass rendering", value=True)
+        incremental = single_pass and st.checkbox("Incremental rendering (only re-encode what changed)", value=True)
+    # Ken Burns pan/zoom and crossfades between the frames, made by the single-pass rendering in the render job's worker
+    # process - the job queue's workers already run the users' jobs on all the cores
+    effects = None
+    if single_pass and not custom_timing and st.checkbox("Pan/zoom the frames and crossfade between them"):
+        zoom = st.slider("Zoom:",1.0,1.5,DEFAULT_EFFECTS.zoom,0.05)
+        transition = st.slider("Crossfade between the frames (seconds):",0.0,2.0,DEFAULT_EFFECTS.crossfade,0.1)
+        effects = DEFAULT_EFFECTS._replace(zoom=zoom, crossfade=transition)
+        if incremental:
+            st.info("The pan/zoom is made by the single-pass rendering - the movie will be fully rendered")
+    # Smaller copies of the movie (for phones, slow connections and thumbnails), encoded along with it
+    renditions = st.multiselect("Also create (only the sizes smaller than the movie are made):",
+                                ["1080p","720p","480p","thumbnail"], ["480p","thumbnail"])
+
+    # A quick low-resolution draft for checking the timing, subtitles and audio, then the final movie - both rendered
+    # by the same code
+    draft = st.button("Quick draft (low resolution, renders in seconds)")
+    final = st.button("Start!")
+    if draft or final:
+        if job_running('render_job'): # one movie at a time per session
+            st.warning("The movie is already being created, please wait.")
+        elif total_frames > 0:
             # if subtitles or audio are selected, ensure we have the info for processing them
             if with_audio and not audio_selected:
                 st.error("You have chosen to include audio, but haven't included any. Please try again")
@@ -527,24 +555,59 @@ def create_movie():
             if with_subtitles and not subtitles_selected:
                 st.error("You have chosen to include subtitles, but haven't included any. Please try again.")
                 st.stop()
-            with st.spinner("Creating raw movie..."):
-                make_seret(fps=fps)
-                st.success("Raw movie created successfully!")
-            with st.spinner("Creating final movie..."):
-                make_movie(WITH_SUBTITLES=with_subtitles,WITH_AUDIO=with_audio)
-                st.success("The movie has been created successfully!")
+            # Create the movie in the background; the two-stage rendering is the single-pass rendering's fallback
+            st.session_state.render_quality = 'draft' if draft else 'final'
+            inputs = snapshot_inputs(ws.files, with_subtitles, with_audio)
+            st.session_state.render_job = job_queue().submit('render', render_job, ws.files, fps, single_pass,
+                                                             incremental, st.session_state.render_quality,
+                                                             WITH_SUBTITLES=with_subtitles, WITH_AUDIO=with_audio,
+                                                             audio_crossfade=audio_crossfade, renditions=renditions,
+                                                             effects=effects, **inputs)
         else: # no frames were detected!
             st.warning("0 Frames were detected. Please process some pictures before using this screen!")
 
+    # Show the progress of the movie's creation, and its result once it's done
+    status = show_job('render_job')
+    if status is not None and status['status'] == DONE:
+        st.success(status['result'])
+        if st.session_state.get('render_quality') == 'draft' and os.path.isfile(ws.file('draft_movie.mp4')):
+            st.video(ws.file('draft_movie.mp4'))
+
 def watch_movie():
     """
     The watch movie page. Allows the user to watch the just created movie.
     :return:
     """
-    if os.path.isfile('files/final_movie.mp4'): # if the file exists
-        with open('files/final_movie.mp4', 'rb') as f:
-            video_data = f.read()
-        st.video(video_data)
+    movie = workspace().file('final_movie.mp4')
+    if os.path.isfile(movie): # if the file exists
+        # The low-resolution preview and the poster are made once per movie (normally by the render job)
+        paths = cached_preview(movie)
+        if paths is None:
+            with st.spinner("Preparing the preview..."):
+                try:
+                    paths = make_preview(movie)
+                except FFmpegError:
+                    pass
+        # The renditions made along with the movie, smallest first, then the movie itself
+        versions = {}
+        if paths is not None:
+            preview, poster = paths
+            versions["Preview"] = preview
+        renditions = available_renditions(movie)
+        for rendition, path in reversed(renditions):
+            if rendition.format == 'mp4':
+                versions[rendition.name] = path
+        versions["Full quality"] = movie
+        thumbnails = [path for rendition, path in renditions if rendition.format == 'gif']
+        if thumbnails or paths is not None:
+            st.sidebar.image(thumbnails[0] if thumbnails else poster)
+        st.sidebar.write("Movie size: %.1f MB"%(os.path.getsize(movie)/1024**2))
+        # The largest rendition up to 720p plays well almost anywhere, otherwise the preview
+        names = list(versions)
+        default = max([names.index(name) for name in ("480p","720p") if name in versions] or [0])
+        version = st.sidebar.selectbox("Quality", names, index=default)
+        # streamlit loads the video file it's given, so only the chosen version is loaded
+        st.video(versions[version])
     else: # if the file doesn't exist, let the user know
         st.header("You haven't created a movie yet!")
 
@@ -571,6 +634,30 @@ def homepage():
     st.write("4. Watch your movie and enjoy!")
 
 
+def show_metrics():
+    """
+    Show the last run's stages in the sidebar: wall/CPU time, bytes read/written, frames and peak memory
+    :return:
+    """
+    stages = tracing.last_run()
+    if not stages:
+        st.sidebar.write("Nothing was measured yet")
+        return
+    st.sidebar.subheader("Last run: %s"%stages[0]['run_name'])
+    for record in stages:
+        lines = ["**%s**%s"%(record['stage'], "" if record['status']=='ok' else " (failed)"),
+                 "Wall %.2f s, CPU %.2f s"%(record['wall_seconds'],record['cpu_seconds'])]
+        if record.get('children_cpu_seconds'): # ffmpeg
+            lines.append("Child processes' CPU %.2f s"%record['children_cpu_seconds'])
+        if record.get('frames') is not None:
+            lines.append("Frames: %s"%record['frames'])
+        if record.get('bytes_read') is not None:
+            lines.append("Read %.1f MB, written %.1f MB"%(record['bytes_read']/1024**2,record['bytes_written']/1024**2))
+        if record.get('peak_rss_bytes') is not None:
+            lines.append("Peak memory: %.0f MB"%(record['peak_rss_bytes']/1024**2))
+        st.sidebar.markdown("  \n".join(lines))
+
+
 ###############################################################################################
 #################### MAIN PROGRAM
 ###############################################################################################
@@ -593,5 +680,11 @@ def main():
     elif option=="Watch Your Movie":
         watch_movie()
 
-# Start the app!
-main()
\ No newline at end of file
+    # The stages' measurements of the last run (render, GauGAN processing, upload...) on this server
+    st.sidebar.write("------------------------------")
+    if st.sidebar.checkbox("Show the last run's metrics"):
+        show_metrics()
+
+# Start the app! (streamlit runs this script as __main__)
+if __name__ == "__main__":
+    main()
\ No newline at end of file
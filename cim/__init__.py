@@ -0,0 +1,4 @@
+"""
+YourMovie backend package.
+Holds the heavy-lifting engines that CIM_project.py (the streamlit front end) relies on.
+"""
@@ -0,0 +1,280 @@
+######################### PROJECT CIM - command line interface
+######################### Renders movies without streamlit, e.g. from cron or batch jobs:
+#########################     python -m cim render --frames DIR --fps 3 --subtitles subs.srt --audio a.mp3
+#########################     python -m cim startup
+#########################     python -m cim bench --frames 10 50 --sizes 512 1080 --output benchmark.json
+#########################     python -m cim detector --corpus responses/
+#########################     python -m cim youtube https://www.youtube.com/watch?v=... --output audio.mp3
+
+import time
+_START = time.perf_counter() # the CLI's own cold start is measured from here
+
+import argparse
+import contextlib
+import functools
+import os
+import subprocess
+import sys
+
+
+def _progress(description: str):
+    """
+    :return: a tqdm progress reporter if tqdm is installed, else no progress reporting
+    """
+    try:
+        from tqdm import tqdm
+    except ImportError:
+        from cim.pipeline import no_progress
+        return no_progress
+    return lambda iterable, total=None: tqdm(iterable, total=total, desc=description, file=sys.stderr)
+
+
+def render(args) -> int:
+    """
+    The render command: optionally process drawings in GauGAN, then create the movie
+    :param args: the parsed command line arguments
+    :return: exit code
+    """
+    from cim import pipeline, tracing
+    from cim.encoder import FFmpegError, DRAFT, FINAL
+    from cim.preview import make_preview, encode_renditions
+    from cim.timeline import Timeline
+
+    if args.draft and args.renditions: # the renditions are encoded from the final movie's frames
+        print("--renditions can't be used with --draft", file=sys.stderr)
+        return 1
+    # The stages of the render are logged together, and the worker pool is shut down once the render is over
+    with tracing.run('render'), contextlib.ExitStack() as cleanup:
+        if args.drawings:
+            styles = args.styles or [1]
+            success, failure = pipeline.make_nature({style: style for style in styles}, args.drawings, args.frames,
+                                                    styles, max_workers=args.workers, progress=_progress("GauGAN"))
+            print("%s files were processed successfully, %s failed" % (success, failure))
+
+        total_frames = len(pipeline.list_frames(args.frames))
+        if total_frames == 0:
+            print("0 frames were detected in %s" % args.frames, file=sys.stderr)
+            return 1
+
+        options = dict(WITH_SUBTITLES=args.subtitles is not None, WITH_AUDIO=args.audio is not None,
+                       audio_crossfade=args.crossfade, subtitles_file=args.subtitles, audio_file=args.audio,
+                       output_file=args.output)
+        renditions = args.renditions or []
+        if args.effects: # Ken Burns pan/zoom and crossfades, made by the single-pass rendering
+            from cim.effects import DEFAULT_EFFECTS
+            options['effects'] = DEFAULT_EFFECTS._replace(zoom=args.zoom, pan=args.pan, crossfade=args.transition)
+            args.incremental = args.two_stage = False
+        start = time.perf_counter()
+        render_movie = pipeline.make_movie_single_pass
+        if args.incremental: # the frames' timeline is only followed by the incremental rendering
+            render_movie = functools.partial(pipeline.make_movie_segmented, frame_crossfade=args.frame_crossfade)
+        if args.effects: # the frame effects are rendered on all the cores
+            from cim.pools import discard_pool, worker_pool
+            effects_pool = worker_pool(os.cpu_count() or 1)
+            cleanup.callback(discard_pool, effects_pool, wait=True)
+            render_movie = functools.partial(render_movie, effects_pool=effects_pool)
+        custom_timing = Timeline(args.frames).customized or bool(args.frame_crossfade)
+        timing_ignored = "The frames' timing was ignored - it's followed by the incremental rendering only."
+        if args.draft: # the same rendering, smaller and faster - and without the full-quality two-stage fallback
+            render_movie(args.frames, args.fps, quality=DRAFT, **options)
+            if custom_timing and not args.incremental:
+                print(timing_ignored, file=sys.stderr)
+            movie = args.output or os.path.join(args.frames, '%s_movie.mp4' % DRAFT.name)
+            print("%s frames rendered to %s in %.2f seconds" % (total_frames, movie, time.perf_counter() - start))
+            return 0
+        single_pass = not args.two_stage
+        if single_pass:
+            try:
+                render_movie(args.frames, args.fps, renditions=renditions, **options)
+            except FFmpegError as e: # fall back to the two-stage rendering
+                print("Single-pass rendering failed, falling back to the two-stage rendering. (%s)" % e,
+                      file=sys.stderr)
+                single_pass = args.incremental = False
+        if custom_timing and not args.incremental:
+            print(timing_ignored, file=sys.stderr)
+        if not single_pass:
+            pipeline.make_seret(args.frames, fps=args.fps)
+            options.pop('effects', None) # the two-stage rendering makes a slideshow of still frames
+            pipeline.make_movie(args.frames, **options)
+        movie = args.output or os.path.join(args.frames, '%s_movie.mp4' % FINAL.name)
+        if not single_pass and renditions: # the two-stage rendering can't feed the renditions
+            encode_renditions(movie, renditions)
+        print("%s frames rendered to %s in %.2f seconds" % (total_frames, movie, time.perf_counter() - start))
+        # The preview and poster the app plays instead of the full movie
+        try:
+            make_preview(movie)
+        except FFmpegError as e:
+            print("The preview couldn't be created. (%s)" % e, file=sys.stderr)
+    return 0
+
+
+def _time_command(command: list, cwd=None) -> float:
+    start = time.perf_counter()
+    subprocess.run(command, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def startup(args) -> int:
+    """
+    The startup command: measure the cold start of the CLI and of the streamlit app, each in a fresh interpreter
+    :param args: the parsed command line arguments
+    :return: exit code
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    measurements = [("CLI (python -m cim --help)", [sys.executable, '-m', 'cim', '--help']),
+                    ("UI (import CIM_project)", [sys.executable, '-c', 'import CIM_project'])]
+    for name, command in measurements:
+        try:
+            times = [_time_command(command, cwd=root) for _ in range(args.repeat)]
+            print("%s: best %.3f s, worst %.3f s" % (name, min(times), max(times)))
+        except (subprocess.CalledProcessError, OSError):
+            print("%s: failed to start" % name)
+    return 0
+
+
+def bench(args) -> int:
+    """
+    The bench command: run the end-to-end benchmark with the local GauGAN stub
+    :param args: the parsed command line arguments
+    :return: exit code
+    """
+    from cim import benchmark
+    report = benchmark.run(args.frames, args.sizes, args.latency, seed=args.seed)
+    benchmark.write_report(report, args.output)
+    return 0
+
+
+def detector(args) -> int:
+    """
+    The detector command: check the GauGAN failure detector on a corpus of good and bad responses
+    :param args: the parsed command line arguments
+    :return: exit code - 1 if any response was misclassified
+    """
+    from cim import failure_detection
+    if args.corpus:
+        corpus = failure_detection.directory_corpus(args.corpus)
+    else:
+        corpus = failure_detection.synthetic_corpus(args.samples, args.seed)
+    if args.save: # keep the corpus, e.g. to add real GauGAN responses to it
+        for name, image, failed in corpus:
+            path = os.path.join(args.save, 'bad' if failed else 'good', os.path.basename(name))
+            if not os.path.splitext(path)[1]:
+                path += '.jpg'
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as f:
+                f.write(image)
+    start = time.perf_counter()
+    result = failure_detection.evaluate(failure_detection.FailureDetector(), corpus)
+    elapsed = time.perf_counter() - start
+    print("%s responses: %s failures and %s photos detected correctly, %s photos taken for failures, "
+          "%s failures missed (%.2f ms per response)" % (len(corpus), result['true_failures'], result['true_photos'],
+          result['false_failures'], result['missed_failures'], 1000 * elapsed / max(1, len(corpus))))
+    for name, distance in result['misclassified']:
+        print("  %s: distance %s" % (name, distance))
+    return 1 if result['misclassified'] else 0
+
+
+def youtube(args) -> int:
+    """
+    The youtube command: save a YouTube video's soundtrack as mp3, through the soundtracks' cache
+    :param args: the parsed command line arguments
+    :return: exit code
+    """
+    from cim import tracing
+    from cim.youtube_audio import YouTubeAudioCache
+    opener = None
+    if args.offline: # generated soundtracks instead of YouTube's
+        from cim.youtube_stub import StubYouTube
+        opener = StubYouTube().open
+    cache = YouTubeAudioCache(args.cache, max_bytes=args.max_mb * 1024 ** 2, opener=opener)
+    start = time.perf_counter()
+    try:
+        with tracing.stage('download_audio_from_youtube'):
+            downloaded = cache.fetch(args.link, args.output)
+            tracing.annotate(bytes_downloaded=downloaded, cached=downloaded == 0)
+    except ValueError as e: # not a video link, or a video without audio
+        print(e, file=sys.stderr)
+        return 1
+    print("%s saved in %.2f seconds, %s" % (args.output, time.perf_counter() - start,
+                                           "%s bytes downloaded" % downloaded if downloaded else "from the cache"))
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m cim', description="YourMovie - make movies without streamlit")
+    parser.add_argument('--timing', action='store_true', help="report the CLI's startup time")
+    parser.add_argument('--metrics', help="directory of the stages' metrics (JSON lines log and Prometheus "
+                                          "textfile), 'none' to disable them. $CIM_METRICS_DIR or metrics/ by default")
+    commands = parser.add_subparsers(dest='command')
+
+    render_parser = commands.add_parser('render', help="create a movie from a directory of frames")
+    render_parser.add_argument('--frames', required=True, help="directory of the jpg frames (and of the movie)")
+    render_parser.add_argument('--fps', type=float, default=3.0, help="frames per second")
+    render_parser.add_argument('--subtitles', help="subtitles file - srt (timed) or txt (a line per equal slice)")
+    render_parser.add_argument('--audio', help="soundtrack file, looped if it's shorter than the movie")
+    render_parser.add_argument('--crossfade', type=float, default=0.0, help="soundtrack crossfade at loop points (s)")
+    render_parser.add_argument('--output', help="movie path, FRAMES/final_movie.mp4 by default")
+    render_parser.add_argument('--two-stage', action='store_true', help="use the AVI + moviepy rendering")
+    render_parser.add_argument('--incremental', action='store_true', help="only re-encode the segments of the "
+                                                                         "movie that changed since the last render")
+    render_parser.add_argument('--renditions', nargs='+', help="smaller renditions of the movie, encoded along with "
+                                                               "it - 1080p, 720p, 480p and/or thumbnail (gif), not with --draft")
+    render_parser.add_argument('--effects', action='store_true', help="pan/zoom the frames and crossfade between "
+                                                                      "them (single-pass rendering)")
+    render_parser.add_argument('--zoom', type=float, default=1.15, help="the frames' zoom with --effects")
+    render_parser.add_argument('--pan', type=float, default=0.05, help="the frames' pan with --effects (fraction "
+                                                                       "of the frame)")
+    render_parser.add_argument('--transition', type=float, default=0.5, help="crossfade between the frames with "
+                                                                             "--effects (s)")
+    render_parser.add_argument('--draft', action='store_true', help="render a quick low-resolution draft "
+                                                                    "(FRAMES/draft_movie.mp4 by default)")
+    render_parser.add_argument('--frame-crossfade', type=float, help="crossfade between the frames (s), overrides "
+                                                                     "the frames' timeline - with --incremental")
+    render_parser.add_argument('--drawings', help="process the drawings of this directory in GauGAN first")
+    render_parser.add_argument('--styles', type=int, nargs='+', help="GauGAN style numbers (1-10)")
+    render_parser.add_argument('--workers', type=int, default=4, help="parallel GauGAN requests")
+    render_parser.set_defaults(func=render)
+
+    startup_parser = commands.add_parser('startup', help="measure the cold start of the CLI and the app")
+    startup_parser.add_argument('--repeat', type=int, default=3, help="number of measurements")
+    startup_parser.set_defaults(func=startup)
+
+    bench_parser = commands.add_parser('bench', help="benchmark every pipeline stage on synthetic inputs")
+    bench_parser.add_argument('--frames', type=int, nargs='+', default=[10, 50], help="frame counts")
+    bench_parser.add_argument('--sizes', type=int, nargs='+', default=[512], help="frame sizes (height and width)")
+    bench_parser.add_argument('--latency', type=float, default=0.05, help="GauGAN stub latency per request (s)")
+    bench_parser.add_argument('--seed', type=int, default=0, help="random seed of the synthetic inputs")
+    bench_parser.add_argument('--output', help="JSON results file, printed if not given")
+    bench_parser.set_defaults(func=bench)
+
+    detector_parser = commands.add_parser('detector', help="check the GauGAN failure detector on a corpus")
+    detector_parser.add_argument('--corpus', help="corpus directory, with bad/ and good/ responses; "
+                                                  "a synthetic corpus by default")
+    detector_parser.add_argument('--samples', type=int, default=20, help="synthetic responses of each kind")
+    detector_parser.add_argument('--seed', type=int, default=0, help="random seed of the synthetic corpus")
+    detector_parser.add_argument('--save', help="save the corpus into this directory (bad/ and good/)")
+    detector_parser.set_defaults(func=detector)
+
+    youtube_parser = commands.add_parser('youtube', help="save a YouTube video's soundtrack as mp3")
+    youtube_parser.add_argument('link', help="the YouTube video link")
+    youtube_parser.add_argument('--output', default='audio.mp3', help="mp3 path")
+    youtube_parser.add_argument('--cache', default='youtube_audio_cache', help="soundtracks' cache directory")
+    youtube_parser.add_argument('--max-mb', type=int, default=200, help="maximum size of the cache (MB)")
+    youtube_parser.add_argument('--offline', action='store_true', help="use a local stand-in for YouTube")
+    youtube_parser.set_defaults(func=youtube)
+
+    args = parser.parse_args(argv)
+    if args.timing:
+        print("Started in %.3f seconds" % (time.perf_counter() - _START), file=sys.stderr)
+    if args.command is None:
+        parser.print_help()
+        return 0
+    if args.metrics:
+        from cim import tracing
+        tracing.configure(None if args.metrics.lower() == 'none' else args.metrics)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
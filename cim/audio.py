@@ -0,0 +1,90 @@
+######################### PROJECT CIM - soundtrack bed
+######################### Decodes the soundtrack once, then loops and trims it to the movie's duration
+
+import subprocess
+import wave
+import numpy as np
+
+from cim.encoder import ffmpeg_binary
+
+
+def decode_audio(path: str, fps=44100, nchannels=2, ffmpeg=None) -> np.array:
+    """
+    Decode an audio file into memory with a single ffmpeg process
+    :param path: the audio file (e.g. mp3)
+    :param fps: sample rate of the decoded audio
+    :param nchannels: number of channels of the decoded audio
+    :param ffmpeg: the ffmpeg executable, None to use the one moviepy uses
+    :return: float32 numpy array of samples between -1 and 1 with the dimensions n_samples x nchannels
+    """
+    command = [ffmpeg or ffmpeg_binary(), '-loglevel', 'error', '-i', path, '-vn',
+               '-f', 'f32le', '-acodec', 'pcm_f32le', '-ar', str(fps), '-ac', str(nchannels), '-']
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise IOError("ffmpeg failed to decode %s: %s" % (path, result.stderr.decode(errors='replace').strip()))
+    return np.frombuffer(result.stdout, np.float32).reshape(-1, nchannels)
+
+
+def loop_audio(samples: np.array, n_samples: int, crossfade=0) -> np.array:
+    """
+    Tile the samples until they last n_samples, then trim them.
+    :param samples: numpy array with the dimensions n x nchannels
+    :param n_samples: the wanted length, in samples
+    :param crossfade: number of samples each loop overlaps the previous one, fading out the end while fading in the start
+    :return: numpy array with the dimensions n_samples x nchannels
+    """
+    length = len(samples)
+    if length == 0:
+        return np.zeros((n_samples,) + samples.shape[1:], np.float32)
+    crossfade = min(int(crossfade), length // 2)
+    if n_samples <= length:
+        return samples[:n_samples]
+    if crossfade == 0:
+        repeats = int(np.ceil(n_samples / length))
+        return np.tile(samples, (repeats, 1))[:n_samples]
+
+    step = length - crossfade
+    repeats = int(np.ceil((n_samples - crossfade) / step))
+    ramp = np.linspace(0, 1, crossfade, dtype=np.float32)[:, None]
+    # Overlap-add the loops, each fading in over the previous loop's fading out end
+    faded = np.array(samples, np.float32)
+    faded[:crossfade] *= ramp
+    faded[-crossfade:] *= ramp[::-1]
+    bed = np.zeros((repeats * step + crossfade,) + samples.shape[1:], np.float32)
+    for i in range(repeats):
+        bed[i * step:i * step + length] += faded
+    # The movie starts with the first loop's original beginning (no fade in), and the last loop keeps its original
+    # end (no fade out) - the movie may end during it
+    bed[:crossfade] = samples[:crossfade]
+    bed[-crossfade:] = samples[-crossfade:]
+    return bed[:n_samples]
+
+
+def build_audio_bed(path: str, duration: float, fps=44100, crossfade=0.0, nchannels=2) -> np.array:
+    """
+    Build the movie's soundtrack: the audio file is decoded once, then looped and trimmed to the movie's duration.
+    :param path: the audio file (e.g. mp3)
+    :param duration: the movie's duration in seconds
+    :param fps: sample rate
+    :param crossfade: crossfade duration in seconds at every loop point, 0 for none
+    :param nchannels: number of channels
+    :return: float32 numpy array with the dimensions n_samples x nchannels
+    """
+    samples = decode_audio(path, fps, nchannels)
+    return loop_audio(samples, int(round(duration * fps)), int(round(crossfade * fps)))
+
+
+def write_wav(samples: np.array, path: str, fps=44100):
+    """
+    Save samples as a 16 bit PCM wav file
+    :param samples: float numpy array with the dimensions n_samples x nchannels, values between -1 and 1
+    :param path: the wav file path
+    :param fps: sample rate
+    :return:
+    """
+    pcm = (np.clip(samples, -1, 1) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(pcm.shape[1])
+        f.setsampwidth(2)
+        f.setframerate(fps)
+        f.writeframes(pcm.tobytes())
@@ -0,0 +1,198 @@
+######################### PROJECT CIM - end-to-end benchmark
+######################### Times and memory-profiles every stage of the movie pipeline on synthetic inputs,
+######################### with a local GauGAN stub instead of the network, and emits the results as JSON
+
+import datetime
+import json
+import os
+import pickle
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+from cim import pipeline, tracing
+from cim.audio import write_wav
+from cim.compositing import make_background
+from cim.effects import DEFAULT_EFFECTS
+from cim.frame_store import DIRECTORY as FRAME_STORE
+from cim.gaugan_stub import StubGauGAN
+from cim.palette import LabelPalette
+from cim.pools import discard_pool, worker_pool
+from cim.synthetic import synthetic_drawing, synthetic_photo
+
+
+COLORS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'colors.p')
+
+
+def _children_cpu() -> float:
+    # CPU time of the child processes that finished (ffmpeg, the worker pools' processes once shut down)
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def measure(name: str, func, *args, reset=None, **kwargs) -> dict:
+    """
+    Run one stage twice and measure it: the first run is timed, the second one measures the peak Python memory -
+    tracing every allocation would slow the timed run down
+    :param name: the stage's name
+    :param func: the stage's function
+    :param reset: called between the two runs to put the stage's inputs back as they were, e.g. to remove what the
+                  first run cached, None if running the stage again does the same work
+    :return: dictionary with the stage's wall time, CPU time (the process' and its child processes'), peak Python
+             memory (tracemalloc) and the process' peak RSS since it started, or its error
+    """
+    result = {'stage': name}
+    children = _children_cpu() if resource is not None else None
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        func(*args, **kwargs)
+    except Exception as e: # e.g. moviepy isn't installed - record it and go on with the other stages
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+    result['wall_seconds'] = time.perf_counter() - wall
+    result['cpu_seconds'] = time.process_time() - cpu
+    if resource is not None:
+        result['children_cpu_seconds'] = _children_cpu() - children
+        # ru_maxrss is the process' peak RSS since it started, over all the stages so far (in kilobytes on Linux)
+        result['cumulative_peak_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    if 'error' in result:
+        return result
+    if reset is not None:
+        reset()
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+    except Exception as e:
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+    finally:
+        tracemalloc.stop()
+    return result
+
+
+def run_case(directory: str, frames: int, size: int, with_audio: bool, with_subtitles: bool, latency: float,
+             colors: dict, seed=0) -> list:
+    """
+    Run the whole pipeline once on synthetic inputs
+    :param directory: an empty working directory
+    :param frames: number of frames (drawings and photos)
+    :param size: frames' height and width
+    :param with_audio: include a (looped) soundtrack
+    :param with_subtitles: include subtitles
+    :param latency: the GauGAN stub's latency per request, in seconds
+    :param colors: GauGAN colors dictionary
+    :param seed: random seed of the synthetic inputs
+    :return: list of the stages' measurements
+    """
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    drawings, files, uploads = (os.path.join(directory, name) for name in ('tmp', 'files', 'uploads'))
+    for path in (drawings, files, uploads):
+        os.makedirs(path)
+    case = {'frames': frames, 'size': size, 'audio': with_audio, 'subtitles': with_subtitles, 'latency': latency}
+    results = []
+
+    # draw(): composite the canvas background under every drawing, snap it to the palette and save it
+    background = make_background(colors, size, size)
+    palette = LabelPalette(colors)
+    canvases = [synthetic_drawing(colors, size, rng) for _ in range(frames)]
+
+    def draw_stage():
+        for i, canvas in enumerate(canvases):
+            pipeline.save_drawing(canvas, background, palette, os.path.join(drawings, 'pic%s.png' % i))
+    results.append(measure('draw', draw_stage))
+
+    # save_uploadedfiles(): resize and save uploaded photos as frames
+    photos = []
+    for i in range(frames):
+        photos.append(os.path.join(uploads, '%s.jpg' % i))
+        Image.fromarray(synthetic_photo(size, rng)).save(photos[-1], quality=95)
+    results.append(measure('save_uploadedfiles', pipeline.save_uploaded_images, photos, files, process=False))
+
+    # make_nature(): process the drawings with the GauGAN stub
+    results.append(measure('make_nature', pipeline.make_nature, {1: 1}, drawings, files, [1],
+                           backend=StubGauGAN(latency=latency, seed=seed)))
+
+    # The soundtrack is shorter than the movie, so it has to be looped
+    options = dict(WITH_AUDIO=with_audio, WITH_SUBTITLES=with_subtitles)
+    if with_audio:
+        write_wav(np.sin(np.linspace(0, 2000, 44100, dtype=np.float32))[:, None].repeat(2, axis=1) * 0.5,
+                  os.path.join(files, 'audio.wav'))
+        options['audio_file'] = os.path.join(files, 'audio.wav')
+    if with_subtitles:
+        with open(os.path.join(files, 'subtitles.txt'), 'w', encoding='utf8') as f:
+            f.write('\n'.join('Subtitle line %s' % i for i in range(max(1, frames // 5))))
+
+    # The first render decodes the frames and keeps them in the frame store, the memory run does it again
+    results.append(measure('make_movie_single_pass', pipeline.make_movie_single_pass, files, 5,
+                           reset=lambda: shutil.rmtree(os.path.join(files, FRAME_STORE), ignore_errors=True),
+                           **options))
+
+    # The frame-effects stage renders 25 frames per second of movie on all the cores (see the report's cpus). The
+    # pool is shut down at the end of the stage, so its workers' CPU time is counted with the child processes'.
+    def effects_stage():
+        pool = worker_pool(os.cpu_count() or 1)
+        try:
+            pipeline.make_movie_single_pass(files, 5, effects=DEFAULT_EFFECTS, effects_pool=pool, **options)
+        finally:
+            discard_pool(pool, wait=True)
+    results.append(measure('make_movie_effects', effects_stage))
+    results.append(measure('make_seret', pipeline.make_seret, files, 5))
+    results.append(measure('make_movie', pipeline.make_movie, files, **options))
+    for result in results:
+        result.update(case)
+    return results
+
+
+def run(frame_counts=(10, 50), sizes=(512,), latency=0.05, audio_options=(False, True),
+        subtitles_options=(False, True), seed=0) -> dict:
+    """
+    Run the benchmark matrix
+    :param frame_counts: numbers of frames to benchmark
+    :param sizes: frame sizes (height and width) to benchmark
+    :param latency: the GauGAN stub's latency per request, in seconds
+    :param audio_options: with and/or without a soundtrack
+    :param subtitles_options: with and/or without subtitles
+    :param seed: random seed of the synthetic inputs
+    :return: dictionary with the environment and the measurements
+    """
+    with open(COLORS_FILE, 'rb') as f:
+        colors = pickle.load(f)
+    report = {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+              'python': sys.version.split()[0], 'platform': platform.platform(), 'cpus': os.cpu_count(),
+              'results': []}
+    for frames in frame_counts:
+        for size in sizes:
+            for with_audio in audio_options:
+                for with_subtitles in subtitles_options:
+                    directory = tempfile.mkdtemp(prefix='cim_benchmark_')
+                    # The stages' own metrics stay with the case, rather than mixing with the production metrics
+                    metrics = tracing.configure(os.path.join(directory, 'metrics'))
+                    try:
+                        report['results'] += run_case(directory, frames, size, with_audio, with_subtitles, latency,
+                                                      colors, seed)
+                    finally:
+                        tracing.configure(metrics)
+                        shutil.rmtree(directory, ignore_errors=True)
+    return report
+
+
+def write_report(report: dict, path=None):
+    """
+    :param report: the benchmark's report
+    :param path: JSON file path, None to print the report
+    :return:
+    """
+    content = json.dumps(report, indent=2)
+    if path is None:
+        print(content)
+    else:
+        with open(path, 'w') as f:
+            f.write(content)
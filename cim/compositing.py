@@ -0,0 +1,109 @@
+######################### PROJECT CIM - canvas compositing
+######################### Whole-array replacement for the per-pixel background loop of draw()
+
+import time
+import numpy as np
+
+
+# The default GauGAN background: 300 rows of sky above 212 rows of sea (out of 512)
+DEFAULT_LAYOUT = (("Sky", 300), ("Sea", 212))
+
+
+def make_background(colors: dict, height=512, width=512, layout=DEFAULT_LAYOUT) -> np.array:
+    """
+    Build a background made of horizontal bands of GauGAN colors.
+    The bands' heights are relative weights, so the same layout fits any canvas size.
+    :param colors: GauGAN colors dictionary (name -> RGB)
+    :param height: canvas height in pixels
+    :param width: canvas width in pixels
+    :param layout: sequence of (color name or RGB tuple, weight) pairs, from top to bottom
+    :return: numpy array with the dimensions height x width x 3
+    """
+    img = np.zeros((height, width, 3), np.uint8)
+    weights = np.array([weight for _, weight in layout], dtype=float)
+    # Cumulative band boundaries, scaled to the canvas height
+    stops = np.rint(np.cumsum(weights) / weights.sum() * height).astype(int)
+    start = 0
+    for (color, _), stop in zip(layout, stops):
+        img[start:stop] = colors[color] if isinstance(color, str) else color
+        start = stop
+    return img
+
+
+def composite_background(image_data: np.array, background: np.array) -> np.array:
+    """
+    Put the background under the user's drawing.
+    Transparent or black pixels take the background color entirely, and every white (255) channel
+    value is replaced by the matching background channel - exactly what draw() used to do pixel by pixel.
+    :param image_data: the canvas drawing, RGBA (or RGB) with the dimensions HxWx4 (HxWx3)
+    :param background: RGB background with the same height and width as the drawing
+    :return: the composited drawing as a HxWx3 uint8 numpy array
+    """
+    data = np.asarray(image_data).astype(np.uint8)
+    rgb = data[:, :, :3]
+    if background.shape != rgb.shape:
+        raise ValueError("Background shape %s doesn't match the drawing shape %s" % (background.shape, rgb.shape))
+    # Replace white channel values by the background
+    result = np.where(rgb == 255, background, rgb)
+    # Pixels with nothing drawn on them: black, or fully transparent when an alpha channel exists
+    empty = ~rgb.any(axis=2)
+    if data.shape[2] == 4:
+        empty |= data[:, :, 3] == 0
+    result[empty] = background[empty]
+    return result
+
+
+def _composite_background_loop(image_data: np.array, background: np.array) -> np.array:
+    """
+    The original pixel by pixel implementation of draw(), kept as a reference for parity checks.
+    :param image_data: the canvas drawing, RGBA with the dimensions HxWx4
+    :param background: RGB background with the same height and width as the drawing
+    :return: the composited drawing as a HxWx3 uint8 numpy array
+    """
+    add_bg = np.array(np.asarray(image_data).astype(np.uint8)[:, :, :3])
+    for i in range(add_bg.shape[0]):
+        for j in range(add_bg.shape[1]):
+            if list(add_bg[i, j]) != [0, 0, 0]:
+                for k in range(add_bg.shape[2]):
+                    if add_bg[i, j][k] == 255:
+                        add_bg[i, j][k] = background[i, j][k]
+            else:
+                add_bg[i, j] = background[i, j]
+    return add_bg
+
+
+def benchmark(colors: dict, size=512, repeat=5, seed=0) -> dict:
+    """
+    Compare the vectorized compositing with the original loop on a random drawing.
+    :param colors: GauGAN colors dictionary
+    :param size: canvas height and width
+    :param repeat: number of timed runs of the vectorized version
+    :param seed: random seed of the synthetic drawing
+    :return: dictionary with the timings in seconds and whether both outputs are identical
+    """
+    rng = np.random.default_rng(seed)
+    # A synthetic canvas: transparent background, some strokes, white and black pixels
+    palette = np.array(list(colors.values()) + [(255, 255, 255), (0, 0, 0)], np.uint8)
+    drawing = np.zeros((size, size, 4), np.uint8)
+    strokes = rng.random((size, size)) < 0.3
+    drawing[strokes, :3] = palette[rng.integers(len(palette), size=strokes.sum())]
+    drawing[strokes, 3] = 255
+    background = make_background(colors, size, size)
+
+    start = time.perf_counter()
+    expected = _composite_background_loop(drawing, background)
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = composite_background(drawing, background)
+    vectorized_time = (time.perf_counter() - start) / repeat
+
+    return {"size": size, "loop": loop_time, "vectorized": vectorized_time,
+            "speedup": loop_time / vectorized_time, "identical": bool(np.array_equal(expected, result))}
+
+
+if __name__ == "__main__":
+    import pickle
+    with open("colors.p", "rb") as f:
+        print(benchmark(pickle.load(f)))
@@ -0,0 +1,128 @@
+######################### PROJECT CIM - on-disk caches
+######################### Files shared by several processes (the app and its job workers): atomic writes, a lock
+######################### between processes, and size-bounded directories of cached files with LRU eviction
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Hold an exclusive lock on a file, between processes
+    :param path: the lock file's path
+    """
+    with open(path, 'a+b') as f:
+        try:
+            import fcntl
+        except ImportError: # Windows
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            return
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write(path: str, content: bytes):
+    """
+    Write a file at once: readers see the old or the new content, never a half written file. The content is written
+    to a temporary file of its own first, so processes writing the same file at the same time don't mix their writes.
+    :param path: the file's path
+    :param content: the file's content
+    :return:
+    """
+    descriptor, part = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.' + os.path.basename(path),
+                                        suffix='.part')
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            f.write(content)
+        os.replace(part, path)
+    except BaseException:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+
+
+class SizeBoundedCache:
+    """
+    A directory of cached files, one per key. Entries' modification times track their last use, and the least
+    recently used entries are evicted once the cache grows beyond max_bytes.
+    Several processes may use the same directory: an entry removed by another process is simply a miss.
+    """
+
+    def __init__(self, directory: str, extension: str, max_bytes: int):
+        """
+        :param directory: the directory where the cached files are stored
+        :param extension: the cached files' extension, e.g. '.jpg'
+        :param max_bytes: maximum total size of the cached files
+        """
+        self.directory = directory
+        self.extension = extension
+        self.max_bytes = max_bytes
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.extension)
+
+    def _touch(self, path: str) -> bool:
+        """
+        Mark an entry as recently used
+        :return: False if the entry doesn't exist (any more)
+        """
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _entries(self) -> list:
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(self.extension) and not entry.name.startswith('.'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError: # evicted by another process
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError: # removed by another process
+            pass
+
+    def _evict(self, keep=None):
+        """
+        Remove the least recently used entries until the cache fits its size limit
+        :param keep: an entry's path that is never evicted, e.g. the one just stored
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                self._remove(path)
+                total -= size
+
+    def size(self) -> int:
+        """
+        :return: total size of the cached files, in bytes
+        """
+        return sum(size for _, size, _ in self._entries())
+
+    def __len__(self):
+        return len(self._entries())
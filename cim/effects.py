@@ -0,0 +1,153 @@
+######################### PROJECT CIM - frame effects
+######################### Ken Burns pan/zoom and crossfades between the frames, rendered on a pool of worker processes
+######################### between the frame loading and the encoding
+
+import math
+from collections import namedtuple
+import numpy as np
+
+from cim.pools import map_in_order
+
+
+# The effects of a movie: how much the frames zoom (1.15 is 15% closer at the end of the motion), how far they pan
+# (a fraction of the frame's size), the crossfade between consecutive frames (seconds), and the motion's frame rate
+Effects = namedtuple('Effects', ['zoom', 'pan', 'crossfade', 'fps'])
+DEFAULT_EFFECTS = Effects(zoom=1.15, pan=0.05, crossfade=0.5, fps=25)
+
+# Golden angle - consecutive frames pan in well spread directions
+_GOLDEN_ANGLE = math.pi * (3 - math.sqrt(5))
+
+
+def ken_burns(frame: np.array, index: int, progress: float, effects: Effects) -> np.array:
+    """
+    One moment of a frame's pan/zoom motion. The motion only depends on the frame's position in the movie,
+    so the movie is the same however its frames are split between the workers.
+    :param frame: BGR image
+    :param index: the frame's position in the movie - even frames zoom in, odd frames zoom out
+    :param progress: the moment of the motion, from 0 (the frame appears) to 1 (it's gone)
+    :param effects: Effects
+    :return: the transformed BGR image, of the same size
+    """
+    import cv2
+    height, width = frame.shape[:2]
+    scale = 1 + (effects.zoom - 1) * (progress if index % 2 == 0 else 1 - progress)
+    # The pan stays within the zoomed frame's margin, so no border is ever shown
+    angle = index * _GOLDEN_ANGLE
+    dx = np.clip(effects.pan * width * (progress - 0.5) * math.cos(angle), -(scale - 1) * width / 2,
+                 (scale - 1) * width / 2)
+    dy = np.clip(effects.pan * height * (progress - 0.5) * math.sin(angle), -(scale - 1) * height / 2,
+                 (scale - 1) * height / 2)
+    matrix = np.float32([[scale, 0, (1 - scale) * width / 2 - dx], [0, scale, (1 - scale) * height / 2 - dy]])
+    return cv2.warpAffine(frame, matrix, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+
+
+def render_range(frames: list, first: int, hold: int, fade: int, effects: Effects, last: bool, skip=0,
+                 count=None) -> list:
+    """
+    Render the movie's frames of a range of source frames
+    :param frames: the range's source frames (BGR images), plus the source frame that follows the range (for the
+                   crossfade into it) unless the range ends the movie
+    :param first: the first source frame's position in the movie
+    :param hold: number of movie frames per source frame
+    :param fade: number of movie frames of each crossfade (at the end of a source frame's hold)
+    :param effects: Effects
+    :param last: True if the range ends the movie
+    :param skip: number of the range's first movie frames that aren't rendered (they're another task's)
+    :param count: number of movie frames rendered, None for the rest of the range
+    :return: the movie's frames of the range, in order
+    """
+    import cv2
+    cv2.setNumThreads(1) # the parallelism is across the workers
+    total = (len(frames) if last else len(frames) - 1) * hold
+    span = hold + fade - 1 # a frame's motion includes its crossfade in, during the previous frame's hold
+    output = []
+    for position in range(skip, total if count is None else min(total, skip + count)):
+        i, step = divmod(position, hold)
+        index = first + i
+        start = 0 if index == 0 else fade # where this frame's hold is in its motion
+        image = ken_burns(frames[i], index, (start + step) / max(1, span), effects)
+        into = step - (hold - fade) + 1 # position in the crossfade into the next frame
+        if into > 0 and i + 1 < len(frames):
+            weight = into / (fade + 1)
+            following = ken_burns(frames[i + 1], index + 1, (into - 1) / max(1, span), effects)
+            image = cv2.addWeighted(image, 1 - weight, following, weight, 0)
+        output.append(image)
+    return output
+
+
+class FrameEffects:
+    """
+    The frame-effects stage: turns the movie's source frames into the frames of a smooth movie, each source frame
+    held for several movie frames while it pans and zooms, and crossfading into the next one.
+    The movie is split into tasks of a few movie frames (a long hold is split between several tasks), rendered in
+    parallel on a pool of worker processes. At most max_frames movie frames are in flight at a time, and they're
+    delivered in order - so memory stays bounded however long the frames are held, and the encoder gets the frames
+    as they're ready. The result doesn't depend on the pool or on the tasks' size.
+    Usage:
+        stage = FrameEffects(fps=3, pool=worker_pool(os.cpu_count()))
+        with FFmpegWriter(path, size, stage.fps) as writer:
+            for frame in stage.apply(frames):
+                writer.write(frame)
+    """
+
+    def __init__(self, fps: float, effects=DEFAULT_EFFECTS, frames_per_task=8, pool=None, max_frames=64):
+        """
+        :param fps: the source frames per second - each source frame is shown for 1/fps seconds
+        :param effects: Effects
+        :param frames_per_task: number of movie frames rendered by a worker at a time
+        :param pool: ProcessPoolExecutor rendering the frames (see cim.pools.worker_pool), None to render them in
+                     this process
+        :param max_frames: maximum number of movie frames submitted to the pool and not yet delivered
+        """
+        self.effects = effects
+        # A whole number of movie frames per source frame, so the movie's duration doesn't change
+        self.hold = max(1, int(round(effects.fps / fps)))
+        self.fps = fps * self.hold # the movie's frame rate
+        self.fade = min(self.hold - 1, int(round(effects.crossfade * self.fps)))
+        self.frames_per_task = max(1, frames_per_task)
+        self.pool = pool
+        self.window = max(1, max_frames // self.frames_per_task) # tasks in flight
+
+    def _task(self, batch: list, first: int, start: int, end: int, last: bool) -> tuple:
+        """
+        :param batch: the source frames that arrived and are still needed, from the source frame at position first
+        :param start: the task's first movie frame's position
+        :param end: the position after the task's last movie frame
+        :param last: True if no source frame follows the batch
+        :return: render_range's arguments rendering the movie frames [start, end)
+        """
+        i = start // self.hold # the task's first source frame
+        j = (end - 1) // self.hold + 2 # after the source frame following the task's movie frames
+        return (batch[i - first:j - first], i, self.hold, self.fade, self.effects,
+                last and j - first >= len(batch), start - i * self.hold, end - start)
+
+    def _tasks(self, frames):
+        """
+        :return: generator of render_range's arguments, a task of frames_per_task movie frames (or fewer at the end)
+                 at a time - each along with the source frames it needs
+        """
+        batch, first, position = [], 0, 0 # the source frames still needed, the next task's first movie frame
+        for frame in frames:
+            batch.append(np.asarray(frame))
+            # A task is ready once the source frame following its movie frames (for the crossfade into it) arrived
+            while (position + self.frames_per_task - 1) // self.hold + 1 < first + len(batch):
+                yield self._task(batch, first, position, position + self.frames_per_task, False)
+                position += self.frames_per_task
+                drop = position // self.hold - first # source frames only earlier tasks needed
+                batch, first = batch[drop:], first + drop
+        end = (first + len(batch)) * self.hold # the movie's end
+        while position < end:
+            yield self._task(batch, first, position, min(end, position + self.frames_per_task), True)
+            position += self.frames_per_task
+
+    def apply(self, frames):
+        """
+        :param frames: iterable of the source frames (BGR images of the same size), in order
+        :return: generator of the movie's frames, in order
+        """
+        if self.pool is None:
+            for task in self._tasks(frames):
+                yield from render_range(*task)
+            return
+        for output in map_in_order(render_range, self._tasks(frames), self.pool, self.window):
+            yield from output
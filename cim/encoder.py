@@ -0,0 +1,248 @@
+######################### PROJECT CIM - single-pass streaming encoder
+######################### Raw frames are piped straight into one ffmpeg H.264 encode, along with audio and subtitles
+
+import functools
+import re
+import subprocess
+import tempfile
+from collections import namedtuple
+import numpy as np
+
+
+class FFmpegError(Exception):
+    """
+    Raised when the ffmpeg encoder fails
+    """
+
+
+# How a movie is rendered: the frames' scale, the H.264 settings, and the frame step - every step-th frame is kept and
+# shown step times longer, so the movie's duration (and its subtitles and soundtrack) doesn't change
+RenderQuality = namedtuple('RenderQuality', ['name', 'scale', 'crf', 'preset', 'step'])
+# The final movie, and a quick low-resolution draft for checking the timing, subtitles and soundtrack
+FINAL = RenderQuality('final', 1.0, 23, 'medium', 1)
+DRAFT = RenderQuality('draft', 0.5, 32, 'ultrafast', 2)
+QUALITIES = {quality.name: quality for quality in (FINAL, DRAFT)}
+
+
+def scaled_size(size: tuple, scale: float) -> tuple:
+    """
+    :param size: (width, height)
+    :param scale: scale factor
+    :return: the scaled (width, height), rounded down to even dimensions (needed by yuv420p)
+    """
+    return tuple(max(2, int(dimension * scale) // 2 * 2) for dimension in size)
+
+
+# A rendition of the movie, encoded along with it from the same frames: its height (the width keeps the aspect ratio),
+# its H.264 constant rate factor and its format - 'mp4', or 'gif' for an animated thumbnail
+Rendition = namedtuple('Rendition', ['name', 'height', 'crf', 'format'])
+LADDER = {rendition.name: rendition for rendition in (Rendition('1080p', 1080, 23, 'mp4'),
+                                                      Rendition('720p', 720, 24, 'mp4'),
+                                                      Rendition('480p', 480, 26, 'mp4'),
+                                                      Rendition('thumbnail', 120, None, 'gif'))}
+# The animated thumbnail shows the beginning of the movie: palettegen and paletteuse hold the thumbnail's frames until
+# its palette is made, so they're bounded to a few seconds at a low frame rate
+THUMBNAIL_SECONDS = 10
+THUMBNAIL_FPS = 10
+
+
+def select_renditions(names, height: int) -> list:
+    """
+    :param names: the wanted renditions' names (see LADDER)
+    :param height: the movie's height
+    :return: the renditions smaller than the movie (the movie itself is the largest one), in the ladder's order
+    """
+    return [rendition for name, rendition in LADDER.items() if name in names and rendition.height < height]
+
+
+def rendition_filter(source: str, rendition: Rendition, i: int) -> tuple:
+    """
+    :param source: the filtergraph label of the frames, e.g. '[r0]'
+    :param rendition: the rendition
+    :param i: the rendition's number, keeping its filtergraph labels apart from the other renditions'
+    :return: the filtergraph making the rendition's frames, the label of its output
+    """
+    scale = 'scale=-2:%d:flags=lanczos' % rendition.height
+    if rendition.format == 'gif': # with a palette of the thumbnail's own colors
+        return ('%strim=duration=%d,fps=%d,%s,split[g%da][g%db];[g%da]palettegen[g%dp];[g%db][g%dp]paletteuse[v%d]' %
+                (source, THUMBNAIL_SECONDS, THUMBNAIL_FPS, scale, i, i, i, i, i, i, i)), '[v%d]' % i
+    return '%s%s[v%d]' % (source, scale, i), '[v%d]' % i
+
+
+def rendition_arguments(rendition: Rendition, label: str, path: str, audio_arguments=(), preset='medium') -> list:
+    """
+    :param rendition: the rendition
+    :param label: the filtergraph label of the rendition's frames
+    :param path: the rendition's path
+    :param audio_arguments: the ffmpeg arguments mapping and encoding the soundtrack (mp4 renditions only)
+    :param preset: H.264 encoder preset
+    :return: the ffmpeg output arguments of the rendition
+    """
+    if rendition.format == 'gif':
+        return ['-map', label, '-loop', '0', '-f', 'gif', path]
+    return ['-map', label, '-c:v', 'libx264', '-preset', preset, '-crf', str(rendition.crf), '-pix_fmt', 'yuv420p'] + \
+        list(audio_arguments) + ['-movflags', '+faststart', '-f', 'mp4', path]
+
+
+def ffmpeg_binary() -> str:
+    """
+    :return: the ffmpeg executable - the one moviepy is configured with, or the ffmpeg found in PATH
+    """
+    try:
+        from moviepy.config import get_setting
+        return get_setting("FFMPEG_BINARY")
+    except ImportError:
+        return 'ffmpeg'
+
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_version(ffmpeg: str) -> tuple:
+    """
+    :param ffmpeg: the ffmpeg executable
+    :return: the release's (major, minor) version, None for a development build (or if ffmpeg doesn't run)
+    """
+    try:
+        output = subprocess.run([ffmpeg, '-version'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    except OSError:
+        return None
+    # e.g. 'ffmpeg version 4.4.2-0ubuntu0.22.04.1', 'ffmpeg version n5.1.2' - development builds are 'N-...'
+    match = re.match(r'ffmpeg version n?(\d+)\.(\d+)', output.decode(errors='replace'))
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def vfr_arguments(ffmpeg: str) -> list:
+    """
+    :param ffmpeg: the ffmpeg executable
+    :return: the ffmpeg output arguments keeping the frames' own timestamps (variable frame rate) - -fps_mode
+             replaced -vsync in ffmpeg 5.1
+    """
+    version = ffmpeg_version(ffmpeg)
+    return ['-vsync', 'vfr'] if version is not None and version < (5, 1) else ['-fps_mode', 'vfr']
+
+
+def _filter_path(value: str) -> str:
+    """
+    Escape a filter option value (e.g. the subtitles filter's file name): once for the option parser
+    and once more for the filtergraph parser
+    """
+    value = value.replace('\\', '/')
+    for special in "\\':":
+        value = value.replace(special, '\\' + special)
+    for special in "\\'[],;":
+        value = value.replace(special, '\\' + special)
+    return value
+
+
+class FFmpegWriter:
+    """
+    Encodes a movie in a single pass: BGR frames (as read by cv2) are written to ffmpeg's stdin as raw video,
+    and ffmpeg encodes them as H.264 while muxing the soundtrack and burning in the subtitles.
+    Usage:
+        with FFmpegWriter('final_movie.mp4', (width, height), fps) as writer:
+            writer.write(frame)
+    """
+
+    def __init__(self, path: str, size: tuple, fps: float, audio=None, subtitles=None, duration=None,
+                 crf=23, preset='medium', subtitles_style='Fontsize=24,PrimaryColour=&H0000FFFF', ffmpeg=None,
+                 output_size=None, renditions=()):
+        """
+        :param path: the output movie path (mp4)
+        :param size: frames' (width, height)
+        :param fps: frames per second
+        :param audio: soundtrack file, looped if it's shorter than the movie; None for a silent movie
+        :param subtitles: SRT file to burn into the frames, None for no subtitles
+        :param duration: the movie's duration in seconds, used to trim the (looped) soundtrack
+        :param crf: H.264 constant rate factor - lower is better quality
+        :param preset: H.264 encoder preset - faster presets encode faster but produce bigger files
+        :param subtitles_style: libass style of the burnt subtitles (yellow by default, like the TextClip subtitles)
+        :param ffmpeg: the ffmpeg executable, None to use the one moviepy uses
+        :param output_size: the movie's (width, height) if the frames are scaled, e.g. for a draft - even dimensions
+        :param renditions: list of (Rendition, path) - smaller copies of the movie encoded from the same frames
+        """
+        self.path = path
+        self.size = tuple(size)
+        self.frames = 0
+        command = [ffmpeg or ffmpeg_binary(), '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', '%dx%d' % self.size, '-r', '%.6g' % fps, '-i', '-']
+        if audio is not None:
+            command += ['-stream_loop', '-1', '-i', audio]
+        # yuv420p (needed by most players) requires even dimensions
+        filters = ['scale=%d:%d' % tuple(output_size) if output_size else 'scale=trunc(iw/2)*2:trunc(ih/2)*2']
+        if subtitles is not None:
+            filters.append('subtitles=%s:force_style=%s' % (_filter_path(subtitles), _filter_path(subtitles_style)))
+        audio_arguments = []
+        if audio is not None:
+            audio_arguments = ['-map', '1:a', '-c:a', 'aac']
+            audio_arguments += ['-t', '%.6f' % duration] if duration is not None else ['-shortest']
+        labels = []
+        if renditions:
+            # The subtitles are burnt in once, then the frames are split between the movie and its renditions
+            graph = ['[0:v]%s,split=%d[main]%s' % (','.join(filters), len(renditions) + 1,
+                                                    ''.join('[r%d]' % i for i in range(len(renditions))))]
+            for i, (rendition, _) in enumerate(renditions):
+                rendition_graph, label = rendition_filter('[r%d]' % i, rendition, i)
+                graph.append(rendition_graph)
+                labels.append(label)
+            command += ['-filter_complex', ';'.join(graph), '-map', '[main]']
+        else:
+            command += ['-vf', ','.join(filters), '-map', '0:v']
+        command += ['-c:v', 'libx264', '-preset', preset, '-crf', str(crf), '-pix_fmt', 'yuv420p'] + audio_arguments
+        # The index at the start of the file, so players can start playing before the whole movie is loaded
+        command += ['-movflags', '+faststart', path]
+        for (rendition, rendition_path), label in zip(renditions, labels):
+            command += rendition_arguments(rendition, label, rendition_path, audio_arguments, preset)
+        self._stderr = tempfile.TemporaryFile()
+        try:
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self._stderr)
+        except OSError as e: # ffmpeg isn't installed
+            self._stderr.close()
+            raise FFmpegError("Can't start ffmpeg: %s" % e)
+
+    def write(self, frame: np.array):
+        """
+        Write one frame to the movie
+        :param frame: BGR uint8 numpy array with the dimensions height x width x 3
+        :return:
+        """
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            raise ValueError("Frame size %sx%s doesn't match the movie size %sx%s" % (frame.shape[1], frame.shape[0], *self.size))
+        try:
+            self._process.stdin.write(np.ascontiguousarray(frame, np.uint8).tobytes())
+        except BrokenPipeError:
+            self._fail()
+        self.frames += 1
+
+    def close(self):
+        """
+        Finish the encoding and wait for ffmpeg to write the movie
+        :return:
+        """
+        if self._process.stdin.closed:
+            return
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        if self._process.wait() != 0:
+            self._fail()
+        self._stderr.close()
+
+    def _fail(self):
+        self._process.kill()
+        self._process.wait()
+        self._stderr.seek(0)
+        message = self._stderr.read().decode(errors='replace').strip()
+        self._stderr.close()
+        raise FFmpegError("ffmpeg failed to encode %s: %s" % (self.path, message[-1000:]))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't leave a running ffmpeg behind if the frames couldn't be produced
+            self._process.kill()
+            self._process.wait()
+            self._stderr.close()
@@ -0,0 +1,221 @@
+######################### PROJECT CIM - GauGAN failure detection
+######################### GauGAN answers drawings with unsupported colors with an error image instead of a photo.
+######################### The error image's signature is computed once, and every response is compared to it.
+
+import os
+import numpy as np
+
+
+# The error image GauGAN returns in case of colors issue
+ERROR_DETECTOR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'error_detector.png')
+QUARANTINE = '.quarantine'
+
+
+def signature(image: bytes):
+    """
+    A compact perceptual signature of an image: a 64 bit difference hash (dHash) and a 32x32 map of its ink - how much
+    darker than its background each part of the grayscale thumbnail is, so a tint or a darker copy of an image has
+    the same map. The map is blurred, so a slightly cropped or scaled copy has nearly the same map too.
+    JPEG images are decoded at 1/8 of their size, which is all the signature needs.
+    :param image: the image's file content (JPEG or PNG)
+    :return: (hash as int, ink as float32 numpy array from 0 to 255), None if the image can't be decoded
+    """
+    import cv2
+    img = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if img is None:
+        return None
+    # dHash: whether each pixel of a 9x8 thumbnail is brighter than its right neighbour
+    small = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    image_hash = int(''.join('1' if bit else '0' for bit in bits), 2)
+    thumbnail = cv2.resize(img, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    background = max(1.0, float(np.percentile(thumbnail, 90))) # the brightest parts, e.g. the error image's white
+    return image_hash, cv2.GaussianBlur(255 - np.clip(thumbnail * (255 / background), 0, 255), (0, 0), 1)
+
+
+class FailureDetector:
+    """
+    Classifies GauGAN responses as photos or as the error image. The error image is mostly white, so besides the
+    hash distance (which tells little about flat images) the responses' ink must also be where the error image's text
+    is - wherever the response was tinted, slightly cropped or scaled.
+    Usage:
+        detector = FailureDetector()
+        if detector.is_failure(image):
+            ...
+    """
+
+    def __init__(self, reference=ERROR_DETECTOR, max_hash_distance=12, max_difference=0.3):
+        """
+        :param reference: path of the error image
+        :param max_hash_distance: maximum number of differing hash bits of an error image
+        :param max_difference: maximum difference between the ink of an error image and the error image's, as a
+                               fraction of their total ink (0 for the same ink, 1 for ink in different places)
+        """
+        with open(reference, 'rb') as f:
+            self.hash, self.ink = signature(f.read())
+        self.max_hash_distance = max_hash_distance
+        self.max_difference = max_difference
+
+    def distance(self, image: bytes):
+        """
+        :param image: the response's file content
+        :return: (number of differing hash bits, ink difference) from the error image, None if the response can't
+                 be decoded
+        """
+        image_signature = signature(image)
+        if image_signature is None:
+            return None
+        image_hash, ink = image_signature
+        difference = float(np.abs(ink - self.ink).sum() / max(1.0, float(ink.sum() + self.ink.sum())))
+        return bin(image_hash ^ self.hash).count('1'), difference
+
+    def is_failure(self, image: bytes) -> bool:
+        """
+        :param image: the response's file content
+        :return: True if the response is the error image, or not an image at all
+        """
+        distance = self.distance(image)
+        if distance is None:
+            return True
+        hash_distance, difference = distance
+        return hash_distance <= self.max_hash_distance and difference <= self.max_difference
+
+
+def quarantine(image: bytes, saving_path: str) -> str:
+    """
+    Keep a failed response aside, in the hidden .quarantine directory next to where it would have been saved
+    (so it isn't taken for a frame)
+    :param image: the response's file content
+    :param saving_path: where the response would have been saved
+    :return: the quarantined file's path
+    """
+    directory, name = os.path.split(saving_path)
+    directory = os.path.join(directory, QUARANTINE)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(image)
+    return path
+
+
+def release(saving_path: str) -> bool:
+    """
+    Remove the quarantined response of a drawing that was processed successfully since, e.g. on a later run
+    :param saving_path: where the response was saved
+    :return: True if a quarantined response was removed
+    """
+    directory, name = os.path.split(saving_path)
+    try:
+        os.remove(os.path.join(directory, QUARANTINE, name))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+ERROR_VARIANTS = ('error', 'crop', 'tint', 'scaled')
+
+
+def error_variant(reference: np.array, kind: str, size: int, rng) -> np.array:
+    """
+    The error image as GauGAN (or a proxy in front of it) may return it
+    :param reference: the error image, BGR
+    :param kind: 'error' - as is, 'crop' - a few percent cut off its sides, 'tint' - a color cast and darker,
+                 'scaled' - its text up to 10% smaller or larger, at another aspect ratio
+    :param size: the response's height
+    :param rng: numpy random generator
+    :return: BGR image
+    """
+    import cv2
+    height, width = reference.shape[:2]
+    image = reference
+    if kind == 'crop':
+        top, bottom = (rng.uniform(0, 0.05, 2) * height).astype(int)
+        left, right = (rng.uniform(0, 0.05, 2) * width).astype(int)
+        image = reference[top:height - bottom, left:width - right]
+    elif kind == 'tint':
+        gains = rng.uniform(0.8, 1.0, 3)
+        image = np.clip(reference * gains - rng.uniform(0, 30), 0, 255).astype(np.uint8)
+    elif kind == 'scaled':
+        scale = rng.uniform(0.9, 1.1)
+        scaled = cv2.resize(reference, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+        image = np.full_like(reference, 255) # the screen keeps its size, on a white page
+        y, x = (np.array(reference.shape[:2]) - scaled.shape[:2]) // 2
+        if scale < 1:
+            image[y:y + scaled.shape[0], x:x + scaled.shape[1]] = scaled
+        else:
+            image = scaled[-y:-y + height, -x:-x + width]
+        return cv2.resize(image, (int(size * rng.uniform(0.75, 1.5)), size), interpolation=cv2.INTER_AREA)
+    return cv2.resize(image, (size, size), interpolation=cv2.INTER_AREA)
+
+
+def synthetic_corpus(samples=20, seed=0) -> list:
+    """
+    Responses for checking the detector offline: variants of the error image (see error_variant) at various sizes and
+    JPEG qualities (failures), and photo-like, drawing-like and nearly white images, including other text (good
+    responses)
+    :param samples: number of responses of each kind
+    :param seed: random seed
+    :return: list of (name, JPEG bytes, True if it's a failure)
+    """
+    import cv2
+    from cim.synthetic import synthetic_photo
+    rng = np.random.default_rng(seed)
+    reference = cv2.imread(ERROR_DETECTOR)
+    corpus = []
+    for i in range(samples):
+        size = int(rng.choice([256, 512, 768]))
+        quality = int(rng.integers(40, 96))
+        kind = ERROR_VARIANTS[i % len(ERROR_VARIANTS)]
+        bad = error_variant(reference, kind, size, rng)
+        corpus.append(('%s%s' % (kind, i), cv2.imencode('.jpg', bad, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes(),
+                       True))
+
+        photo = cv2.resize(synthetic_photo(128, rng), (size, size))
+        # A bright, washed-out scene (snow, fog, sky)
+        white = np.clip(235 + rng.normal(0, 6, (size, size, 3)) + np.linspace(-10, 10, size)[:, None, None], 0, 255)
+        white = white.astype(np.uint8)
+        # White with other text on it
+        text = np.full((size, size, 3), 255, np.uint8)
+        cv2.putText(text, 'Sample %s' % i, (size // 10, int(rng.integers(size // 4, size))), cv2.FONT_HERSHEY_SIMPLEX,
+                    size / 256, (0, 0, 0), max(1, size // 256))
+        # A drawing of flat label-colored areas
+        drawing = np.full((size, size, 3), rng.integers(0, 256, 3), np.uint8)
+        drawing[:int(rng.integers(size // 4, size))] = rng.integers(0, 256, 3)
+        for name, good in (('photo', photo), ('white', white), ('text', text), ('drawing', drawing)):
+            corpus.append(('%s%s' % (name, i), cv2.imencode('.jpg', good, [cv2.IMWRITE_JPEG_QUALITY, quality])[1]
+                           .tobytes(), False))
+    return corpus
+
+
+def directory_corpus(directory: str) -> list:
+    """
+    Responses saved in a directory, e.g. real GauGAN responses: failures in its bad/ subdirectory and good
+    responses in its good/ subdirectory
+    :param directory: the corpus' directory
+    :return: list of (name, file content, True if it's a failure)
+    """
+    corpus = []
+    for kind, failed in (('bad', True), ('good', False)):
+        path = os.path.join(directory, kind)
+        for name in sorted(os.listdir(path)) if os.path.isdir(path) else []:
+            with open(os.path.join(path, name), 'rb') as f:
+                corpus.append((os.path.join(kind, name), f.read(), failed))
+    return corpus
+
+
+def evaluate(detector: FailureDetector, corpus: list) -> dict:
+    """
+    :param detector: the detector to check
+    :param corpus: list of (name, file content, True if it's a failure)
+    :return: dictionary with the detector's confusion counts and the misclassified responses
+    """
+    result = {'true_failures': 0, 'false_failures': 0, 'true_photos': 0, 'missed_failures': 0, 'misclassified': []}
+    for name, image, failed in corpus:
+        detected = detector.is_failure(image)
+        key = ('true_failures' if failed else 'false_failures') if detected else \
+            ('missed_failures' if failed else 'true_photos')
+        result[key] += 1
+        if detected != failed:
+            result['misclassified'].append((name, detector.distance(image)))
+    return result
@@ -0,0 +1,168 @@
+######################### PROJECT CIM - decoded frame store
+######################### The decoded frames are kept in one memory-mapped file, so rendering the same frames again
+######################### (another fps, other subtitles or soundtrack) skips decoding them
+
+import hashlib
+import json
+import os
+import numpy as np
+
+from cim.frames import FrameLoader
+
+
+DIRECTORY = '.frames' # hidden, so the frame manifest ignores it
+DATA_FILE = 'frames.u8'
+INDEX_FILE = 'index.json'
+
+
+def frames_key(files: list, hashes: list, mismatch: str) -> str:
+    """
+    :param files: the frames' paths, in the movie's order
+    :param hashes: the frames' content hashes (as recorded in the frame manifest)
+    :param mismatch: the FrameLoader mismatch mode the frames are decoded with
+    :return: a key identifying the decoded frames - it changes when any frame, their order or the mode changes
+    """
+    content = json.dumps([mismatch] + [[os.path.basename(file), h] for file, h in zip(files, hashes)])
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def _process_exists(pid: int) -> bool:
+    if os.name == 'nt': # os.kill can't probe a process on Windows - assume it's still running
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError: # another user's process
+        pass
+    return True
+
+
+def remove_stale_parts(path: str) -> list:
+    """
+    Remove the partial data files left by renders that crashed (their process is gone) - an interrupted render
+    removes its own partial file
+    :param path: the store's directory
+    :return: the removed files' paths
+    """
+    removed = []
+    for name in os.listdir(path) if os.path.isdir(path) else []:
+        parts = name.split('.')
+        if name.startswith(DATA_FILE + '.') and len(parts) == 4 and parts[-1] == 'part' and parts[2].isdigit() \
+                and int(parts[2]) != os.getpid() and not _process_exists(int(parts[2])):
+            try:
+                os.remove(os.path.join(path, name))
+                removed.append(os.path.join(path, name))
+            except FileNotFoundError: # removed by another render
+                pass
+    return removed
+
+
+class StoredFrames:
+    """
+    The frames of a frame store: an iterable of read-only BGR frames, read straight from the memory-mapped file
+    (zero-copy - the operating system's page cache keeps them). Behaves like FrameLoader.
+    """
+
+    def __init__(self, data_path: str, index: dict):
+        """
+        :param data_path: the store's data file
+        :param index: the store's index
+        """
+        width, height = index['size']
+        self.files = index['files']
+        self.skipped = index['skipped']
+        self.size = (width, height)
+        self.frames = np.memmap(data_path, np.uint8, 'r', shape=(index['count'], height, width, 3))
+
+    def __len__(self):
+        return len(self.files)
+
+    def __iter__(self):
+        return iter(self.frames)
+
+
+class RecordingFrames:
+    """
+    Decodes the frames with a FrameLoader and yields them as usual, while writing them into the frame store.
+    The store is only committed once all the frames went through, so an interrupted render leaves no partial store.
+    """
+
+    def __init__(self, loader: FrameLoader, path: str, key: str, max_bytes: int):
+        """
+        :param loader: the frames' FrameLoader
+        :param path: the store's directory
+        :param key: the frames' key (see frames_key)
+        :param max_bytes: frames that would take more space aren't stored
+        """
+        self.loader = loader
+        self.path = path
+        self.key = key
+        self.max_bytes = max_bytes
+        self.files = loader.files
+        self.skipped = loader.skipped
+
+    @property
+    def size(self) -> tuple:
+        return self.loader.size
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        width, height = self.size
+        if len(self.loader) * width * height * 3 > self.max_bytes:
+            yield from self.loader
+            return
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        remove_stale_parts(self.path)
+        data_path = os.path.join(self.path, DATA_FILE)
+        part = data_path + '.%s.part' % os.getpid()
+        frames = np.memmap(part, np.uint8, 'w+', shape=(len(self.loader), height, width, 3))
+        count = 0
+        try:
+            for frame in self.loader:
+                frames[count] = frame
+                count += 1
+                yield frame
+            frames.flush()
+            del frames
+            # The index is replaced last: a reader never sees an index that doesn't match the data
+            index_path = os.path.join(self.path, INDEX_FILE)
+            if os.path.exists(index_path):
+                os.remove(index_path)
+            os.replace(part, data_path)
+            with open(index_path + '.part', 'w') as f:
+                json.dump({'key': self.key, 'count': count, 'size': [width, height], 'files': self.files,
+                           'skipped': self.skipped}, f)
+            os.replace(index_path + '.part', index_path)
+        finally:
+            if os.path.exists(part): # interrupted
+                os.remove(part)
+
+
+def open_frames(directory: str, files: list, hashes: list, mismatch='resize', max_bytes=2 * 1024 ** 3):
+    """
+    The decoded frames of a directory: from its frame store if the store holds these frames, else decoded
+    (and stored for the next time)
+    :param directory: the frames' directory - the store is kept in its .frames subdirectory
+    :param files: the frames' paths, in the movie's order
+    :param hashes: the frames' content hashes, None for frames that aren't indexed (no store is used then)
+    :param mismatch: what to do with frames whose size differs from the first frame - 'resize', 'skip' or 'error'
+    :param max_bytes: maximum size of the store
+    :return: iterable of the BGR frames with the FrameLoader interface (size, skipped, len)
+    """
+    loader = FrameLoader(files, mismatch=mismatch)
+    if not files or None in hashes:
+        return loader
+    key = frames_key(files, hashes, mismatch)
+    path = os.path.join(directory, DIRECTORY)
+    try:
+        with open(os.path.join(path, INDEX_FILE), 'r') as f:
+            index = json.load(f)
+        if index['key'] == key:
+            return StoredFrames(os.path.join(path, DATA_FILE), index)
+    except (OSError, ValueError, KeyError): # no store yet, or a broken one - it's built again
+        pass
+    return RecordingFrames(loader, path, key, max_bytes)
@@ -0,0 +1,104 @@
+######################### PROJECT CIM - streaming frame loader
+######################### Decodes the movie's frames ahead on a small thread pool, keeping only a bounded number in memory
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class FrameSizeError(ValueError):
+    """
+    Raised when a frame's dimensions differ from the first frame's and mismatched frames are rejected
+    """
+
+
+class FrameLoader:
+    """
+    Iterates over the decoded frames of a list of image files, in order.
+    At most `prefetch` frames are decoded ahead of the consumer, so memory stays constant regardless of the number
+    of frames. Frames whose dimensions differ from the first frame's are resized, skipped or rejected
+    (cv2.VideoWriter silently drops them otherwise).
+    Usage:
+        frames = FrameLoader(files)
+        for frame in frames:
+            out.write(frame)
+    """
+
+    def __init__(self, files: list, mismatch='resize', workers=4, prefetch=8):
+        """
+        :param files: the image files, in the movie's order
+        :param mismatch: what to do with frames of a different size - 'resize', 'skip' or 'error'
+        :param workers: number of decoding threads (cv2 releases the GIL while decoding)
+        :param prefetch: maximum number of frames decoded ahead
+        """
+        if mismatch not in ('resize', 'skip', 'error'):
+            raise ValueError("mismatch must be 'resize', 'skip' or 'error', not %r" % mismatch)
+        self.files = list(files)
+        self.mismatch = mismatch
+        self.workers = workers
+        self.prefetch = max(1, prefetch)
+        self.skipped = [] # files that were skipped due to their size
+        self._size = None
+
+    @staticmethod
+    def decode(file: str):
+        """
+        :param file: image file path
+        :return: the decoded BGR image
+        """
+        import cv2
+        img = cv2.imread(file)
+        if img is None:
+            raise IOError("Can't decode the image %s" % file)
+        return img
+
+    @property
+    def size(self) -> tuple:
+        """
+        :return: the movie's (width, height) - the first frame's dimensions
+        """
+        if self._size is None:
+            if not self.files:
+                raise ValueError("There are no frames")
+            height, width, layers = self.decode(self.files[0]).shape
+            self._size = (width, height)
+        return self._size
+
+    def __len__(self):
+        return len(self.files)
+
+    def _fit(self, file: str, img):
+        if (img.shape[1], img.shape[0]) == self.size:
+            return img
+        if self.mismatch == 'resize':
+            import cv2
+            return cv2.resize(img, self.size, interpolation=cv2.INTER_AREA)
+        if self.mismatch == 'skip':
+            self.skipped.append(file)
+            return None
+        raise FrameSizeError("%s is %sx%s, while the movie is %sx%s" % (file, img.shape[1], img.shape[0], *self.size))
+
+    def __iter__(self):
+        if not self.files:
+            return
+        self.size # make sure the first frame defines the size
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            files = iter(self.files)
+            try:
+                # Keep the queue of decoded-ahead frames full, and yield the frames in order
+                for file in files:
+                    pending.append((file, executor.submit(self.decode, file)))
+                    if len(pending) < self.prefetch:
+                        continue
+                    file, future = pending.popleft()
+                    img = self._fit(file, future.result())
+                    if img is not None:
+                        yield img
+                while pending:
+                    file, future = pending.popleft()
+                    img = self._fit(file, future.result())
+                    if img is not None:
+                        yield img
+            finally:
+                for _, future in pending:
+                    future.cancel()
@@ -0,0 +1,143 @@
+######################### PROJECT CIM - GauGAN result cache
+######################### Persistent content-addressed cache with size-bounded LRU eviction
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from cim.disk_cache import SizeBoundedCache, atomic_write, file_lock
+
+
+class GauGANCache(SizeBoundedCache):
+    """
+    On-disk cache of GauGAN results.
+    Each entry is keyed by a hash of the drawing's bytes plus the style number, so re-processing the same
+    drawing with the same style never reaches the network. Entries' modification times track their last use,
+    and the least recently used entries are evicted once the cache grows beyond max_bytes.
+    The app's sessions and its job workers share the cache: entries and stats are written atomically, and the
+    hit/miss counters are counted in memory and added to the stats file under a lock file, once per batch
+    (see save_stats).
+    """
+
+    STATS_FILE = 'stats.json'
+    LOCK_FILE = '.stats.lock'
+
+    def __init__(self, directory='gaugan_cache', max_bytes=500 * 1024 ** 2):
+        """
+        :param directory: the directory where the cached results are stored
+        :param max_bytes: maximum total size of the cached results
+        """
+        super().__init__(directory, '.jpg', max_bytes)
+        self._lock = threading.Lock()
+        self._unsaved = [0, 0] # hits and misses counted since the last save_stats
+
+    @staticmethod
+    def key(drawing: bytes, style) -> str:
+        """
+        :param drawing: the drawing's file content
+        :param style: the GauGAN style number
+        :return: the cache key of the (drawing, style) pair
+        """
+        return hashlib.sha256(drawing + b'|style=%d' % int(style)).hexdigest()
+
+    def _load_stats(self):
+        try:
+            with open(os.path.join(self.directory, self.STATS_FILE)) as f:
+                stats = json.load(f)
+            return stats['hits'], stats['misses']
+        except (OSError, ValueError, KeyError):
+            return 0, 0
+
+    def _save_stats(self, hits: int, misses: int):
+        atomic_write(os.path.join(self.directory, self.STATS_FILE),
+                     json.dumps({'hits': hits, 'misses': misses}).encode())
+
+    @property
+    def hits(self) -> int:
+        """
+        :return: number of results served from the cache, by every process
+        """
+        return self._load_stats()[0] + self._unsaved[0]
+
+    @property
+    def misses(self) -> int:
+        """
+        :return: number of results that weren't cached, by every process
+        """
+        return self._load_stats()[1] + self._unsaved[1]
+
+    def save_stats(self):
+        """
+        Add the hits and misses counted since the last save to the stats file - once per batch of drawings.
+        Other processes may use the cache too, so the counts are added to theirs under the lock file.
+        :return:
+        """
+        with self._lock, file_lock(os.path.join(self.directory, self.LOCK_FILE)):
+            if self._unsaved == [0, 0]:
+                return
+            hits, misses = self._load_stats()
+            self._save_stats(hits + self._unsaved[0], misses + self._unsaved[1])
+            self._unsaved = [0, 0]
+
+    def lookup(self, drawing: bytes, style) -> bool:
+        """
+        Check whether the result of a (drawing, style) pair is cached. A result that isn't cached is counted as a miss,
+        a cached one is counted as a hit by fetch, once it's read.
+        :param drawing: the drawing's file content
+        :param style: the GauGAN style number
+        :return: True if the result is cached
+        """
+        hit = os.path.isfile(self._path(self.key(drawing, style)))
+        if not hit:
+            with self._lock:
+                self._unsaved[1] += 1
+        return hit
+
+    def fetch(self, drawing: bytes, style, saving_path: str) -> bool:
+        """
+        Copy a cached result to the given path, if one exists, and count it as a hit - or as a miss if it was evicted
+        since it was looked up.
+        The result is copied rather than hard-linked: hard links share the modification time, and the movie's frames
+        are ordered by modification time.
+        :param drawing: the drawing's file content
+        :param style: the GauGAN style number
+        :param saving_path: where the result should be saved
+        :return: True if the result was copied, False if it isn't cached
+        """
+        path = self._path(self.key(drawing, style))
+        with self._lock:
+            try:
+                shutil.copyfile(path, saving_path)
+            except FileNotFoundError: # not cached, or evicted by another process
+                self._unsaved[1] += 1
+                return False
+            self._unsaved[0] += 1
+            self._touch(path) # mark the entry as recently used
+            return True
+
+    def store(self, drawing: bytes, style, image: bytes):
+        """
+        Add a GauGAN result to the cache and evict old entries if needed.
+        :param drawing: the drawing's file content
+        :param style: the GauGAN style number
+        :param image: the processed image returned by GauGAN
+        :return:
+        """
+        path = self._path(self.key(drawing, style))
+        with self._lock:
+            # A half written entry is never served
+            atomic_write(path, image)
+            self._evict(keep=path)
+
+    def purge(self):
+        """
+        Remove every cached result and reset the hit/miss counters.
+        :return:
+        """
+        with self._lock, file_lock(os.path.join(self.directory, self.LOCK_FILE)):
+            for _, _, path in self._entries():
+                self._remove(path)
+            self._unsaved = [0, 0]
+            self._save_stats(0, 0)
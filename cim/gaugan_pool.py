@@ -0,0 +1,103 @@
+######################### PROJECT CIM - concurrent GauGAN submission
+######################### Bounded thread pool with per-request timeout and exponential-backoff retry
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class GauGANTimeout(Exception):
+    """
+    Raised when a single GauGAN request didn't return within the allowed time
+    """
+
+
+def call_with_timeout(func, timeout, *args, slots=None, **kwargs):
+    """
+    Call a blocking function and give up waiting for it after the given timeout.
+    gaugan.processImage has no timeout of its own, so the call runs in a daemon thread that is abandoned on timeout.
+    An abandoned call keeps its slot until it actually finishes, so the calls really running never exceed the slots.
+    :param func: the function to call
+    :param timeout: seconds to wait for the result, None to wait forever
+    :param slots: semaphore bounding the calls in flight (including the abandoned ones), None for no bound
+    :return: the function's result
+    """
+    if slots is not None:
+        slots.acquire()
+    if timeout is None:
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if slots is not None:
+                slots.release()
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = func(*args, **kwargs)
+        except BaseException as e:
+            outcome['error'] = e
+        finally:
+            if slots is not None:
+                slots.release()
+
+    worker = threading.Thread(target=target, daemon=True)
+    worker.start()
+    worker.join(timeout)
+    if worker.is_alive():
+        raise GauGANTimeout("Request didn't finish within %s seconds" % timeout)
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+
+def call_with_retry(func, args=(), kwargs=None, timeout=60, retries=3, backoff=1.0, sleep=time.sleep, slots=None):
+    """
+    Call a function, retrying it with exponential backoff when it fails or times out.
+    :param func: the function to call
+    :param args: positional arguments for the function
+    :param kwargs: keyword arguments for the function
+    :param timeout: per-attempt timeout in seconds
+    :param retries: how many times to retry after the first attempt
+    :param backoff: delay before the first retry, doubled after every failed attempt
+    :param sleep: the sleep function (replaceable for testing)
+    :param slots: semaphore bounding the calls in flight, see call_with_timeout
+    :return: the function's result, the last exception is raised if every attempt failed
+    """
+    kwargs = kwargs or {}
+    for attempt in range(retries + 1):
+        try:
+            return call_with_timeout(func, timeout, *args, slots=slots, **kwargs)
+        except Exception:
+            if attempt == retries:
+                raise
+            sleep(backoff * 2 ** attempt)
+
+
+def process_concurrently(func, jobs: list, max_workers=4, timeout=60, retries=3, backoff=1.0):
+    """
+    Run func(*job) for every job on a bounded thread pool.
+    Results are yielded in the jobs' order (not in completion order), so files written by the caller
+    keep a deterministic order - which matters because frames are sorted by modification time.
+    :param func: the function to call, e.g. gaugan.processImage
+    :param jobs: list of (args, kwargs) tuples
+    :param max_workers: maximum number of requests in flight - requests abandoned on timeout count until they finish
+    :param timeout: per-request timeout in seconds
+    :param retries: number of retries for each failed request
+    :param backoff: initial retry delay in seconds
+    :return: generator of (job, result, error) tuples, where error is None on success
+    """
+    slots = threading.BoundedSemaphore(max(1, max_workers))
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [executor.submit(call_with_retry, func, args, kwargs, timeout, retries, backoff, slots=slots)
+                   for args, kwargs in jobs]
+        try:
+            for job, future in zip(jobs, futures):
+                try:
+                    yield job, future.result(), None
+                except Exception as e:
+                    yield job, None, e
+        finally:
+            # If the consumer stopped early, don't start the requests that are still queued
+            for future in futures:
+                future.cancel()
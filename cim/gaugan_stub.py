@@ -0,0 +1,54 @@
+######################### PROJECT CIM - local GauGAN stand-in
+######################### Offline replacement for gaugan.processImage with tunable latency and failure rate
+
+import random
+import threading
+import time
+import numpy as np
+
+
+class StubGauGAN:
+    """
+    Drop-in replacement for the gaugan module: StubGauGAN().processImage(image, style=1) behaves like
+    gaugan.processImage - it takes the drawing's PNG bytes and returns JPEG bytes - without any network call.
+    """
+
+    def __init__(self, latency=0.1, failure_rate=0.0, seed=None, error_rate=0.0):
+        """
+        :param latency: seconds each request takes, or a (min, max) tuple for a random latency
+        :param failure_rate: probability (0-1) of a request raising ConnectionError
+        :param seed: random seed, for reproducible failures
+        :param error_rate: probability (0-1) of a request returning GauGAN's error image, like GauGAN does for
+                           drawings with unsupported colors
+        """
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.error_rate = error_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def processImage(self, image: bytes, style=1) -> bytes:
+        """
+        Fake GauGAN processing: the drawing is tinted according to the style and returned as a JPEG.
+        :param image: the drawing's file content
+        :param style: the GauGAN style number
+        :return: JPEG file content
+        """
+        import cv2
+        with self._lock:
+            self.calls += 1
+            latency = self._random.uniform(*self.latency) if isinstance(self.latency, tuple) else self.latency
+            failed = self._random.random() < self.failure_rate
+            error_image = self._random.random() < self.error_rate
+        time.sleep(latency)
+        if failed:
+            raise ConnectionError("Stub GauGAN request failed")
+        if error_image:
+            from cim.failure_detection import ERROR_DETECTOR
+            return cv2.imencode('.jpg', cv2.imread(ERROR_DETECTOR))[1].tobytes()
+        img = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+        # Each style gets its own deterministic tint, so outputs of different styles differ
+        tint = np.array([(style * 37) % 64, (style * 59) % 64, (style * 83) % 64], np.uint8)
+        img = cv2.add(img, np.broadcast_to(tint, img.shape).copy())
+        return cv2.imencode('.jpg', img)[1].tobytes()
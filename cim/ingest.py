@@ -0,0 +1,92 @@
+######################### PROJECT CIM - uploaded pictures ingestion
+######################### Uploaded pictures are decoded, oriented and resized on a pool of worker processes
+
+import io
+import os
+
+from cim.pools import worker_pool, map_in_order
+
+
+# How the pictures are fitted to the target size
+STRETCH, LETTERBOX, CROP = 'stretch', 'letterbox', 'crop'
+RESIZE_MODES = (STRETCH, LETTERBOX, CROP)
+# EXIF orientations that turn the picture by 90 degrees
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def load_picture(source, size=(512, 512), mode=STRETCH, drawing=False, background=(0, 0, 0)):
+    """
+    Decode a picture, turn it according to its EXIF orientation and fit it to the given size.
+    JPEG pictures are decoded in draft mode: the decoder scales them down by up to 8 while decoding, so a
+    12-megapixel photo never has to be decoded in full.
+    :param source: the picture - a path, bytes or a file-like object
+    :param size: the target (width, height)
+    :param mode: 'stretch' - resize to the size, 'letterbox' - fit inside the size and pad, 'crop' - fill the size
+                 and cut the center
+    :param drawing: True for drawings of GauGAN label colors - resized without interpolation, so no new colors appear
+    :param background: the padding color of the letterbox mode
+    :return: PIL image of the given size
+    """
+    from PIL import Image, ImageOps
+    if mode not in RESIZE_MODES:
+        raise ValueError("Unknown resize mode %r, expected one of %s" % (mode, ', '.join(RESIZE_MODES)))
+    img = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    orientation = img.getexif().get(0x0112, 1)
+    if img.format == 'JPEG' and not drawing:
+        # The draft is at least as large as the target, in the picture's own (not yet turned) orientation
+        img.draft('RGB', size[::-1] if orientation in _TRANSPOSED_ORIENTATIONS else size)
+    img = ImageOps.exif_transpose(img)
+    resample = Image.NEAREST if drawing else Image.LANCZOS
+    if mode == CROP:
+        return ImageOps.fit(img, size, method=resample)
+    if mode == LETTERBOX:
+        if img.mode not in ('RGB', 'RGBA', 'L'):
+            img = img.convert('RGB')
+        return ImageOps.pad(img, size, method=resample, color=background[0] if img.mode == 'L' else background)
+    return img.resize(size, resample)
+
+
+def ingest_picture(source, path: str, size=(512, 512), mode=STRETCH, drawing=False) -> str:
+    """
+    Load a picture (see load_picture) and save it - as png if the path is a png file, else as jpg
+    :param source: the picture - a path, bytes or a file-like object
+    :param path: where to save the picture
+    :return: the saved picture's path
+    """
+    img = load_picture(source, size, mode, drawing)
+    if path.lower().endswith('.png'):
+        img.save(path, 'PNG')
+    else:
+        if img.mode != 'RGB': # e.g. a png with transparency saved as a frame
+            img = img.convert('RGB')
+        img.save(path, 'JPEG', quality=95)
+    return path
+
+
+def _read(file):
+    """
+    :return: a path as is, the content of an uploaded (file-like) file, so it can be sent to a worker process
+    """
+    if isinstance(file, (str, bytes)):
+        return file
+    if hasattr(file, 'getvalue'): # e.g. streamlit's UploadedFile
+        return file.getvalue()
+    return file.read()
+
+
+def ingest_pictures(files: list, paths: list, size=(512, 512), mode=STRETCH, drawing=False, max_workers=None):
+    """
+    Load and save many pictures on a pool of worker processes. A limited number of pictures is sent to the
+    workers at a time, so only a few uploaded pictures are held in memory.
+    :param files: the pictures - paths, bytes or file-like objects
+    :param paths: where to save each picture
+    :param max_workers: number of worker processes, None for the number of cores, 1 to work in this process
+    :return: generator of the saved pictures' paths, in the files' order, as soon as each is saved
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers == 1 or len(files) <= 1: # not worth starting the workers
+        for file, path in zip(files, paths):
+            yield ingest_picture(file, path, size, mode, drawing)
+        return
+    tasks = ((_read(file), path, tuple(size), mode, drawing) for file, path in zip(files, paths))
+    yield from map_in_order(ingest_picture, tasks, worker_pool(max_workers), 2 * max_workers)
@@ -0,0 +1,217 @@
+######################### PROJECT CIM - background job queue
+######################### GauGAN and render jobs run in a process pool, the app polls their status and progress
+
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+class SharedProgress:
+    """
+    Progress reporter (see cim.pipeline.no_progress) that publishes a job's progress to the job queue.
+    It's picklable, so it can be handed to the worker processes.
+    """
+
+    def __init__(self, jobs, job_id: int, description=''):
+        """
+        :param jobs: the job queue's shared status dictionary
+        :param job_id: the job's id
+        :param description: the current stage, shown along with the progress
+        """
+        self.jobs = jobs
+        self.job_id = job_id
+        self.description = description
+
+    def update(self, **changes):
+        status = self.jobs[self.job_id]
+        status.update(changes)
+        self.jobs[self.job_id] = status # the manager's dictionary only sees assignments
+
+    def stage(self, description: str):
+        """
+        :param description: the name of the stage the job starts
+        :return: self, to be used as the stage's progress reporter
+        """
+        self.description = description
+        self.update(stage=description, progress=0.0)
+        return self
+
+    def __call__(self, iterable, total=None):
+        if total is None:
+            total = len(iterable) if hasattr(iterable, '__len__') else None
+        for i, item in enumerate(iterable):
+            yield item
+            if total:
+                self.update(progress=(i + 1) / total)
+
+
+def _run(jobs, job_id: int, func, args, kwargs):
+    """
+    Runs a job in a worker process
+    """
+    progress = SharedProgress(jobs, job_id)
+    progress.update(status=RUNNING, started=time.time())
+    return func(*args, progress=progress, **kwargs)
+
+
+def gaugan_job(styles_dict: dict, foldername: str, processedfoldername: str, styles: list, max_workers=4,
+               cache_directory=None, progress=None):
+    """
+    Process drawings in GauGAN, in a worker process
+    :param cache_directory: directory of the GauGAN results cache, None for no cache
+    :return: number of successfully processed files, number of failures
+    """
+    from cim import pipeline, tracing
+    from cim.gaugan_cache import GauGANCache
+    cache = GauGANCache(cache_directory) if cache_directory else None
+    with tracing.run('gaugan'):
+        return pipeline.make_nature(styles_dict, foldername, processedfoldername, styles, max_workers=max_workers,
+                                    cache=cache, progress=progress.stage("Processing in GauGAN"))
+
+
+def render_job(processed_files_directory: str, fps: float, single_pass=True, incremental=False, quality='final',
+               effects_workers=1, progress=None, **options):
+    """
+    Create the movie, in a worker process. Single-pass and incremental rendering fall back to the two-stage rendering.
+    :param processed_files_directory: the frames' directory
+    :param fps: frames per second
+    :param single_pass: True to stream the frames into one ffmpeg encode
+    :param incremental: True to only encode the segments of the movie that changed since the last render
+    :param quality: 'final', or 'draft' for a quick low-resolution draft_movie.mp4 - always rendered in a single
+                    pass (see cim.encoder.QUALITIES)
+    :param effects_workers: number of worker processes rendering the frame effects - 1 renders them in the job's
+                            worker process, the job queue already spreads the jobs over the cores
+    :param options: make_movie/make_movie_single_pass options (WITH_SUBTITLES, WITH_AUDIO, audio_crossfade,
+                    renditions, effects...) - the frame effects are made by the single-pass rendering only
+    :return: a message about the rendering
+    """
+    from cim import pipeline, tracing
+    from cim.encoder import FFmpegError, QUALITIES, FINAL
+    from cim.preview import make_preview, encode_renditions
+    from cim.timeline import Timeline
+    quality = QUALITIES[quality]
+    # Only the incremental rendering follows the frames' own durations and crossfades (see cim.timeline)
+    custom_timing = Timeline(processed_files_directory).customized
+    timing_ignored = " The frames' timing was ignored - it's followed by the incremental rendering only."
+    if options.get('effects') is not None: # the moving frames are streamed into one single-pass encode
+        incremental = False
+        single_pass = True
+        if effects_workers > 1:
+            from cim.pools import worker_pool
+            options['effects_pool'] = worker_pool(effects_workers)
+    else:
+        options.pop('effects', None)
+    if quality != FINAL:
+        # A draft is rendered by the same single-pass/incremental code as the final movie, only smaller and faster -
+        # the two-stage rendering would make a full-quality movie, so there's no fallback
+        with tracing.run('render'):
+            render = pipeline.make_movie_segmented if incremental else pipeline.make_movie_single_pass
+            render(processed_files_directory, fps, quality=quality, progress=progress.stage("Rendering a draft"),
+                   **options)
+        return "The draft has been created! Render the final movie once you're happy with it." + \
+            (timing_ignored if custom_timing and not incremental else "")
+    message = "The movie has been created successfully!"
+    renditions = options.pop('renditions', ())
+    movie = options.get('output_file') or os.path.join(processed_files_directory, 'final_movie.mp4')
+    with tracing.run('render'): # the stages of the render are shown together
+        render = pipeline.make_movie_segmented if incremental else pipeline.make_movie_single_pass
+        if single_pass or incremental:
+            try:
+                render(processed_files_directory, fps, renditions=renditions, progress=progress.stage("Rendering"),
+                       **options)
+            except FFmpegError as e:
+                message = "Fast rendering failed, the two-stage rendering was used instead. (%s)" % e
+                single_pass = incremental = False
+        if not (single_pass or incremental):
+            pipeline.make_seret(processed_files_directory, fps=fps, progress=progress.stage("Creating raw movie"))
+            progress.stage("Creating final movie")
+            # the two-stage rendering makes a slideshow of still frames
+            options.pop('effects', None)
+            options.pop('effects_pool', None)
+            pipeline.make_movie(processed_files_directory, **options)
+            if renditions: # the two-stage rendering can't feed the renditions, they're made from the movie
+                progress.stage("Creating renditions")
+                try:
+                    encode_renditions(movie, renditions)
+                except FFmpegError: # the Watch page offers the renditions that were made
+                    pass
+        # The Watch page plays the preview, so the full movie isn't loaded for every viewer
+        progress.stage("Creating preview")
+        try:
+            make_preview(movie)
+        except FFmpegError: # the Watch page falls back to the full movie
+            pass
+    if custom_timing and not incremental:
+        message += timing_ignored
+    return message
+
+
+class JobQueue:
+    """
+    Runs jobs in a pool of worker processes, so renders and GauGAN processing don't block the sessions' script
+    threads, and several users' jobs run in parallel on all cores.
+    Each job has a status - queued, running, done or failed - and a progress, both polled by the app.
+    """
+
+    def __init__(self, max_workers=None, keep=100):
+        """
+        :param max_workers: number of worker processes, None for the number of cores
+        :param keep: number of finished jobs whose status is kept
+        """
+        # spawn: the workers shouldn't inherit the streamlit server's threads
+        context = multiprocessing.get_context('spawn')
+        self._manager = context.Manager()
+        self._jobs = self._manager.dict()
+        self._executor = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), mp_context=context)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._keep = keep
+
+    def submit(self, kind: str, func, *args, **kwargs) -> int:
+        """
+        Queue a job
+        :param kind: the job's kind, e.g. 'render' or 'gaugan'
+        :param func: a module-level function accepting a `progress` keyword argument
+        :return: the job's id
+        """
+        with self._lock:
+            job_id = next(self._ids)
+            self._jobs[job_id] = {'id': job_id, 'kind': kind, 'status': QUEUED, 'stage': '', 'progress': 0.0,
+                                  'submitted': time.time(), 'started': None, 'finished': None,
+                                  'result': None, 'error': None}
+            self._forget_old_jobs()
+        future = self._executor.submit(_run, self._jobs, job_id, func, args, kwargs)
+        future.add_done_callback(lambda f: self._finished(job_id, f))
+        return job_id
+
+    def _finished(self, job_id: int, future):
+        status = self._jobs[job_id]
+        error = future.exception()
+        if error is None:
+            status.update(status=DONE, progress=1.0, result=future.result())
+        else:
+            status.update(status=FAILED, error=str(error) or type(error).__name__)
+        status['finished'] = time.time()
+        self._jobs[job_id] = status
+
+    def _forget_old_jobs(self):
+        finished = sorted(job_id for job_id, status in self._jobs.items() if status['status'] in (DONE, FAILED))
+        for job_id in finished[:max(0, len(finished) - self._keep)]:
+            del self._jobs[job_id]
+
+    def status(self, job_id: int) -> dict:
+        """
+        :param job_id: the job's id
+        :return: the job's status dictionary, None if the job is unknown
+        """
+        return self._jobs.get(job_id)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+        self._manager.shutdown()
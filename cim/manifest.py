@@ -0,0 +1,192 @@
+######################### PROJECT CIM - frame manifest
+######################### Persistent per-directory index of the frames, updated incrementally
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from cim.disk_cache import atomic_write, file_lock
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# A directory modified this recently may be modified again without its modification time changing (coarse clocks)
+SETTLED_NS = 2 * 10 ** 9
+
+
+class FrameManifest:
+    """
+    Index of the images in a directory (the drawings in tmp/ or the movie's frames in files/), kept in a small JSON
+    file inside the directory. For each image it records its order (modification time), dimensions, content hash and
+    origin - 'drawn', 'uploaded' or 'gaugan' (with the GauGAN style).
+    update() only stats the directory's entries: images are hashed and measured again only when their modification
+    time or size changed, so refreshing the manifest costs O(changes) rather than O(files) file reads. The entries
+    aren't even listed while the directory's modification time is the one of the last scan - adding, removing or
+    replacing an image changes it. An image rewritten in place doesn't, so the code writing images calls record().
+    Several processes may share a directory (e.g. the app and its job workers): the manifest is read again whenever
+    another process saved it, it's changed under a lock file, and it's always saved by an atomic replace.
+    """
+
+    FILENAME = '.manifest.json'
+    LOCK_FILENAME = '.manifest.lock'
+
+    def __init__(self, directory: str):
+        """
+        :param directory: the directory of the images
+        """
+        self.directory = os.path.normpath(directory)
+        self.path = os.path.join(self.directory, self.FILENAME)
+        self._lock = threading.RLock()
+        self._pending = {} # origins recorded for images that weren't indexed yet
+        self.entries = {}
+        self._loaded = None # the version (see _version) of the manifest file that was read or saved last
+        self._scanned = None # the directory's version (see _directory_version) when it was scanned last
+        self._reload()
+
+    def _version(self) -> tuple:
+        # Every save replaces the file, so its inode changes even when its modification time doesn't
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _directory_version(self) -> tuple:
+        stat = os.stat(self.directory)
+        return stat.st_mtime_ns, stat.st_ino
+
+    def _reload(self):
+        """
+        Read the manifest file again if another process saved it since it was read
+        """
+        try:
+            version = self._version()
+        except OSError: # not saved yet
+            return
+        if version == self._loaded:
+            return
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+            self._loaded = version
+        except (OSError, ValueError): # replaced meanwhile - read it next time
+            pass
+
+    @staticmethod
+    def _guess_origin(name: str) -> str:
+        # draw() saves the drawings as picN.png, anything else was uploaded
+        return 'drawn' if name.startswith('pic') and name.endswith('.png') else 'uploaded'
+
+    @staticmethod
+    def _describe(path: str) -> dict:
+        from PIL import Image
+        with open(path, 'rb') as f:
+            content_hash = hashlib.sha1(f.read()).hexdigest()
+        try:
+            with Image.open(path) as img: # only reads the image header
+                width, height = img.size
+        except OSError:
+            width, height = None, None
+        return {'hash': content_hash, 'width': width, 'height': height}
+
+    def update(self) -> bool:
+        """
+        Bring the manifest up to date with the directory
+        :return: True if anything changed
+        """
+        with self._lock:
+            if not os.path.isdir(self.directory):
+                changed = bool(self.entries)
+                self.entries = {}
+                return changed
+            with file_lock(os.path.join(self.directory, self.LOCK_FILENAME)):
+                return self._update()
+
+    def _update(self) -> bool:
+        self._reload()
+        before = self._directory_version()
+        if before == self._scanned and not self._pending: # no image was added, removed or replaced since
+            return False
+        changed = False
+        seen = set()
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                name = entry.name
+                if name.startswith('.') or not name.lower().endswith(IMAGE_EXTENSIONS) or not entry.is_file():
+                    continue
+                seen.add(name)
+                stat = entry.stat()
+                old = self.entries.get(name)
+                if old is not None and old['mtime'] == stat.st_mtime and old['size'] == stat.st_size \
+                        and name not in self._pending:
+                    continue
+                # A new or modified image
+                origin, style = self._pending.pop(name, None) or \
+                    ((old['origin'], old.get('style')) if old else (self._guess_origin(name), None))
+                self.entries[name] = dict(self._describe(entry.path), mtime=stat.st_mtime, size=stat.st_size,
+                                          origin=origin, style=style)
+                changed = True
+        for name in set(self.entries) - seen: # removed images
+            del self.entries[name]
+            changed = True
+        if changed:
+            self._save()
+        # Trusted only if nothing changed the directory during the scan (saving the manifest does: the directory is
+        # scanned once more next time) and it can't change again unnoticed
+        after = self._directory_version()
+        settled = time.time_ns() - after[0] > SETTLED_NS
+        self._scanned = after if after == before and settled else None
+        return changed
+
+    def _save(self):
+        atomic_write(self.path, json.dumps(self.entries).encode())
+        self._loaded = self._version()
+
+    def record(self, path: str, origin: str, style=None):
+        """
+        Record where an image came from. Call it right after writing the image: the image is indexed and the
+        manifest saved at once, so the origin isn't lost if this process (e.g. a job worker) exits.
+        :param path: the image path
+        :param origin: 'drawn', 'uploaded' or 'gaugan'
+        :param style: the GauGAN style number, for processed images
+        :return:
+        """
+        name = os.path.basename(path)
+        with self._lock, file_lock(os.path.join(self.directory, self.LOCK_FILENAME)):
+            self._reload()
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError: # not written yet - it's indexed with its origin by the next update()
+                self._pending[name] = (origin, style)
+                return
+            self._pending.pop(name, None)
+            self.entries[name] = dict(self._describe(os.path.join(self.directory, name)), mtime=stat.st_mtime,
+                                      size=stat.st_size, origin=origin, style=style)
+            self._save()
+
+    def entry(self, path: str):
+        """
+        :param path: the image path
+        :return: the image's entry (hash, width, height, mtime, size, origin, style), None if it isn't indexed
+        """
+        with self._lock:
+            self._reload()
+            return self.entries.get(os.path.basename(path))
+
+    def files(self, extensions=IMAGE_EXTENSIONS) -> list:
+        """
+        :param extensions: the file extensions to include
+        :return: the images' paths, in ascending order of modification time
+        """
+        with self._lock:
+            self._reload()
+            names = [name for name in self.entries if name.lower().endswith(extensions)]
+            names.sort(key=lambda name: (self.entries[name]['mtime'], name))
+            return [os.path.join(self.directory, name) for name in names]
+
+    def frames(self) -> list:
+        """
+        :return: the movie's frames (jpg files), in order
+        """
+        return self.files(('.jpg',))
+
+    def __len__(self):
+        return len(self.entries)
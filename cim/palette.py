@@ -0,0 +1,107 @@
+######################### PROJECT CIM - label palette
+######################### Drawings are GauGAN label maps: every pixel is snapped to a palette color and the drawing
+######################### is stored as an 8-bit palette-indexed PNG
+
+import hashlib
+import io
+import numpy as np
+
+
+class LabelPalette:
+    """
+    The GauGAN colors as a palette. Pixels are snapped to the nearest palette color through a lookup table
+    computed over the whole RGB cube (at `bits` bits per channel) the first time a drawing is snapped, so
+    anti-aliased strokes never produce unsupported labels. Pixels that are exactly a palette color always keep it.
+    Usage:
+        palette = LabelPalette(colors)
+        png = palette.encode(palette.snap(rgb_drawing))
+    """
+
+    def __init__(self, colors: dict, bits=6):
+        """
+        :param colors: GauGAN colors dictionary (name -> RGB)
+        :param bits: lookup table precision per channel - the table has 2**(3*bits) entries
+        """
+        # Several labels may share a color, the palette keeps each color once
+        self.colors = np.array(sorted(set(tuple(color) for color in colors.values())), np.uint8)
+        if len(self.colors) > 256:
+            raise ValueError("A palette holds up to 256 colors, got %s" % len(self.colors))
+        self.bits = bits
+        self._packed = self._pack(self.colors)
+        self._lut = None
+
+    @property
+    def lut(self) -> np.array:
+        """
+        :return: the palette index of the nearest color of every cell's center, indexed by the packed cell
+        """
+        if self._lut is None:
+            shift = 8 - self.bits
+            levels = (np.arange(2 ** self.bits, dtype=np.int32) << shift) + (1 << shift >> 1)
+            # One color at a time, the cube's distances are the sum of the per-channel squared differences - the
+            # memory stays a few table-sized arrays however many colors the palette has
+            best = np.full((len(levels),) * 3, np.iinfo(np.int32).max, np.int32)
+            lut = np.zeros(best.shape, np.uint8)
+            for i, (r, g, b) in enumerate(self.colors.astype(np.int32)):
+                distances = ((levels - r) ** 2)[:, None, None] + ((levels - g) ** 2)[None, :, None] + \
+                    ((levels - b) ** 2)[None, None, :]
+                nearer = distances < best # ties keep the first color, like argmin
+                best[nearer] = distances[nearer]
+                lut[nearer] = i
+            self._lut = lut.reshape(-1)
+        return self._lut
+
+    @staticmethod
+    def _pack(rgb: np.array) -> np.array:
+        rgb = rgb.astype(np.uint32)
+        return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+    def snap(self, rgb: np.array) -> np.array:
+        """
+        :param rgb: RGB image with the dimensions HxWx3
+        :return: uint8 numpy array with the dimensions HxW of palette indices
+        """
+        rgb = np.asarray(rgb, np.uint8)[:, :, :3]
+        shift = 8 - self.bits
+        cells = rgb >> shift
+        indices = self.lut[(cells[:, :, 0].astype(np.int32) << 2 * self.bits) |
+                           (cells[:, :, 1].astype(np.int32) << self.bits) | cells[:, :, 2]]
+        # Exact palette colors keep their own index (a cell may be nearer to another color at its center)
+        packed = self._pack(rgb)
+        exact = np.searchsorted(self._packed, packed).clip(0, len(self._packed) - 1)
+        matches = self._packed[exact] == packed
+        indices[matches] = exact[matches]
+        return indices
+
+    def to_rgb(self, indices: np.array) -> np.array:
+        """
+        :param indices: palette indices with the dimensions HxW
+        :return: RGB image with the dimensions HxWx3
+        """
+        return self.colors[indices]
+
+    def to_image(self, indices: np.array):
+        """
+        :param indices: palette indices with the dimensions HxW
+        :return: PIL image in palette ('P') mode
+        """
+        from PIL import Image
+        img = Image.fromarray(indices, 'P')
+        img.putpalette(self.colors.flatten().tolist())
+        return img
+
+    def encode(self, indices: np.array) -> bytes:
+        """
+        :param indices: palette indices with the dimensions HxW
+        :return: 8-bit palette-indexed PNG file content
+        """
+        output = io.BytesIO()
+        self.to_image(indices).save(output, 'PNG', optimize=True)
+        return output.getvalue()
+
+
+def content_hash(content: bytes) -> str:
+    """
+    :return: the hash the frame manifest records for a file's content
+    """
+    return hashlib.sha1(content).hexdigest()
@@ -0,0 +1,480 @@
+######################### PROJECT CIM - movie pipeline
+######################### The backend of YourMovie, usable without streamlit (see cim/__main__.py)
+######################### Heavy libraries (cv2, moviepy, gaugan) are only imported when they are needed
+
+import functools
+import math
+import os
+import time
+
+from cim import tracing
+from cim.audio import build_audio_bed, write_wav
+from cim.compositing import composite_background
+from cim.effects import FrameEffects
+from cim.failure_detection import ERROR_DETECTOR, FailureDetector, quarantine, release
+from cim.encoder import FFmpegWriter, FINAL, scaled_size
+from cim.frame_store import open_frames
+from cim.frames import FrameSizeError
+from cim.gaugan_pool import process_concurrently, call_with_retry
+from cim.ingest import ingest_pictures, STRETCH
+from cim.manifest import FrameManifest
+from cim.palette import LabelPalette, content_hash
+from cim.preview import rendition_outputs, finish_renditions, encode_renditions
+from cim.segments import SegmentRenderer, thin_shots
+from cim.subtitles import load_subtitles, read_subtitles, write_srt, SubtitleRenderer
+from cim.timeline import Timeline
+
+
+def no_progress(iterable, total=None):
+    """
+    Default progress reporter: report nothing. tqdm.tqdm or a job's progress stage can be used instead.
+    """
+    return iterable
+
+
+@functools.lru_cache(maxsize=None)
+def failure_detector() -> FailureDetector:
+    """
+    The error image's signature is computed once per process
+    :return: FailureDetector of GauGAN's error image (ERROR_DETECTOR)
+    """
+    return FailureDetector(ERROR_DETECTOR)
+
+
+@functools.lru_cache(maxsize=None)
+def _frame_manifest(path: str) -> FrameManifest:
+    return FrameManifest(path)
+
+
+def frame_manifest(path: str) -> FrameManifest:
+    """
+    One frame manifest is kept per directory for the process' lifetime
+    :param path: directory path.
+    :return: the FrameManifest of the directory
+    """
+    return _frame_manifest(os.path.normpath(path))
+
+
+def sort_files(path: str) -> list:
+
+    '''
+    Sort files in ascending order of creation time.
+    Use for sorting drawings to make nature photos out of them,
+    and for sorting drawings/pictures to make a movie out of them.
+    The order is kept in the directory's frame manifest, which only re-reads the files that changed.
+    :param path: directory path.
+    :return: list of image files
+    '''
+    manifest = frame_manifest(path)
+    # Bring the manifest up to date with the directory
+    manifest.update()
+    # Return sorted files
+    return manifest.files()
+
+
+def list_frames(path: str) -> list:
+    """
+    The movie's frames (jpg files only), in ascending order of creation time
+    :param path: directory path.
+    :return: list of jpg files
+    """
+    manifest = frame_manifest(path)
+    manifest.update()
+    return manifest.frames()
+
+
+def movie_frames(path: str, mismatch='resize'):
+    """
+    The movie's decoded frames. They're kept in the directory's frame store (a memory-mapped file), which is built
+    by the first render and used as long as the frames in the manifest don't change.
+    :param path: the frames' directory
+    :param mismatch: what to do with frames whose size differs from the first frame - 'resize', 'skip' or 'error'
+    :return: iterable of the BGR frames, with the movie's (width, height) as its size
+    """
+    files = list_frames(path)
+    manifest = frame_manifest(path)
+    hashes = [(manifest.entry(file) or {}).get('hash') for file in files]
+    return open_frames(path, files, hashes, mismatch)
+
+
+def kept_frames(path: str, mismatch='resize') -> tuple:
+    """
+    The frames that make it into the movie, known from the manifest before any frame is decoded
+    :param path: the frames' directory
+    :param mismatch: what to do with frames whose size differs from the first frame - 'resize', 'skip' or 'error'
+    :return: list of the kept frames' (path, manifest entry), the movie's (width, height)
+    """
+    files = list_frames(path)
+    if not files:
+        raise ValueError("There are no frames")
+    manifest = frame_manifest(path)
+    entries = [manifest.entry(file) or {} for file in files]
+    # The first frame defines the movie's size
+    size = (entries[0].get('width'), entries[0].get('height'))
+    frames = []
+    for file, entry in zip(files, entries):
+        if (entry.get('width'), entry.get('height')) != size and mismatch != 'resize':
+            if mismatch == 'error':
+                raise FrameSizeError("%s is %sx%s, while the movie is %sx%s" % (file, entry.get('width'),
+                                                                               entry.get('height'), *size))
+            continue # skip it
+        frames.append((file, entry))
+    return frames, size
+
+
+def soundtrack_and_subtitles(path: str, duration: float, WITH_SUBTITLES=False, WITH_AUDIO=False,
+                             audio_crossfade=0.0, subtitles_file=None, audio_file=None) -> tuple:
+    """
+    The movie's subtitles and soundtrack, timed for its duration
+    :param path: the frames' directory
+    :param duration: the movie's duration in seconds
+    :param WITH_SUBTITLES: boolean
+    :param WITH_AUDIO: boolean
+    :param audio_crossfade: crossfade duration in seconds where the soundtrack loops
+    :param subtitles_file: subtitles file (srt or txt), None for the directory's subtitles.srt/subtitles.txt
+    :param audio_file: soundtrack file, None for the directory's audio.mp3
+    :return: list of Cue (empty without subtitles), the soundtrack's path (None without audio)
+    """
+    cues = []
+    if WITH_SUBTITLES: # if the user is willing to have subtitles in the movie
+        # Read the timed subtitles (subtitles.srt), or the subtitles lines that split the movie equally (subtitles.txt)
+        cues = read_subtitles(subtitles_file, duration) if subtitles_file else load_subtitles(path, duration)
+
+    # The soundtrack is looped by ffmpeg if it's shorter than the movie, and trimmed to the movie's duration
+    audio = (audio_file or os.path.join(path, 'audio.mp3')) if WITH_AUDIO else None
+    if WITH_AUDIO and audio_crossfade > 0:
+        # ffmpeg's stream looping can't crossfade - prepare the looped soundtrack (decoded once) instead
+        audio_bed = build_audio_bed(audio, duration, crossfade=audio_crossfade)
+        audio = os.path.join(path, 'audio_bed.wav')
+        write_wav(audio_bed, audio)
+    return cues, audio
+
+
+@tracing.traced('draw')
+def save_drawing(image_data, background, palette: LabelPalette, path: str):
+    """
+    Save a canvas drawing as a GauGAN label map: the background is put under it, every pixel is snapped to the
+    nearest palette color and the drawing is saved as an 8-bit palette-indexed PNG.
+    A drawing identical to the directory's latest drawing (e.g. an automatic save after a rerun) isn't saved again.
+    :param image_data: the canvas drawing, RGBA with the dimensions HxWx4
+    :param background: RGB background with the same height and width as the drawing
+    :param palette: LabelPalette of the GauGAN colors
+    :param path: where to save the drawing, e.g. tmp/pic3.png
+    :return: the saved drawing's path, None if it's a duplicate of the latest drawing
+    """
+    content = palette.encode(palette.snap(composite_background(image_data, background)))
+    directory = os.path.dirname(path)
+    drawings = sort_files(directory)
+    if drawings and (frame_manifest(directory).entry(drawings[-1]) or {}).get('hash') == content_hash(content):
+        return None
+    with open(path, 'wb') as f:
+        f.write(content)
+    frame_manifest(directory).record(path, 'drawn')
+    return path
+
+
+@tracing.traced('save_uploadedfiles')
+def save_uploaded_images(uploadedfiles: list, foldername: str, process=True, size=(512,512), mode=STRETCH,
+                         max_workers=None, progress=no_progress) -> list:
+    """
+    Save uploaded pictures into the given folder name, resized to 512X512 (or the given size).
+    The pictures are decoded and resized on a pool of worker processes (see cim.ingest).
+    :param uploadedfiles: A list of the uploaded files (paths or file-like objects)
+    :param foldername: The directory where the files will be saved
+    :param process: True to save png files for processing with GauGAN, False to save jpg frames
+    :param size: the pictures' (width, height)
+    :param mode: how the pictures are fitted to the size - 'stretch', 'letterbox' or 'crop'
+    :param max_workers: number of worker processes, None for the number of cores
+    :param progress: progress reporter wrapping an iterable, e.g. tqdm.tqdm
+    :return: the saved files' paths
+    """
+    # make sure the foldername exists
+    if not os.path.exists(foldername+"/"):
+        os.makedirs(foldername+"/")
+    # define the pictures' filenames according to the counter i - png files for processing with GauGAN,
+    # jpg files if processing is skipped
+    paths = [os.path.join(foldername,"%s.%s"%(i,'png' if process else 'jpg')) for i in range(len(uploadedfiles))]
+    manifest = frame_manifest(foldername)
+    saved = ingest_pictures(uploadedfiles, paths, size, mode, drawing=process, max_workers=max_workers)
+    # The pictures come back in the upload order. Frames are ordered by modification time, and the workers may
+    # finish them in any order, so they're given strictly increasing times here - touching them in a row may give
+    # several the same time on coarse clocks. A millisecond apart, so the manifest's float times still differ.
+    base = time.time_ns()
+    for i, path in enumerate(progress(saved, total=len(paths))):
+        os.utime(path, ns=(base + i * 1000000,) * 2)
+        manifest.record(path, 'uploaded')
+    tracing.annotate(frames=len(paths))
+    return paths
+
+
+@tracing.traced('make_nature')
+def make_nature(styles_dict: dict,foldername='tmp',processedfoldername='Processed_imgs',styles=[1],
+                max_workers=4,timeout=60,retries=3,backend=None,cache=None,detector=None,progress=no_progress):
+    """
+    Process drawings in GauGAN
+    :param styles_dict: dictionary of styles where keys are the style's name and the values are the style's number
+    :param foldername: The directory that the drawings will be read from
+    :param processedfoldername: The directory where the processed drawings will be saved
+    :param styles: the styles the user has chosen to process in GauGAN
+    :param max_workers: maximum number of GauGAN requests sent in parallel
+    :param timeout: seconds to wait for each GauGAN request
+    :param retries: how many times a failed GauGAN request is retried (with exponential backoff)
+    :param backend: module/object providing processImage - None for gaugan, or a local stub such as
+                    cim.gaugan_stub.StubGauGAN
+    :param cache: GauGANCache of previous results, None to always send the drawings to GauGAN
+    :param detector: FailureDetector recognizing GauGAN's error image, None for the default one.
+                     The error images are kept in processedfoldername/.quarantine/ rather than saved as frames,
+                     until the drawing is processed successfully.
+    :param progress: progress reporter wrapping an iterable, e.g. tqdm.tqdm
+    :return: number of successfully processed files, number of failures
+    """
+    if backend is None:
+        import gaugan as backend
+
+    # initialize counters for success/failure of process
+    success,failure = 0,0
+
+    # Sort files by creation time in drawings directory.
+    files = sort_files(foldername)
+    # One (file, style) pair at a time - in the same order the sequential version used
+    pairs = []
+    for p in files:
+        # Read each file
+        with open(p, "rb") as f:
+            drawing = f.read()
+        for j in range(len(styles)):
+            # The processed file's path: add style num to img name
+            saving_path = os.path.join(processedfoldername, os.path.split(p[:-4])[-1]+'%s.jpg'%j)
+            pairs.append((drawing, styles_dict[styles[j]], saving_path))
+    # Only the pairs that weren't processed before are sent to GauGAN
+    cached = [cache is not None and cache.lookup(drawing, style) for drawing, style, _ in pairs]
+    jobs = [((drawing,), {'style': style}) for (drawing, style, _), hit in zip(pairs, cached) if not hit]
+    tracing.annotate(frames=len(pairs), cache_hits=len(pairs) - len(jobs))
+
+    # Recognizes the error image that can be received as result in case of colors issue
+    detector = detector or failure_detector()
+
+    if not os.path.exists(processedfoldername):
+        os.makedirs(processedfoldername) # create the processed in GauGAN folder if it doesn't exist
+    # Where the processed drawings' origin (GauGAN and the style) is recorded
+    manifest = frame_manifest(processedfoldername)
+
+    # Get processed images back from GauGAN server, several requests at a time. The results come back in the
+    # jobs' order, so the files are written in a deterministic order (frames are later sorted by modification time)
+    results = process_concurrently(backend.processImage, jobs, max_workers, timeout, retries)
+    for (drawing, style, saving_path), hit in zip(pairs, progress(cached, total=len(cached))):
+        if hit:
+            if cache.fetch(drawing, style, saving_path): # the result was copied from the cache
+                manifest.record(saving_path, 'gaugan', style)
+                release(saving_path) # an earlier failed response of the drawing isn't kept any more
+                success += 1
+                continue
+            # the entry was evicted in the meantime - process this drawing on its own
+            try:
+                image, error = call_with_retry(backend.processImage, (drawing,), {'style': style}, timeout, retries), None
+            except Exception as e:
+                image, error = None, e
+        else:
+            job, image, error = next(results)
+        if error is not None: # If the request to GauGAN server failed
+            failure += 1
+        elif detector.is_failure(image): # If GauGAN returned the error image
+            quarantine(image, saving_path)
+            failure += 1
+        else:
+            with open(saving_path, "wb") as f: # Save the processed drawing
+                # Write the processed file.
+                f.write(image)
+            manifest.record(saving_path, 'gaugan', style)
+            release(saving_path)
+            if cache is not None:
+                cache.store(drawing, style, image)
+            success += 1
+    if cache is not None: # the hits and misses of the whole batch, saved at once
+        cache.save_stats()
+    tracing.annotate(failures=failure)
+    return success, failure
+
+
+@tracing.traced('make_seret')
+def make_seret(processed_files_directory='files/',fps=5,mismatch='resize',progress=no_progress):
+    """
+    This function creates the initial movie in AVI format using opencv.
+    The movie frame rate will be dfined by the fps variable.
+    The frames are decoded ahead on a small thread pool and written as they arrive, so only a few frames
+    are held in memory at any time.
+    :param processed_files_directory: The drawings/pictures that will be composited
+    :param fps: frames per second
+    :param mismatch: what to do with frames whose size differs from the first frame - 'resize', 'skip' or 'error'
+    :param progress: progress reporter wrapping an iterable, e.g. tqdm.tqdm
+    :return:
+    """
+    import cv2
+    # The jpg files of the processed images directory, sorted. The movie's frames are decoded lazily (or read from
+    # the frame store if they were decoded before); size = (width, height) of the first frame
+    frames = movie_frames(processed_files_directory, mismatch)
+    # Create a video writer for the movie
+    out = cv2.VideoWriter(os.path.join(processed_files_directory, 'initial.avi'), cv2.VideoWriter_fourcc(*'DIVX'),
+                          fps, frames.size)
+    # For each image, as soon as it's decoded
+    for image in progress(frames, total=len(frames)):
+        # Write image by video writer
+        out.write(image)
+    # Release video writer.
+    out.release()
+    tracing.annotate(frames=len(frames) - len(frames.skipped))
+
+
+@tracing.traced('make_movie')
+def make_movie(processed_files_directory='files/', WITH_SUBTITLES=False, WITH_AUDIO=False, audio_crossfade=0.0,
+               subtitles_file=None, audio_file=None, output_file=None):
+    """
+    Based on the product of the make_seret function, this function will create the final movie,
+    with audio/subtitles/both.
+    :param processed_files_directory: The directory in which the final movie will be saved
+    :param WITH_SUBTITLES: boolean
+    :param WITH_AUDIO: boolean
+    :param audio_crossfade: crossfade duration in seconds where the soundtrack loops
+    :param subtitles_file: subtitles file (srt or txt), None for the directory's subtitles.srt/subtitles.txt
+    :param audio_file: soundtrack file, None for the directory's audio.mp3
+    :param output_file: the movie's path, None for the directory's final_movie.mp4
+    :return:
+    """
+    from moviepy.editor import VideoFileClip
+    from moviepy.audio.AudioClip import AudioArrayClip
+
+    # Declare  VideoFileClip from the movie that I already have.
+    clip = VideoFileClip(os.path.join(processed_files_directory, "initial.avi"))
+
+    if WITH_SUBTITLES: # if the user is willing to have subtitles in the movie
+        # Read the timed subtitles (subtitles.srt), or the subtitles lines that split the movie equally (subtitles.txt)
+        cues = read_subtitles(subtitles_file, clip.duration) if subtitles_file else \
+            load_subtitles(processed_files_directory, clip.duration)
+        # Each subtitle is rasterized once and blended onto the frames it's shown on, at the bottom of the screen
+        renderer = SubtitleRenderer(cues, clip.size)
+        clip = clip.fl(lambda get_frame, t: renderer.apply(get_frame(t), t))
+
+
+    # Set audio clip from mp3 file.
+    if WITH_AUDIO: # if the user has chosen to include soundtrack in the movie
+        f = audio_file or os.path.join(processed_files_directory, 'audio.mp3') # mp3 soundtrack file of the movie
+        # Decode the soundtrack once, loop it if the clip is longer, and fit its duration to the movie's
+        bed = build_audio_bed(f, clip.duration, fps=44100, crossfade=audio_crossfade)
+        audioclip = AudioArrayClip(bed, fps=44100)
+
+        # Set audio for the container.
+        videoclip = clip.set_audio(audioclip)
+    else:
+        videoclip = clip # if the user didn't want audio in the movie
+
+    # Write the video file.
+    f = output_file or os.path.join(processed_files_directory, 'final_movie.mp4') # the desired movie filename
+    videoclip.write_videofile(f)
+    tracing.annotate(frames=int(round(clip.duration * clip.fps)))
+
+
+@tracing.traced('make_movie_single_pass')
+def make_movie_single_pass(processed_files_directory='files/', fps=5, WITH_SUBTITLES=False, WITH_AUDIO=False,
+                           mismatch='resize', audio_crossfade=0.0, subtitles_file=None, audio_file=None,
+                           output_file=None, quality=FINAL, renditions=(), effects=None, effects_pool=None,
+                           progress=no_progress):
+    """
+    Create the final movie in a single pass: the frames are streamed straight into one ffmpeg H.264 encode,
+    which also muxes the audio and burns in the subtitles - no intermediate AVI is written.
+    The two-stage make_seret + make_movie path produces the same movie and remains available as a fallback.
+    :param processed_files_directory: The drawings/pictures that will be composited, and where the movie will be saved
+    :param fps: frames per second
+    :param WITH_SUBTITLES: boolean
+    :param WITH_AUDIO: boolean
+    :param mismatch: what to do with frames whose size differs from the first frame - 'resize', 'skip' or 'error'
+    :param audio_crossfade: crossfade duration in seconds where the soundtrack loops
+    :param subtitles_file: subtitles file (srt or txt), None for the directory's subtitles.srt/subtitles.txt
+    :param audio_file: soundtrack file, None for the directory's audio.mp3
+    :param output_file: the movie's path, None for the directory's final_movie.mp4 (draft_movie.mp4 for a draft)
+    :param quality: cim.encoder.RenderQuality - FINAL, or DRAFT for a quick low-resolution movie
+    :param renditions: names of smaller renditions of the final movie (see cim.encoder.LADDER), encoded along with it
+                       from the same frames - e.g. ['720p', '480p', 'thumbnail']
+    :param effects: cim.effects.Effects - Ken Burns pan/zoom and crossfades between the frames, None for still frames
+    :param effects_pool: ProcessPoolExecutor rendering the frame effects (see cim.pools.worker_pool), None to render
+                         them in this process
+    :param progress: progress reporter wrapping an iterable, e.g. tqdm.tqdm
+    :return:
+    """
+    # The jpg files of the processed images directory, sorted. The movie's frames are decoded lazily (or read from
+    # the frame store if they were decoded before), the first frame defines the movie's size
+    frames = movie_frames(processed_files_directory, mismatch)
+    step = quality.step # every step-th frame is kept, at fps/step
+    # The movie lasts as long as the frames that are written (frames of another size may be skipped)
+    duration = math.ceil(len(kept_frames(processed_files_directory, mismatch)[0]) / step) * step / fps
+
+    cues, audio = soundtrack_and_subtitles(processed_files_directory, duration, WITH_SUBTITLES, WITH_AUDIO,
+                                           audio_crossfade, subtitles_file, audio_file)
+    subtitles = None
+    if WITH_SUBTITLES: # ffmpeg burns them in from a SRT file
+        subtitles = os.path.join(processed_files_directory, 'cues.srt')
+        write_srt(cues, subtitles)
+
+    output_file = output_file or os.path.join(processed_files_directory, '%s_movie.mp4' % quality.name)
+    stream = (img for i, img in enumerate(progress(frames, total=len(frames))) if i % step == 0)
+    movie_fps = fps / step
+    if effects is not None:
+        # The frame-effects stage renders the moving frames on worker processes, between the loading and the encoding
+        stage = FrameEffects(movie_fps, effects, pool=effects_pool)
+        stream, movie_fps = stage.apply(stream), stage.fps
+    # The renditions are fed by the same decoded frames and soundtrack as the movie (drafts have none)
+    outputs = rendition_outputs(output_file, renditions, frames.size[1]) if quality == FINAL else []
+    with FFmpegWriter(output_file, frames.size, movie_fps, audio, subtitles, duration, crf=quality.crf,
+                      preset=quality.preset, output_size=scaled_size(frames.size, quality.scale),
+                      renditions=outputs) as writer:
+        for img in stream:
+            writer.write(img)
+    finish_renditions(output_file, outputs)
+    tracing.annotate(frames=len(frames) - len(frames.skipped), quality=quality.name, renditions=len(outputs))
+
+
+@tracing.traced('make_movie_segmented')
+def make_movie_segmented(processed_files_directory='files/', fps=5, WITH_SUBTITLES=False, WITH_AUDIO=False,
+                         mismatch='resize', audio_crossfade=0.0, subtitles_file=None, audio_file=None,
+                         output_file=None, frame_crossfade=None, quality=FINAL, renditions=(), progress=no_progress):
+    """
+    Create the final movie incrementally: the movie is encoded in segments of frames (see cim.segments), and only
+    the segments whose frames, timing or subtitles changed since the last render are encoded again - adding a frame
+    or editing a subtitle line re-encodes a few seconds of the movie rather than all of it.
+    The frames follow the directory's timeline (see cim.timeline): each frame can have its own duration and
+    crossfade into the next one, without duplicating frames. Otherwise it's the same movie as make_movie_single_pass.
+    :param processed_files_directory: The drawings/pictures that will be composited, and where the movie will be saved
+    :param fps: frames per second - the duration of the frames without a duration of their own
+    :param WITH_SUBTITLES: boolean
+    :param WITH_AUDIO: boolean
+    :param mismatch: what to do with frames whose size differs from the first frame - 'resize', 'skip' or 'error'
+    :param audio_crossfade: crossfade duration in seconds where the soundtrack loops
+    :param subtitles_file: subtitles file (srt or txt), None for the directory's subtitles.srt/subtitles.txt
+    :param audio_file: soundtrack file, None for the directory's audio.mp3
+    :param output_file: the movie's path, None for the directory's final_movie.mp4 (draft_movie.mp4 for a draft)
+    :param frame_crossfade: crossfade between all the frames in seconds, None for the timeline's crossfade
+    :param quality: cim.encoder.RenderQuality - FINAL, or DRAFT for a quick low-resolution movie
+    :param renditions: names of smaller renditions of the final movie (see cim.encoder.LADDER) - encoded from the
+                       assembled movie, all of them from a single decoding of it
+    :param progress: progress reporter wrapping an iterable, e.g. tqdm.tqdm
+    :return:
+    """
+    # Sort files in processed images directory, keep jpg files only. The manifest knows their sizes and contents.
+    kept, size = kept_frames(processed_files_directory, mismatch)
+    frames = [(file, entry['hash']) for file, entry in kept]
+    # Each frame's duration and crossfade, the subtitles and the soundtrack follow the timeline's duration
+    timeline = Timeline(processed_files_directory)
+    if frame_crossfade is not None:
+        timeline.crossfade = frame_crossfade
+    shots = timeline.shots([file for file, _ in frames], [h for _, h in frames], fps, size)
+    duration = sum(shot.duration for shot in shots)
+    cues, audio = soundtrack_and_subtitles(processed_files_directory, duration, WITH_SUBTITLES, WITH_AUDIO,
+                                           audio_crossfade, subtitles_file, audio_file)
+
+    output_file = output_file or os.path.join(processed_files_directory, '%s_movie.mp4' % quality.name)
+    # A draft's segments are kept apart from the final movie's
+    renderer = SegmentRenderer(processed_files_directory, scaled_size(size, quality.scale), crf=quality.crf,
+                               preset=quality.preset, cache=None if quality == FINAL else quality.name)
+    encoded, reused = renderer.render(thin_shots(shots, quality.step), cues, output_file, audio, progress)
+    tracing.annotate(frames=len(frames), segments_encoded=encoded, segments_reused=reused, quality=quality.name)
+    if renditions and quality == FINAL:
+        encode_renditions(output_file, renditions)
@@ -0,0 +1,68 @@
+######################### PROJECT CIM - worker process pools
+######################### The process pools of the CPU-bound stages (ingestion, frame effects), started once per process
+
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+_pools = {} # number of workers -> pool
+_lock = threading.Lock()
+
+
+def worker_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    The process' pool of worker processes of the given size, started on first use and kept for the process' lifetime
+    :param max_workers: number of worker processes
+    :return: ProcessPoolExecutor
+    """
+    with _lock:
+        pool = _pools.get(max_workers)
+        if pool is None:
+            # spawn: the workers shouldn't inherit the streamlit server's threads
+            pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+            _pools[max_workers] = pool
+        return pool
+
+
+def discard_pool(pool: ProcessPoolExecutor, wait=False):
+    """
+    Forget a pool that can't run tasks any more (a worker died) or isn't needed any more, so the next worker_pool call
+    starts a new one
+    :param pool: the pool
+    :param wait: True to wait until the pool's workers exited
+    :return:
+    """
+    with _lock:
+        for max_workers, cached in list(_pools.items()):
+            if cached is pool:
+                del _pools[max_workers]
+    pool.shutdown(wait=wait)
+
+
+def map_in_order(func, tasks, pool: ProcessPoolExecutor, window: int):
+    """
+    Run func(*task) for every task on a pool, with at most `window` tasks submitted and not yet delivered - so only
+    a few tasks' arguments and results are held in memory
+    :param func: a module-level function
+    :param tasks: iterable of argument tuples, consumed as the tasks are submitted
+    :param pool: ProcessPoolExecutor, e.g. worker_pool(n)
+    :param window: maximum number of tasks in flight
+    :return: generator of the results, in the tasks' order, as soon as each is ready
+    """
+    pending = deque()
+    try:
+        for task in tasks:
+            pending.append(pool.submit(func, *task))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    except BrokenProcessPool:
+        discard_pool(pool)
+        raise
+    finally: # the results aren't wanted any more, e.g. the encode failed
+        for future in pending:
+            future.cancel()
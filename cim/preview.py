@@ -0,0 +1,170 @@
+######################### PROJECT CIM - movie preview proxy, poster and renditions
+######################### A small, low-bitrate copy of the movie and a poster thumbnail are made once per movie,
+######################### so watching the movie doesn't load the full quality movie into memory; the movie's
+######################### renditions (720p, 480p, animated thumbnail...) are encoded along with it
+
+import os
+import subprocess
+
+from cim import tracing
+from cim.encoder import ffmpeg_binary, FFmpegError, LADDER, select_renditions, rendition_filter, \
+    rendition_arguments
+
+
+def preview_paths(movie: str) -> tuple:
+    """
+    :param movie: the movie's path, e.g. files/final_movie.mp4
+    :return: the paths of the movie's preview proxy and poster, e.g. files/.preview/final_movie.mp4 and
+             files/.preview/final_movie.jpg - in a hidden directory, so the poster isn't taken for a frame
+    """
+    directory, name = os.path.split(movie)
+    stem = os.path.join(directory, '.preview', os.path.splitext(name)[0])
+    return stem + '.mp4', stem + '.jpg'
+
+
+def _is_fresh(path: str, movie_mtime: float) -> bool:
+    # A preview gets the movie's modification time when it's made, so it's fresh as long as the movie didn't change
+    return os.path.isfile(path) and os.stat(path).st_mtime == movie_mtime
+
+
+def _run_ffmpeg(arguments: list, ffmpeg=None):
+    try:
+        result = subprocess.run([ffmpeg or ffmpeg_binary(), '-y', '-loglevel', 'error'] + arguments,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    except OSError as e: # ffmpeg couldn't be started
+        raise FFmpegError("ffmpeg couldn't be started: %s" % e)
+    if result.returncode != 0:
+        raise FFmpegError(result.stderr.decode(errors='replace').strip())
+
+
+@tracing.traced('make_preview')
+def make_preview(movie: str, height=360, crf=32, poster_height=180, force=False, ffmpeg=None) -> tuple:
+    """
+    Make the movie's preview proxy (low resolution, low bitrate H.264) and its poster (the first frame),
+    unless they were already made from the current movie
+    :param movie: the movie's path
+    :param height: the preview's maximum height, the width keeps the aspect ratio
+    :param crf: the preview's H.264 constant rate factor - higher is smaller
+    :param poster_height: the poster's maximum height
+    :param force: True to make them again even if they're up to date
+    :param ffmpeg: the ffmpeg executable, None to use the one moviepy uses
+    :return: the preview's path, the poster's path
+    """
+    preview, poster = preview_paths(movie)
+    movie_mtime = os.stat(movie).st_mtime
+    if not os.path.exists(os.path.dirname(preview)):
+        os.makedirs(os.path.dirname(preview))
+    outputs = []
+    if force or not _is_fresh(preview, movie_mtime):
+        # Never upscale; the dimensions must be even for yuv420p
+        scale = "scale=-2:'min(%s,trunc(ih/2)*2)'" % height
+        _run_ffmpeg(['-i', movie, '-vf', scale, '-c:v', 'libx264', '-preset', 'veryfast', '-crf', str(crf),
+                     '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-b:a', '64k', '-movflags', '+faststart',
+                     preview + '.part.mp4'], ffmpeg)
+        outputs.append(preview)
+    if force or not _is_fresh(poster, movie_mtime):
+        _run_ffmpeg(['-i', movie, '-frames:v', '1', '-vf', "scale=-2:'min(%s,ih)'" % poster_height,
+                     '-q:v', '4', '-update', '1', poster + '.part.jpg'], ffmpeg)
+        outputs.append(poster)
+    # Replaced at once, so a viewer never gets a half written preview
+    for path in outputs:
+        os.replace(path + '.part' + os.path.splitext(path)[1], path)
+        os.utime(path, (movie_mtime, movie_mtime))
+    return preview, poster
+
+
+def rendition_path(movie: str, rendition) -> str:
+    """
+    :param movie: the movie's path, e.g. files/final_movie.mp4
+    :param rendition: cim.encoder.Rendition
+    :return: the rendition's path, e.g. files/.renditions/final_movie_480p.mp4
+    """
+    directory, name = os.path.split(movie)
+    return os.path.join(directory, '.renditions', '%s_%s.%s' % (os.path.splitext(name)[0], rendition.name,
+                                                               rendition.format))
+
+
+def rendition_outputs(movie: str, names, height: int) -> list:
+    """
+    Where the renditions of a movie that's about to be encoded are written: the renditions are written as .part files,
+    which finish_renditions puts in place once the movie is done
+    :param movie: the movie's path
+    :param names: the wanted renditions' names (see cim.encoder.LADDER)
+    :param height: the movie's height - only smaller renditions are made
+    :return: list of (Rendition, part file path)
+    """
+    outputs = [(rendition, rendition_path(movie, rendition) + '.part')
+               for rendition in select_renditions(names, height)]
+    if outputs and not os.path.exists(os.path.dirname(outputs[0][1])):
+        os.makedirs(os.path.dirname(outputs[0][1]))
+    return outputs
+
+
+def finish_renditions(movie: str, outputs: list) -> list:
+    """
+    Put the renditions in place once the movie is done, marked with the movie's modification time
+    :param movie: the movie's path
+    :param outputs: list of (Rendition, part file path), as returned by rendition_outputs
+    :return: the renditions' paths
+    """
+    movie_mtime = os.stat(movie).st_mtime
+    paths = []
+    for rendition, part in outputs:
+        path = part[:-len('.part')]
+        os.replace(part, path)
+        os.utime(path, (movie_mtime, movie_mtime))
+        paths.append(path)
+    return paths
+
+
+@tracing.traced('encode_renditions')
+def encode_renditions(movie: str, names, preset='medium', ffmpeg=None) -> list:
+    """
+    Encode the renditions of an existing movie (e.g. one rendered by the incremental or the two-stage rendering),
+    all of them from a single decoding of the movie
+    :param movie: the movie's path
+    :param names: the wanted renditions' names (see cim.encoder.LADDER)
+    :param preset: H.264 encoder preset
+    :param ffmpeg: the ffmpeg executable, None to use the one moviepy uses
+    :return: the renditions' paths
+    """
+    import cv2
+    capture = cv2.VideoCapture(movie)
+    height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    capture.release()
+    outputs = rendition_outputs(movie, names, height)
+    if not outputs:
+        return []
+    graph = ['[0:v]split=%d%s' % (len(outputs), ''.join('[r%d]' % i for i in range(len(outputs))))]
+    arguments = []
+    for i, (rendition, part) in enumerate(outputs):
+        rendition_graph, label = rendition_filter('[r%d]' % i, rendition, i)
+        graph.append(rendition_graph)
+        arguments += rendition_arguments(rendition, label, part, ['-map', '0:a?', '-c:a', 'copy'], preset)
+    _run_ffmpeg(['-i', movie, '-filter_complex', ';'.join(graph)] + arguments, ffmpeg)
+    tracing.annotate(renditions=len(outputs))
+    return finish_renditions(movie, outputs)
+
+
+def available_renditions(movie: str) -> list:
+    """
+    :param movie: the movie's path
+    :return: list of (Rendition, path) of the renditions made from the current movie, in the ladder's order
+    """
+    if not os.path.isfile(movie):
+        return []
+    movie_mtime = os.stat(movie).st_mtime
+    return [(rendition, rendition_path(movie, rendition)) for rendition in LADDER.values()
+            if _is_fresh(rendition_path(movie, rendition), movie_mtime)]
+
+
+def cached_preview(movie: str):
+    """
+    :param movie: the movie's path
+    :return: the preview's and poster's paths if they're up to date with the movie, else None
+    """
+    if not os.path.isfile(movie):
+        return None
+    movie_mtime = os.stat(movie).st_mtime
+    paths = preview_paths(movie)
+    return paths if all(_is_fresh(path, movie_mtime) for path in paths) else None
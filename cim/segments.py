@@ -0,0 +1,210 @@
+######################### PROJECT CIM - incremental segment rendering
+######################### The movie is encoded as independent segments, each kept under a key of its inputs, and
+######################### assembled by stream copy - only the segments whose frames or subtitles changed are encoded
+
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+from collections import namedtuple
+
+from cim.encoder import ffmpeg_binary, vfr_arguments, FFmpegError, _filter_path
+from cim.subtitles import Cue, write_srt
+
+
+DIRECTORY = '.segments' # hidden, so the frame manifest ignores it
+# The segments' timestamps are exact to 1/90000 of a second
+TIMESCALE = 90000
+
+# A frame shown for `duration` seconds; `key` identifies its content (e.g. the manifest's content hash)
+Shot = namedtuple('Shot', ['file', 'key', 'duration'])
+
+
+def split_segments(shots: list, average=16, minimum=4, maximum=48) -> list:
+    """
+    Split the shots into segments at content-defined boundaries: a segment ends after a shot whose key hashes to
+    a boundary, so inserting or removing a frame only changes the segment around it, not every following segment.
+    :param shots: list of Shot
+    :param average: average number of shots per segment
+    :param minimum: minimum number of shots per segment
+    :param maximum: maximum number of shots per segment
+    :return: list of segments - lists of consecutive shots
+    """
+    segments, current = [], []
+    for shot in shots:
+        current.append(shot)
+        boundary = int(hashlib.sha1(str(shot.key).encode()).hexdigest()[:8], 16) % average == 0
+        if len(current) >= maximum or (boundary and len(current) >= minimum):
+            segments.append(current)
+            current = []
+    if current:
+        segments.append(current)
+    return segments
+
+
+def thin_shots(shots: list, step: int) -> list:
+    """
+    Keep every step-th shot, shown for the duration of the shots it replaces (e.g. for a quick draft)
+    :param shots: list of Shot
+    :param step: 1 keeps all the shots
+    :return: list of Shot with the same total duration
+    """
+    if step <= 1:
+        return shots
+    return [shots[i]._replace(duration=sum(shot.duration for shot in shots[i:i + step]))
+            for i in range(0, len(shots), step)]
+
+
+def _quote(path: str) -> str:
+    # ffconcat file names are quoted with single quotes
+    return "'%s'" % os.path.abspath(path).replace('\\', '/').replace("'", "'\\''")
+
+
+def _local_cues(cues: list, start: float, end: float) -> list:
+    """
+    :return: the cues shown between start and end, with times relative to start
+    """
+    return [Cue(max(cue.start, start) - start, min(cue.end, end) - start, cue.text)
+            for cue in cues if cue.start < end and cue.end > start]
+
+
+class SegmentRenderer:
+    """
+    Renders a list of shots into a movie, segment by segment. Every segment is encoded on its own (H.264 without
+    B-frames, so the segments can be joined by stream copy) with its subtitles burnt in, and is kept in the
+    directory's .segments subdirectory under a key of everything it's made of. Rendering the movie again only
+    encodes the segments whose frames, durations or subtitles changed, then joins all the segments and muxes the
+    soundtrack - neither of which re-encodes the video.
+    Usage:
+        renderer = SegmentRenderer('files', (512, 512))
+        renderer.render(shots, cues, 'files/final_movie.mp4', audio='files/audio.mp3')
+    """
+
+    def __init__(self, directory: str, size: tuple, crf=23, preset='medium',
+                 subtitles_style='Fontsize=24,PrimaryColour=&H0000FFFF', ffmpeg=None, cache=None):
+        """
+        :param directory: the frames' directory - the segments are kept in its .segments subdirectory
+        :param size: the movie's (width, height), frames of other sizes are resized
+        :param crf: H.264 constant rate factor - lower is better quality
+        :param preset: H.264 encoder preset - faster presets encode faster but produce bigger files
+        :param subtitles_style: libass style of the burnt subtitles (yellow by default, like the TextClip subtitles)
+        :param ffmpeg: the ffmpeg executable, None to use the one moviepy uses
+        :param cache: a subdirectory of .segments for these segments, so the segments of differently rendered movies
+                      (e.g. the draft and the final movie) don't evict each other
+        """
+        self.path = os.path.join(directory, DIRECTORY, cache) if cache else os.path.join(directory, DIRECTORY)
+        # yuv420p (needed by most players) requires even dimensions
+        self.size = (size[0] // 2 * 2, size[1] // 2 * 2)
+        self.crf = crf
+        self.preset = preset
+        self.subtitles_style = subtitles_style
+        self.ffmpeg = ffmpeg or ffmpeg_binary()
+        self.encoded = 0 # number of segments encoded by the last render
+        self.reused = 0 # number of segments reused by the last render
+
+    def _run(self, arguments: list, what: str):
+        try:
+            result = subprocess.run([self.ffmpeg, '-y', '-loglevel', 'error'] + arguments,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except OSError as e: # ffmpeg isn't installed
+            raise FFmpegError("Can't start ffmpeg: %s" % e)
+        if result.returncode != 0:
+            raise FFmpegError("ffmpeg failed to %s: %s" % (what, result.stderr.decode(errors='replace').strip()[-1000:]))
+
+    def _key(self, shots: list, cues: list, last: bool) -> str:
+        content = [1, self.size, self.crf, self.preset, self.subtitles_style, last,
+                   [[shot.key, round(shot.duration, 6)] for shot in shots],
+                   [[round(cue.start, 3), round(cue.end, 3), cue.text] for cue in cues]]
+        return hashlib.sha1(json.dumps(content).encode()).hexdigest()
+
+    def _encode(self, shots: list, cues: list, last: bool, path: str):
+        """
+        Encode one segment: the shots' images are read by ffmpeg's concat demuxer, each shown for its own duration
+        (variable frame rate - a long shot is still a single frame)
+        """
+        with tempfile.TemporaryDirectory(dir=self.path) as work:
+            lines = ['ffconcat version 1.0']
+            for shot in shots:
+                # framerate: the images' timestamps get the fine timescale (the default 1/25 s would round them)
+                lines += ['file %s' % _quote(shot.file), 'option framerate %s' % TIMESCALE,
+                          'duration %.6f' % shot.duration]
+            if last: # the concat demuxer ignores the last file's duration, unless it's listed once more
+                lines += ['file %s' % _quote(shots[-1].file), 'option framerate %s' % TIMESCALE]
+            listing = os.path.join(work, 'shots.ffconcat')
+            with open(listing, 'w', encoding='utf8') as f:
+                f.write('\n'.join(lines) + '\n')
+            filters = ['scale=%d:%d' % self.size]
+            if cues:
+                subtitles = os.path.join(work, 'cues.srt')
+                write_srt(cues, subtitles)
+                filters.append('subtitles=%s:force_style=%s' % (_filter_path(subtitles),
+                                                                _filter_path(self.subtitles_style)))
+            # Each image keeps its own timestamp (variable frame rate)
+            vfr = vfr_arguments(self.ffmpeg)
+            self._run(['-f', 'concat', '-safe', '0', '-i', listing, '-vf', ','.join(filters)] + vfr +
+                      ['-c:v', 'libx264', '-preset', self.preset, '-crf', str(self.crf), '-bf', '0',
+                       '-pix_fmt', 'yuv420p', '-video_track_timescale', str(TIMESCALE), '-an',
+                       '-f', 'mp4', path + '.part'], "encode the segment %s" % os.path.basename(path))
+        os.replace(path + '.part', path)
+
+    def render(self, shots: list, cues: list, output: str, audio=None, progress=None):
+        """
+        Render the movie
+        :param shots: list of Shot, in the movie's order
+        :param cues: the subtitles - list of Cue, in the movie's time
+        :param output: the movie's path (mp4)
+        :param audio: soundtrack file, looped if it's shorter than the movie and trimmed to its duration;
+                      None for a silent movie
+        :param progress: progress reporter wrapping an iterable, e.g. tqdm.tqdm
+        :return: number of encoded segments, number of reused segments
+        """
+        if not shots:
+            raise ValueError("There are no frames")
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        segments = split_segments(shots)
+        self.encoded = self.reused = 0
+        plan, start = [], 0.0
+        for i, segment in enumerate(segments):
+            duration = sum(shot.duration for shot in segment)
+            last = i == len(segments) - 1
+            local_cues = _local_cues(cues, start, start + duration)
+            path = os.path.join(self.path, self._key(segment, local_cues, last) + '.mp4')
+            plan.append((segment, local_cues, last, path, duration))
+            start += duration
+        for segment, local_cues, last, path, duration in progress(plan, total=len(plan)) if progress else plan:
+            if os.path.isfile(path):
+                os.utime(path) # recently used
+                self.reused += 1
+            else:
+                self._encode(segment, local_cues, last, path)
+                self.encoded += 1
+
+        # Join the segments by stream copy; each one starts exactly where the previous one's duration ends
+        with tempfile.TemporaryDirectory(dir=self.path) as work:
+            listing = os.path.join(work, 'segments.ffconcat')
+            with open(listing, 'w', encoding='utf8') as f:
+                f.write('ffconcat version 1.0\n')
+                for segment, local_cues, last, path, duration in plan:
+                    f.write('file %s\n' % _quote(path) + ('' if last else 'duration %.6f\n' % duration))
+            command = ['-f', 'concat', '-safe', '0', '-i', listing]
+            if audio is not None:
+                command += ['-stream_loop', '-1', '-i', audio, '-map', '0:v', '-map', '1:a', '-c:a', 'aac',
+                            '-t', '%.6f' % start]
+            self._run(command + ['-c:v', 'copy', '-movflags', '+faststart', output], "join the segments")
+        self._forget_unused(set(path for _, _, _, path, _ in plan), keep=len(plan))
+        return self.encoded, self.reused
+
+    def _forget_unused(self, used: set, keep: int):
+        """
+        Remove the oldest segments that this render didn't use, keeping at most `keep` of them for going back
+        to an earlier version of the movie
+        """
+        unused = []
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.name.endswith('.mp4') and entry.path not in used:
+                    unused.append((entry.stat().st_mtime, entry.path))
+        for _, path in sorted(unused)[:max(0, len(unused) - keep)]:
+            os.remove(path)
@@ -0,0 +1,200 @@
+######################### PROJECT CIM - subtitles
+######################### Timed subtitle cues, SRT files, and burning subtitles into frames
+
+import bisect
+import os
+import re
+from collections import namedtuple
+import numpy as np
+
+
+# A subtitle line shown from start to end (in seconds)
+Cue = namedtuple('Cue', ['start', 'end', 'text'])
+
+
+def cues_from_lines(lines: list, duration: float) -> list:
+    """
+    Split the movie into equal slices, one for each subtitle line - the way the subtitles.txt file is used.
+    :param lines: the subtitle lines - blank lines are left out
+    :param duration: the movie's duration in seconds
+    :return: list of Cue
+    """
+    lines = [line for line in lines if line.strip()]
+    if not lines:
+        return []
+    slice_duration = duration / len(lines)
+    return [Cue(i * slice_duration, (i + 1) * slice_duration, line) for i, line in enumerate(lines)]
+
+
+def parse_srt(text: str) -> list:
+    """
+    Read subtitle cues from the content of a SRT file
+    :param text: the SRT file content
+    :return: list of Cue, sorted by start time
+    """
+    timing = re.compile(r'(\d+):(\d+):(\d+)[,.](\d+)\s*-->\s*(\d+):(\d+):(\d+)[,.](\d+)')
+    cues = []
+    # Cues are separated by blank lines: index line, timing line, then one or more text lines
+    for block in re.split(r'\n\s*\n', text.lstrip('\ufeff').replace('\r\n', '\n').strip()):
+        lines = block.split('\n')
+        for i, line in enumerate(lines):
+            match = timing.search(line)
+            if match:
+                h1, m1, s1, ms1, h2, m2, s2, ms2 = (int(x) for x in match.groups())
+                start = h1 * 3600 + m1 * 60 + s1 + ms1 / 1000
+                end = h2 * 3600 + m2 * 60 + s2 + ms2 / 1000
+                cues.append(Cue(start, end, '\n'.join(lines[i + 1:]).strip()))
+                break
+    return sorted(cues)
+
+
+def read_subtitles(path: str, duration: float) -> list:
+    """
+    Read subtitle cues from a file: timed cues from a .srt file, or lines shown for equal slices of the movie
+    from any other (text) file.
+    :param path: the subtitles file
+    :param duration: the movie's duration in seconds
+    :return: list of Cue
+    """
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        content = f.read()
+    if path.lower().endswith('.srt'):
+        return parse_srt(content)
+    return cues_from_lines(content.split('\n'), duration)
+
+
+def load_subtitles(directory: str, duration: float) -> list:
+    """
+    Load the movie's subtitles: a timed subtitles.srt file if there is one, else the lines of subtitles.txt
+    shown for equal slices of the movie.
+    :param directory: the directory containing the subtitles file
+    :param duration: the movie's duration in seconds
+    :return: list of Cue
+    """
+    srt_path = os.path.join(directory, 'subtitles.srt')
+    if os.path.isfile(srt_path):
+        return read_subtitles(srt_path, duration)
+    return read_subtitles(os.path.join(directory, 'subtitles.txt'), duration)
+
+
+def format_timestamp(seconds: float) -> str:
+    """
+    :param seconds: time in seconds
+    :return: the time in SRT format - HH:MM:SS,mmm
+    """
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return '%02d:%02d:%02d,%03d' % (hours, minutes, seconds, milliseconds)
+
+
+def write_srt(cues: list, path: str):
+    """
+    Save subtitle cues as a SRT file
+    :param cues: list of Cue - cues without text are left out (players handle empty cues badly)
+    :param path: the SRT file path
+    :return:
+    """
+    with open(path, 'w', encoding='utf8') as f:
+        for i, cue in enumerate(cue for cue in cues if cue.text.strip()):
+            f.write('%s\n%s --> %s\n%s\n\n' % (i + 1, format_timestamp(cue.start), format_timestamp(cue.end), cue.text))
+
+
+def _load_font(fontsize: int, font=None):
+    from PIL import ImageFont
+    for name in ([font] if font else []) + ['calibri.ttf', 'arial.ttf', 'DejaVuSans.ttf']:
+        try:
+            return ImageFont.truetype(name, fontsize)
+        except OSError:
+            pass
+    try:
+        return ImageFont.load_default(size=fontsize)
+    except TypeError: # older Pillow versions have a single fixed-size default font
+        return ImageFont.load_default()
+
+
+class SubtitleRenderer:
+    """
+    Burns timed subtitle cues into frames.
+    Every cue is rasterized once into an alpha mask, and then alpha-blended onto the bottom of the frames
+    it's shown on using whole-array operations - the cost per frame doesn't depend on the number of cues.
+    Usage:
+        renderer = SubtitleRenderer(cues, (width, height))
+        frame = renderer.apply(frame, t)
+    """
+
+    def __init__(self, cues: list, size: tuple, fontsize=30, color=(255, 255, 0), font=None, bgr=False, margin=10):
+        """
+        :param cues: list of Cue
+        :param size: frames' (width, height)
+        :param fontsize: font size in pixels
+        :param color: the text's RGB color (yellow by default)
+        :param font: TrueType font file, None to use Calibri or the first available fallback font
+        :param bgr: True if the frames are BGR (cv2) rather than RGB (moviepy)
+        :param margin: distance in pixels between the text and the bottom of the frame
+        """
+        self.cues = sorted(cues)
+        self.size = tuple(size)
+        self.font = _load_font(fontsize, font)
+        self.color = np.array(color[::-1] if bgr else color, np.float32)
+        self.margin = margin
+        self._starts = [cue.start for cue in self.cues]
+        # Cues starting earlier than the longest cue's duration before t can't be shown at t
+        self._longest = max((cue.end - cue.start for cue in self.cues), default=0)
+        self._rasterized = {}
+
+    def _rasterize(self, text: str):
+        """
+        Draw the text once and keep its position, alpha mask and premultiplied color
+        """
+        from PIL import Image, ImageDraw, features
+        # Without libraqm, Pillow lays out Hebrew left to right - reverse it, like the TextClip subtitles did
+        if not features.check('raqm') and re.search('[\u0590-\u05ff]', text):
+            text = '\n'.join(line[::-1] for line in text.split('\n'))
+        width, height = self.size
+        left, top, right, bottom = ImageDraw.Draw(Image.new('L', (1, 1))).multiline_textbbox(
+            (0, 0), text, font=self.font, align='center')
+        left, top, right, bottom = int(np.floor(left)), int(np.floor(top)), int(np.ceil(right)), int(np.ceil(bottom))
+        mask = Image.new('L', (max(1, right - left), max(1, bottom - top)))
+        ImageDraw.Draw(mask).multiline_text((-left, -top), text, font=self.font, fill=255, align='center')
+        alpha = np.asarray(mask, np.float32)[:, :, None] / 255
+        # Crop text that doesn't fit in the frame, then place it at the bottom center
+        alpha = alpha[:max(1, height - self.margin), :width]
+        h, w = alpha.shape[:2]
+        y, x = max(0, height - self.margin - h), (width - w) // 2
+        return y, x, 1 - alpha, alpha * self.color
+
+    def cue_at(self, t: float):
+        """
+        :param t: time in seconds
+        :return: the Cue shown at time t - overlapping cues are joined into one, a line each - None if there isn't any
+        """
+        first = bisect.bisect_left(self._starts, t - self._longest)
+        active = [cue for cue in self.cues[first:bisect.bisect_right(self._starts, t)]
+                  if t < cue.end and cue.text.strip()]
+        if not active:
+            return None
+        if len(active) == 1:
+            return active[0]
+        return Cue(max(cue.start for cue in active), min(cue.end for cue in active),
+                   '\n'.join(cue.text for cue in active))
+
+    def apply(self, frame: np.array, t: float) -> np.array:
+        """
+        Burn the subtitle shown at time t into the frame
+        :param frame: uint8 numpy array with the dimensions height x width x 3
+        :param t: the frame's time in seconds
+        :return: the frame with the subtitle
+        """
+        cue = self.cue_at(t)
+        if cue is None or not cue.text.strip():
+            return frame
+        if cue.text not in self._rasterized:
+            self._rasterized[cue.text] = self._rasterize(cue.text)
+        y, x, inverse_alpha, overlay = self._rasterized[cue.text]
+        h, w = overlay.shape[:2]
+        frame = np.array(frame) # frames may be read-only
+        roi = frame[y:y + h, x:x + w]
+        roi[...] = roi * inverse_alpha + overlay
+        return frame
@@ -0,0 +1,35 @@
+######################### PROJECT CIM - synthetic inputs
+######################### Drawings and photos made up from a random generator, for the benchmark and the offline checks
+
+import numpy as np
+
+
+def synthetic_drawing(colors: dict, size: int, rng) -> np.array:
+    """
+    A canvas-like RGBA drawing: transparent background with a few filled label-colored rectangles
+    :param colors: GauGAN colors dictionary
+    :param size: the drawing's height and width
+    :param rng: numpy random generator
+    :return: uint8 numpy array with the dimensions size x size x 4
+    """
+    drawing = np.zeros((size, size, 4), np.uint8)
+    palette = list(colors.values())
+    for _ in range(8):
+        y, x = rng.integers(0, size, 2)
+        h, w = rng.integers(size // 10, size // 3, 2)
+        drawing[y:y + h, x:x + w, :3] = palette[rng.integers(len(palette))]
+        drawing[y:y + h, x:x + w, 3] = 255
+    return drawing
+
+
+def synthetic_photo(size: int, rng) -> np.array:
+    """
+    A photo-like RGB image: smooth gradients plus noise
+    :param size: the photo's height and width
+    :param rng: numpy random generator
+    :return: uint8 numpy array with the dimensions size x size x 3
+    """
+    rows, columns = np.mgrid[0:size, 0:size].astype(np.float32) * (255 / size)
+    photo = np.stack([rows, columns, np.full((size, size), rng.integers(256), np.float32)], axis=2)
+    photo += rng.normal(0, 12, photo.shape)
+    return np.clip(photo, 0, 255).astype(np.uint8)
@@ -0,0 +1,124 @@
+######################### PROJECT CIM - movie timeline
+######################### Every frame has its own display duration and an optional crossfade into the next frame
+
+import hashlib
+import json
+import os
+
+from cim.segments import Shot
+
+
+class Timeline:
+    """
+    The frames' timing, kept in a small JSON file inside the frames' directory. A frame is shown for 1/fps seconds
+    unless it has its own duration, and may crossfade into the next frame (the crossfade takes the end of the
+    frame's duration, so the movie's duration doesn't change).
+    A long hold is still a single frame in the movie (see cim.segments), and the subtitles and the soundtrack follow
+    the timeline's duration.
+    """
+
+    FILENAME = '.timeline.json'
+    BLENDS = '.timeline' # the crossfades' blended frames, hidden from the frame manifest
+
+    def __init__(self, directory: str):
+        """
+        :param directory: the frames' directory
+        """
+        self.directory = directory
+        self.path = os.path.join(directory, self.FILENAME)
+        try:
+            with open(self.path, 'r') as f:
+                content = json.load(f)
+        except (OSError, ValueError):
+            content = {}
+        self.crossfade = content.get('crossfade', 0.0) # between all the frames
+        self.frames = content.get('frames', {}) # frame name -> {'duration': seconds, 'crossfade': seconds}
+
+    def save(self):
+        with open(self.path + '.part', 'w') as f:
+            json.dump({'crossfade': self.crossfade, 'frames': self.frames}, f)
+        os.replace(self.path + '.part', self.path)
+
+    def set(self, name: str, duration=None, crossfade=None):
+        """
+        Set a frame's timing and save the timeline
+        :param name: the frame's file name
+        :param duration: seconds the frame is shown, None for 1/fps
+        :param crossfade: seconds of crossfade into the next frame, None for the timeline's crossfade
+        :return:
+        """
+        settings = {key: value for key, value in (('duration', duration), ('crossfade', crossfade))
+                    if value is not None}
+        if settings:
+            self.frames[name] = settings
+        else:
+            self.frames.pop(name, None)
+        self.save()
+
+    @property
+    def customized(self) -> bool:
+        """
+        :return: True if any frame isn't shown for exactly 1/fps seconds without crossfade
+        """
+        return self.crossfade > 0 or bool(self.frames)
+
+    def timing(self, name: str, fps: float) -> tuple:
+        """
+        :param name: the frame's file name
+        :param fps: frames per second - the default duration is 1/fps
+        :return: the frame's duration, its crossfade into the next frame (at most its duration)
+        """
+        settings = self.frames.get(name, {})
+        duration = settings.get('duration', 1 / fps)
+        return duration, min(settings.get('crossfade', self.crossfade), duration)
+
+    def shots(self, files: list, hashes: list, fps: float, size: tuple, transition_fps=25) -> list:
+        """
+        The timeline as shots (see cim.segments.Shot): a shot per frame, plus the blended frames of the crossfades
+        :param files: the frames' paths, in the movie's order
+        :param hashes: the frames' content hashes
+        :param fps: frames per second - the default duration is 1/fps
+        :param size: the movie's (width, height)
+        :param transition_fps: the number of blended frames per second of crossfade
+        :return: list of Shot, whose durations add up to the movie's duration
+        """
+        shots, used = [], set()
+        for i, (file, file_hash) in enumerate(zip(files, hashes)):
+            duration, crossfade = self.timing(os.path.basename(file), fps)
+            steps = int(round(crossfade * transition_fps)) if i + 1 < len(files) else 0
+            if steps == 0: # no crossfade, or it's the last frame
+                shots.append(Shot(file, file_hash, duration))
+                continue
+            if duration > crossfade:
+                shots.append(Shot(file, file_hash, duration - crossfade))
+            for step in range(1, steps + 1):
+                blend = self._blend(file, files[i + 1], file_hash, hashes[i + 1], step / (steps + 1), size)
+                used.add(os.path.basename(blend.file))
+                shots.append(blend._replace(duration=crossfade / steps))
+        self._forget_unused(used)
+        return shots
+
+    def _blend(self, first: str, second: str, first_hash: str, second_hash: str, weight: float, size: tuple) -> Shot:
+        """
+        A frame between two frames, made once and kept in the timeline's blends directory
+        :param weight: the second frame's weight (0-1)
+        :return: Shot of the blended frame, without duration
+        """
+        import cv2
+        key = hashlib.sha1(json.dumps([first_hash, second_hash, round(weight, 6), list(size)]).encode()).hexdigest()
+        path = os.path.join(self.directory, self.BLENDS, key + '.jpg')
+        if not os.path.isfile(path):
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            images = [cv2.resize(cv2.imread(file), tuple(size)) for file in (first, second)]
+            cv2.imwrite(path + '.part.jpg', cv2.addWeighted(images[0], 1 - weight, images[1], weight, 0))
+            os.replace(path + '.part.jpg', path)
+        return Shot(path, key, None)
+
+    def _forget_unused(self, used: set):
+        directory = os.path.join(self.directory, self.BLENDS)
+        if not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            if name not in used:
+                os.remove(os.path.join(directory, name))
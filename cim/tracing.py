@@ -0,0 +1,307 @@
+######################### PROJECT CIM - pipeline instrumentation
+######################### Records every stage's wall time, CPU time, bytes read/written, frame count and peak RSS
+######################### into a JSON-lines log and a Prometheus textfile, written every few seconds
+
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+_directory = os.environ.get('CIM_METRICS_DIR', 'metrics')
+_local = threading.local()
+_write_lock = threading.Lock()
+LOG_FILE = 'stages.jsonl'
+PROMETHEUS_FILE = 'cim.prom'
+# The Prometheus textfile is rebuilt from the end of the log
+_TAIL_BYTES = 256 * 1024
+# The stages are kept in memory and written at most this often (and at the end of a run, and at exit) - a stage
+# may be as short as an autosaved drawing
+FLUSH_SECONDS = 5.0
+_pending = [] # the stage records that weren't written yet
+_flushed = time.monotonic()
+
+
+def configure(directory):
+    """
+    :param directory: where the metrics are written, None to disable the metrics
+    :return: the previous directory
+    """
+    global _directory
+    flush() # the stages measured so far belong to the previous directory
+    previous, _directory = _directory, directory
+    return previous
+
+
+def _io_counters():
+    """
+    :return: the process' (bytes read, bytes written) so far, None where the platform doesn't tell
+    """
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        import psutil
+        counters = psutil.Process().io_counters()
+        return counters.read_bytes, counters.write_bytes
+    except (ImportError, AttributeError):
+        return None, None
+
+
+def _children_cpu():
+    """
+    :return: CPU time of the process' child processes (e.g. ffmpeg) that finished so far, None where the platform
+             doesn't tell
+    """
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _rss():
+    """
+    :return: the process' current resident set size in bytes, None where the platform doesn't tell
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+class _RSSSampler(threading.Thread):
+    """
+    Samples the process' RSS during a stage, to find the stage's peak
+    """
+
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = _rss()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            rss = _rss()
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        rss = _rss()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+        return self.peak
+
+
+def _stack() -> list:
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+@contextmanager
+def run(name: str):
+    """
+    Group the stages of one pipeline run (e.g. a render job), so they can be shown together
+    :param name: the run's name
+    """
+    previous = getattr(_local, 'run', None)
+    _local.run = {'id': uuid.uuid4().hex[:12], 'name': name}
+    try:
+        yield _local.run['id']
+    finally:
+        _local.run = previous
+        if previous is None: # the run's stages are shown as soon as it's over
+            flush()
+
+
+@contextmanager
+def stage(name: str, **attributes):
+    """
+    Measure a pipeline stage. Inside the stage, annotate(frames=...) adds information to it.
+    cpu_seconds is the CPU time of the stage's own thread. The other counters are the whole process': the CPU time of
+    all its threads (process_cpu_seconds) and of its child processes that finished, e.g. ffmpeg (children_cpu_seconds),
+    the bytes it read and wrote, and its peak RSS - they include whatever the process' other threads did meanwhile.
+    :param name: the stage's name
+    :param attributes: extra information recorded with the stage
+    """
+    if _directory is None:
+        yield attributes
+        return
+    record = dict(attributes)
+    stack = _stack()
+    stack.append(record)
+    current_run = getattr(_local, 'run', None) or {'id': uuid.uuid4().hex[:12], 'name': name}
+    read_before, written_before = _io_counters()
+    sampler = _RSSSampler()
+    sampler.start()
+    wall, cpu, process_cpu, children_cpu = time.perf_counter(), time.thread_time(), time.process_time(), _children_cpu()
+    try:
+        yield record
+    except BaseException:
+        record['status'] = 'error'
+        raise
+    finally:
+        # A stage that handles its own errors can annotate(status='error')
+        record.setdefault('status', 'ok')
+        record.update(stage=name, run=current_run['id'], run_name=current_run['name'], time=time.time(), wall_seconds=time.perf_counter() - wall,
+                      cpu_seconds=time.thread_time() - cpu, process_cpu_seconds=time.process_time() - process_cpu,
+                      peak_rss_bytes=sampler.stop(), pid=os.getpid())
+        children_after = _children_cpu()
+        if children_cpu is not None and children_after is not None:
+            record['children_cpu_seconds'] = children_after - children_cpu
+        read_after, written_after = _io_counters()
+        if read_before is not None and read_after is not None:
+            record.update(bytes_read=read_after - read_before, bytes_written=written_after - written_before)
+        stack.pop()
+        if stack: # a nested stage
+            record['parent'] = stack[-1].get('stage')
+        _write(record)
+
+
+def annotate(**attributes):
+    """
+    Add information (e.g. frames=120) to the stage currently being measured
+    :return:
+    """
+    stack = _stack()
+    if stack:
+        stack[-1].update(attributes)
+
+
+def traced(name: str):
+    """
+    Decorator measuring every call of a function as a stage
+    :param name: the stage's name
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _write(record: dict):
+    """
+    Keep the stage, and write the stages kept so far if they weren't written for FLUSH_SECONDS
+    """
+    with _write_lock:
+        _pending.append(record)
+        if time.monotonic() - _flushed >= FLUSH_SECONDS:
+            _flush()
+
+
+def flush():
+    """
+    Append the stages measured so far to the JSON-lines log and rebuild the Prometheus textfile
+    :return:
+    """
+    with _write_lock:
+        _flush()
+
+
+def _flush():
+    global _flushed
+    _flushed = time.monotonic()
+    if not _pending or _directory is None:
+        return
+    records = list(_pending)
+    _pending.clear()
+    try:
+        if not os.path.exists(_directory):
+            os.makedirs(_directory)
+        with open(os.path.join(_directory, LOG_FILE), 'a') as f:
+            f.write(''.join(json.dumps(record) + '\n' for record in records))
+        _write_prometheus(_read_tail())
+    except OSError: # metrics must never break the pipeline
+        pass
+
+
+atexit.register(flush)
+
+
+def read_records() -> list:
+    """
+    :return: the most recent stage records of the log, oldest first
+    """
+    flush() # including this process' latest stages
+    return _read_tail()
+
+
+def _read_tail() -> list:
+    if _directory is None:
+        return []
+    try:
+        with open(os.path.join(_directory, LOG_FILE), 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - _TAIL_BYTES))
+            lines = f.read().decode(errors='replace').splitlines()
+    except OSError:
+        return []
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError: # the first line may be cut in the middle
+            pass
+    return records
+
+
+def last_run() -> list:
+    """
+    :return: the stage records of the most recent run, in the order they finished
+    """
+    records = read_records()
+    if not records:
+        return []
+    run_id = records[-1]['run']
+    return [record for record in records if record['run'] == run_id]
+
+
+def _write_prometheus(records: list):
+    """
+    Write the latest measurement of every stage as Prometheus gauges (textfile collector format)
+    """
+    latest = {}
+    for record in records:
+        latest[record['stage']] = record
+    metrics = [('wall_seconds', 'Wall time of the stage\'s last run'),
+               ('cpu_seconds', 'CPU time of the stage\'s thread during the stage\'s last run'),
+               ('process_cpu_seconds', 'CPU time of the whole process during the stage\'s last run'),
+               ('children_cpu_seconds', 'CPU time of the child processes that finished during the stage\'s last run'),
+               ('bytes_read', 'Bytes read by the whole process during the stage\'s last run'),
+               ('bytes_written', 'Bytes written by the whole process during the stage\'s last run'),
+               ('frames', 'Frames handled by the stage\'s last run'),
+               ('peak_rss_bytes', 'Peak resident set size of the process during the stage\'s last run'),
+               ('time', 'Unix time when the stage last finished')]
+    lines = []
+    for metric, description in metrics:
+        name = 'cim_stage_%s' % ('finished_timestamp_seconds' if metric == 'time' else metric)
+        lines += ['# HELP %s %s' % (name, description), '# TYPE %s gauge' % name]
+        for stage_name, record in sorted(latest.items()):
+            if record.get(metric) is not None:
+                lines.append('%s{stage="%s",status="%s"} %s' % (name, stage_name, record['status'], record[metric]))
+    path = os.path.join(_directory, PROMETHEUS_FILE)
+    # Written to a temporary file first, so the collector never reads a half written file
+    with open(path + '.%s.part' % os.getpid(), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(path + '.%s.part' % os.getpid(), path)
@@ -0,0 +1,65 @@
+######################### PROJECT CIM - per-session workspaces
+######################### Every user session gets its own drawings/frames directories
+
+import os
+import re
+import shutil
+import time
+
+
+class Workspace:
+    """
+    A session's directories: `drawings` (the old tmp/) holds the drawings to process in GauGAN, and `files`
+    (the old files/) holds the movie's frames, subtitles, soundtrack and the movie itself.
+    """
+
+    def __init__(self, session_id: str, root='workspaces'):
+        """
+        :param session_id: the session's identifier, used as the workspace's directory name
+        :param root: the directory of all the workspaces
+        """
+        if not re.match(r'^[\w-]+$', session_id):
+            raise ValueError("Invalid session id %r" % session_id)
+        self.session_id = session_id
+        self.path = os.path.join(root, session_id)
+        self.drawings = os.path.join(self.path, 'tmp')
+        self.files = os.path.join(self.path, 'files')
+        for directory in (self.drawings, self.files):
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+        os.utime(self.path) # mark the workspace as recently used
+
+    def file(self, name: str) -> str:
+        """
+        :param name: file name, e.g. 'final_movie.mp4'
+        :return: the file's path in the workspace's files directory
+        """
+        return os.path.join(self.files, name)
+
+    def next_drawing_path(self) -> str:
+        """
+        :return: the path of the next drawing - picN.png, following the existing drawings
+        """
+        numbers = [int(match.group(1)) for match in (re.match(r'^pic(\d+)\.png$', name)
+                                                       for name in os.listdir(self.drawings)) if match]
+        return os.path.join(self.drawings, 'pic%s.png' % (max(numbers) + 1 if numbers else 0))
+
+
+def cleanup_workspaces(root='workspaces', max_age=7 * 24 * 3600, keep=()):
+    """
+    Remove the workspaces that weren't used for a while
+    :param root: the directory of all the workspaces
+    :param max_age: maximum age in seconds since the workspace was last used
+    :param keep: session ids that must not be removed
+    :return: number of removed workspaces
+    """
+    if not os.path.isdir(root):
+        return 0
+    removed = 0
+    now = time.time()
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir() and entry.name not in keep and now - entry.stat().st_mtime > max_age:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+    return removed
@@ -0,0 +1,166 @@
+######################### PROJECT CIM - YouTube soundtracks
+######################### Only the smallest audio-only stream is downloaded, piped straight into the mp3 encode, and the
+######################### soundtrack is cached by video ID
+
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from cim.disk_cache import SizeBoundedCache
+from cim.encoder import ffmpeg_binary, FFmpegError
+
+
+# watch?v=ID, youtu.be/ID, shorts/ID and embed/ID links
+_VIDEO_ID = re.compile(r'(?:v=|youtu\.be/|/shorts/|/embed/)([0-9A-Za-z_-]{11})(?![0-9A-Za-z_-])')
+
+
+def video_id(youtube_link: str) -> str:
+    """
+    :param youtube_link: a YouTube video link
+    :return: the video's ID
+    """
+    match = _VIDEO_ID.search(youtube_link)
+    if match is None:
+        raise ValueError("Not a YouTube video link: %r" % youtube_link)
+    return match.group(1)
+
+
+def smallest_audio_stream(youtube):
+    """
+    :param youtube: pytube.YouTube (or a stand-in with the same streams API, see cim.youtube_stub)
+    :return: the video's smallest audio-only stream
+    """
+    streams = list(youtube.streams.filter(only_audio=True))
+    if not streams:
+        raise ValueError("The video %s has no audio stream" % youtube.video_id)
+    return min(streams, key=lambda stream: stream.filesize)
+
+
+def transcode_stream(stream, path: str, quality=4, ffmpeg=None) -> int:
+    """
+    Download an audio stream straight into ffmpeg's mp3 encode - nothing but the mp3 is written to disk. The mp3 is
+    encoded into a temporary file of its own, hidden from the cache, and appears at once when it's complete.
+    :param stream: pytube.Stream (or a stand-in), its stream_to_buffer writes the stream's chunks into ffmpeg
+    :param path: the mp3 path
+    :param quality: LAME VBR quality (0 is best, 9 is smallest)
+    :param ffmpeg: the ffmpeg executable, None to use the one moviepy uses
+    :return: number of bytes downloaded
+    """
+    descriptor, part = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.' + os.path.basename(path),
+                                        suffix='.part')
+    os.close(descriptor)
+    command = [ffmpeg or ffmpeg_binary(), '-y', '-loglevel', 'error', '-i', 'pipe:0', '-vn',
+               '-c:a', 'libmp3lame', '-q:a', str(quality), '-f', 'mp3', part]
+    try:
+        with tempfile.TemporaryFile() as stderr:
+            try:
+                process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=stderr)
+            except OSError as e: # ffmpeg isn't installed
+                raise FFmpegError("Can't start ffmpeg: %s" % e)
+            counter = _CountingWriter(process.stdin)
+            try:
+                stream.stream_to_buffer(counter)
+                process.stdin.close()
+            except BrokenPipeError: # ffmpeg stopped reading - its error is reported below
+                pass
+            except BaseException: # the download failed
+                process.kill()
+                process.wait()
+                raise
+            if process.wait() != 0:
+                stderr.seek(0)
+                message = stderr.read().decode(errors='replace').strip()
+                raise FFmpegError("ffmpeg failed to encode %s: %s" % (path, message[-1000:]))
+        os.replace(part, path)
+    finally: # a failed download leaves nothing behind
+        if os.path.exists(part):
+            os.remove(part)
+    return counter.written
+
+
+class _CountingWriter:
+    """
+    A binary file wrapper counting the bytes written through it
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.written = 0
+
+    def write(self, data: bytes) -> int:
+        self.f.write(data)
+        self.written += len(data)
+        return len(data)
+
+
+class YouTubeAudioCache(SizeBoundedCache):
+    """
+    On-disk cache of YouTube soundtracks (mp3), keyed by video ID, shared by all the sessions.
+    A soundtrack is downloaded and encoded once per video - from the video's smallest audio-only stream, never the
+    video itself. Entries' modification times track their last use, and the least recently used entries are evicted
+    once the cache grows beyond max_bytes (see cim.disk_cache).
+    Usage:
+        cache = YouTubeAudioCache()
+        cache.fetch('https://www.youtube.com/watch?v=...', 'files/audio.mp3')
+    """
+
+    def __init__(self, directory='youtube_audio_cache', max_bytes=200 * 1024 ** 2, opener=None, ffmpeg=None):
+        """
+        :param directory: the directory where the soundtracks are stored
+        :param max_bytes: maximum total size of the soundtracks
+        :param opener: function opening a YouTube link - pytube.YouTube by default, a stand-in for testing offline
+                       (see cim.youtube_stub)
+        :param ffmpeg: the ffmpeg executable, None to use the one moviepy uses
+        """
+        super().__init__(directory, '.mp3', max_bytes)
+        self.opener = opener
+        self.ffmpeg = ffmpeg
+        self._lock = threading.Lock()
+        # video ID -> [lock, number of fetches holding or waiting for it], so a video is downloaded once even if
+        # several sessions ask for it
+        self._downloads = {}
+
+    def _open(self, youtube_link: str):
+        if self.opener is not None:
+            return self.opener(youtube_link)
+        import pytube
+        return pytube.YouTube(youtube_link)
+
+    def fetch(self, youtube_link: str, saving_path: str) -> int:
+        """
+        Save a video's soundtrack as mp3, from the cache or else from YouTube
+        :param youtube_link: the YouTube video link
+        :param saving_path: where the mp3 should be saved
+        :return: number of bytes downloaded from YouTube - 0 if the soundtrack was cached
+        """
+        key = video_id(youtube_link)
+        path = self._path(key)
+        with self._lock:
+            download = self._downloads.setdefault(key, [threading.Lock(), 0])
+            download[1] += 1
+        try:
+            with download[0]:
+                downloaded = 0
+                if not os.path.isfile(path):
+                    downloaded = transcode_stream(smallest_audio_stream(self._open(youtube_link)), path,
+                                                  ffmpeg=self.ffmpeg)
+                with self._lock:
+                    # Copied rather than linked: the workspace's soundtrack may be replaced by an uploaded mp3
+                    shutil.copyfile(path, saving_path)
+                    self._touch(path) # mark the entry as recently used
+                    self._evict(keep=path)
+        finally: # the lock is forgotten once no other fetch of the video holds or waits for it
+            with self._lock:
+                download[1] -= 1
+                if download[1] == 0:
+                    del self._downloads[key]
+        return downloaded
+
+    def __contains__(self, youtube_link: str) -> bool:
+        try:
+            return os.path.isfile(self._path(video_id(youtube_link)))
+        except ValueError:
+            return False
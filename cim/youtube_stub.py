@@ -0,0 +1,111 @@
+######################### PROJECT CIM - local YouTube stand-in
+######################### Offline replacement for pytube.YouTube's streams API, serving generated audio
+
+import io
+import threading
+import time
+from types import SimpleNamespace
+import numpy as np
+
+from cim.audio import write_wav
+from cim.youtube_audio import video_id
+
+
+class StubStream:
+    """
+    Behaves like pytube.Stream: the stream's content is written in chunks by stream_to_buffer
+    """
+
+    def __init__(self, content: bytes, mime_type: str, abr=None, latency=0.0, counter=None):
+        """
+        :param content: the stream's file content
+        :param mime_type: e.g. 'audio/wav' or 'video/mp4'
+        :param abr: the audio bitrate, e.g. '128kbps'
+        :param latency: seconds each chunk takes
+        :param counter: the StubYouTube counting the bytes sent
+        """
+        self.content = content
+        self.mime_type = mime_type
+        self.type = mime_type.split('/')[0]
+        self.abr = abr
+        self.filesize = len(content)
+        self.latency = latency
+        self.counter = counter
+
+    @property
+    def includes_audio_track(self) -> bool:
+        return self.abr is not None
+
+    @property
+    def includes_video_track(self) -> bool:
+        return self.type == 'video'
+
+    def stream_to_buffer(self, buffer, chunk_size=64 * 1024):
+        """
+        Write the stream's content into a binary file object, chunk by chunk like a download
+        :param buffer: the file object
+        :param chunk_size: bytes per chunk
+        :return:
+        """
+        for start in range(0, len(self.content), chunk_size):
+            time.sleep(self.latency)
+            chunk = self.content[start:start + chunk_size]
+            buffer.write(chunk)
+            if self.counter is not None:
+                self.counter.sent(len(chunk))
+
+
+class StubStreamQuery(list):
+    """
+    Behaves like pytube.StreamQuery's filter
+    """
+
+    def filter(self, only_audio=False, only_video=False):
+        return StubStreamQuery(stream for stream in self
+                               if not (only_audio and stream.includes_video_track)
+                               and not (only_video and not stream.includes_video_track))
+
+    def first(self):
+        return self[0] if self else None
+
+
+class StubYouTube:
+    """
+    Stands in for pytube.YouTube: StubYouTube().open(link).streams offers a (large) video stream and audio-only
+    streams of a few bitrates - generated tones, a different one per video ID - without any network call.
+    Usage:
+        youtube = StubYouTube()
+        cache = YouTubeAudioCache(opener=youtube.open)
+    """
+
+    def __init__(self, duration=5.0, latency=0.0):
+        """
+        :param duration: the videos' duration in seconds
+        :param latency: seconds each downloaded chunk takes
+        """
+        self.duration = duration
+        self.latency = latency
+        self.bytes_sent = 0 # number of bytes downloaded from the stand-in
+        self._lock = threading.Lock()
+
+    def sent(self, n: int):
+        with self._lock:
+            self.bytes_sent += n
+
+    def open(self, youtube_link: str):
+        """
+        :param youtube_link: a YouTube video link
+        :return: an object with the video_id and streams attributes of pytube.YouTube
+        """
+        key = video_id(youtube_link)
+        # A tone per video, at a few sample rates standing for the audio bitrates
+        frequency = 220 + int.from_bytes(key.encode(), 'big') % 440
+        streams = []
+        for fps, abr in ((8000, '48kbps'), (22050, '128kbps'), (44100, '160kbps')):
+            t = np.arange(int(self.duration * fps)) / fps
+            output = io.BytesIO()
+            write_wav(0.3 * np.sin(2 * np.pi * frequency * t)[:, None], output, fps)
+            streams.append(StubStream(output.getvalue(), 'audio/wav', abr, self.latency, self))
+        # The video stream holds the audio too, and is much larger than any audio-only stream
+        streams.insert(0, StubStream(streams[-1].content * 4, 'video/mp4', '160kbps', self.latency, self))
+        return SimpleNamespace(video_id=key, streams=StubStreamQuery(streams))
@@ -0,0 +1,42 @@
+######################### PROJECT CIM - soundtrack bed tests
+######################### Looping and trimming the soundtrack, with and without crossfade
+
+import numpy as np
+
+from cim.audio import loop_audio
+
+
+def _samples(n: int) -> np.array:
+    return np.stack([np.arange(n), -np.arange(n)], axis=1).astype(np.float32) / n
+
+
+def test_trim_and_tile():
+    samples = _samples(10)
+    assert np.array_equal(loop_audio(samples, 4), samples[:4])
+    looped = loop_audio(samples, 25)
+    assert looped.shape == (25, 2)
+    assert np.array_equal(looped[10:20], samples) and np.array_equal(looped[20:], samples[:5])
+    assert np.array_equal(loop_audio(samples[:0], 5), np.zeros((5, 2), np.float32))
+
+
+def test_crossfade_length():
+    samples = _samples(100)
+    for n_samples in (150, 181, 1000):
+        assert loop_audio(samples, n_samples, crossfade=20).shape == (n_samples, 2)
+    # The crossfade can't be longer than half the soundtrack
+    assert np.array_equal(loop_audio(samples, 300, crossfade=80), loop_audio(samples, 300, crossfade=50))
+
+
+def test_crossfade_continuity():
+    # The fade out and the fade in add up to the full level: a constant soundtrack stays constant across the loops
+    constant = np.full((100, 2), 0.5, np.float32)
+    assert np.allclose(loop_audio(constant, 500, crossfade=30), 0.5)
+    samples = _samples(100)
+    bed = loop_audio(samples, 400, crossfade=20)
+    # The movie starts with the soundtrack's own beginning, then every loop overlaps the previous one's end
+    assert np.array_equal(bed[:80], samples[:80])
+    ramp = np.linspace(0, 1, 20, dtype=np.float32)[:, None]
+    assert np.allclose(bed[80:100], samples[80:] * ramp[::-1] + samples[:20] * ramp)
+    assert np.allclose(bed[100:160], samples[20:80])
+    # No jump at the loop points larger than the soundtrack's own steps
+    assert np.abs(np.diff(bed, axis=0)).max() <= np.abs(np.diff(samples, axis=0)).max() + 1e-6 + 1 / 20
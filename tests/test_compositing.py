@@ -0,0 +1,42 @@
+######################### PROJECT CIM - compositing tests
+######################### The vectorized compositing must match the original per-pixel loop of draw()
+
+import numpy as np
+
+from cim.compositing import make_background, composite_background, _composite_background_loop
+
+
+COLORS = {'Sky': (110, 156, 196), 'Sea': (154, 198, 218), 'Grass': (29, 195, 49), 'Tree': (140, 104, 47)}
+
+
+def _drawing(size=32, seed=0) -> np.array:
+    # Transparent canvas with strokes of GauGAN colors, white, black and partly white pixels
+    rng = np.random.default_rng(seed)
+    palette = np.array(list(COLORS.values()) + [(255, 255, 255), (0, 0, 0), (255, 0, 12), (7, 255, 255)], np.uint8)
+    drawing = np.zeros((size, size, 4), np.uint8)
+    strokes = rng.random((size, size)) < 0.4
+    drawing[strokes, :3] = palette[rng.integers(len(palette), size=strokes.sum())]
+    drawing[strokes, 3] = 255
+    return drawing
+
+
+def test_vectorized_matches_loop():
+    background = make_background(COLORS, 32, 32)
+    for seed in range(3):
+        drawing = _drawing(seed=seed)
+        expected = _composite_background_loop(drawing, background)
+        result = composite_background(drawing, background)
+        assert result.dtype == expected.dtype == np.uint8
+        assert result.tobytes() == expected.tobytes()
+
+
+def test_rgb_drawing_matches_loop():
+    background = make_background(COLORS, 32, 32, layout=(('Grass', 1), ('Tree', 1)))
+    drawing = _drawing(seed=7)[:, :, :3]
+    assert composite_background(drawing, background).tobytes() == \
+        _composite_background_loop(drawing, background).tobytes()
+
+
+def test_empty_canvas_is_background():
+    background = make_background(COLORS, 16, 24)
+    assert np.array_equal(composite_background(np.zeros((16, 24, 4), np.uint8), background), background)
@@ -0,0 +1,68 @@
+######################### PROJECT CIM - on-disk cache tests
+######################### Atomic writes, the lock between processes, and the size-bounded LRU directory
+
+import multiprocessing
+import os
+
+from cim.disk_cache import SizeBoundedCache, atomic_write, file_lock
+
+
+def _increment(directory: str, times: int):
+    # A read-modify-write of a counter file, only correct if the lock excludes the other processes
+    for _ in range(times):
+        with file_lock(os.path.join(directory, '.lock')):
+            path = os.path.join(directory, 'counter')
+            value = int(open(path).read()) if os.path.exists(path) else 0
+            atomic_write(path, str(value + 1).encode())
+
+
+def test_file_lock_between_processes(tmp_path):
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=_increment, args=(str(tmp_path), 25)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert open(os.path.join(str(tmp_path), 'counter')).read() == '100'
+
+
+def test_atomic_write(tmp_path):
+    path = str(tmp_path / 'stats.json')
+    atomic_write(path, b'first')
+    atomic_write(path, b'second')
+    assert open(path, 'rb').read() == b'second'
+    assert os.listdir(str(tmp_path)) == ['stats.json'] # no temporary file is left
+
+
+def test_atomic_write_failure_keeps_the_old_content(tmp_path):
+    path = str(tmp_path / 'stats.json')
+    atomic_write(path, b'old')
+    try:
+        atomic_write(path, 'not bytes')
+    except TypeError:
+        pass
+    assert open(path, 'rb').read() == b'old'
+    assert os.listdir(str(tmp_path)) == ['stats.json']
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = SizeBoundedCache(str(tmp_path), '.bin', max_bytes=300)
+    for i, key in enumerate('abcd'):
+        with open(cache._path(key), 'wb') as f:
+            f.write(b'x' * 100)
+        os.utime(cache._path(key), (1000 + i, 1000 + i))
+    assert cache._touch(cache._path('a')) # 'a' is used again, 'b' is now the least recently used
+    cache._evict(keep=cache._path('d'))
+    assert sorted(os.path.basename(path) for _, _, path in cache._entries()) == ['a.bin', 'c.bin', 'd.bin']
+    assert cache.size() == 300 and len(cache) == 3
+
+
+def test_entries_removed_by_another_process(tmp_path):
+    cache = SizeBoundedCache(str(tmp_path), '.bin', max_bytes=0)
+    path = cache._path('gone')
+    assert not cache._touch(path)
+    cache._remove(path) # already removed: not an error
+    with open(cache._path('kept'), 'wb') as f:
+        f.write(b'x')
+    cache._evict(keep=cache._path('kept'))
+    assert len(cache) == 1
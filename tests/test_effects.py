@@ -0,0 +1,57 @@
+######################### PROJECT CIM - frame effects tests
+######################### The movie doesn't depend on how its frames are split into tasks or between the workers
+
+import numpy as np
+import pytest
+
+from cim.effects import DEFAULT_EFFECTS, FrameEffects, render_range
+from cim.pools import worker_pool
+
+
+def _frames(count: int) -> list:
+    rng = np.random.default_rng(count)
+    return [rng.integers(0, 256, (12, 16, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def _reference(frames: list, stage: FrameEffects) -> list:
+    # The whole movie in one range
+    return render_range(frames, 0, stage.hold, stage.fade, stage.effects, True) if frames else []
+
+
+def _equal(movie: list, reference: list) -> bool:
+    return len(movie) == len(reference) and all(np.array_equal(a, b) for a, b in zip(movie, reference))
+
+
+@pytest.mark.parametrize('count', [0, 1, 2, 7])
+@pytest.mark.parametrize('fps, crossfade', [(3, 0.5), (0.5, 1.0), (25, 0.5), (7, 0.0)])
+def test_same_movie_for_every_task_size(count, fps, crossfade):
+    frames = _frames(count)
+    effects = DEFAULT_EFFECTS._replace(crossfade=crossfade)
+    reference = _reference(frames, FrameEffects(fps, effects))
+    assert len(reference) == count * FrameEffects(fps, effects).hold
+    for frames_per_task in (1, 3, 8, 1000):
+        stage = FrameEffects(fps, effects, frames_per_task=frames_per_task)
+        assert _equal(list(stage.apply(iter(frames))), reference)
+
+
+def test_same_movie_on_a_pool():
+    frames = _frames(5)
+    stage = FrameEffects(2, DEFAULT_EFFECTS, frames_per_task=4, pool=worker_pool(2), max_frames=8)
+    assert stage.window == 2
+    assert _equal(list(stage.apply(iter(frames))), _reference(frames, stage))
+    assert list(stage.apply([])) == []
+
+
+def test_timing():
+    stage = FrameEffects(3, DEFAULT_EFFECTS._replace(fps=25, crossfade=0.5))
+    assert (stage.hold, stage.fps, stage.fade) == (8, 24, 8 - 1) # the crossfade is at most the hold
+    stage = FrameEffects(30, DEFAULT_EFFECTS)
+    assert (stage.hold, stage.fade) == (1, 0)
+
+
+def test_tasks_are_bounded():
+    # A long hold is split between tasks, each with the few source frames it needs
+    stage = FrameEffects(0.5, DEFAULT_EFFECTS, frames_per_task=8)
+    tasks = list(stage._tasks(_frames(3)))
+    assert all(len(task[0]) <= 3 and task[-1] <= 8 for task in tasks)
+    assert sum(task[-1] for task in tasks) == 3 * stage.hold
@@ -0,0 +1,34 @@
+######################### PROJECT CIM - failure detection tests
+######################### The detector must tell GauGAN's error image from good responses on a fixed corpus
+
+import os
+
+from cim.failure_detection import FailureDetector, directory_corpus, evaluate, quarantine, release, synthetic_corpus, \
+    QUARANTINE
+
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'failure_detection')
+
+
+def test_fixed_corpus():
+    corpus = directory_corpus(CORPUS)
+    # The error image re-encoded, cropped, tinted and scaled, and a truncated response
+    assert sum(failed for _, _, failed in corpus) == 14 and len(corpus) == 30
+    result = evaluate(FailureDetector(), corpus)
+    assert result['misclassified'] == []
+    assert result['true_failures'] == 14 and result['true_photos'] == 16
+
+
+def test_synthetic_corpus():
+    corpus = synthetic_corpus(samples=8, seed=1)
+    assert {name.rstrip('0123456789') for name, _, failed in corpus if failed} == {'error', 'crop', 'tint', 'scaled'}
+    assert evaluate(FailureDetector(), corpus)['misclassified'] == []
+
+
+def test_release_after_success(tmp_path):
+    saving_path = str(tmp_path / 'drawing0.jpg')
+    path = quarantine(b'error image', saving_path)
+    assert path == os.path.join(str(tmp_path), QUARANTINE, 'drawing0.jpg') and os.path.isfile(path)
+    assert release(saving_path)
+    assert not os.path.exists(path)
+    assert not release(saving_path)
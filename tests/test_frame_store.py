@@ -0,0 +1,90 @@
+######################### PROJECT CIM - decoded frame store tests
+######################### The store is committed only once every frame went through, and reused afterwards
+
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from cim.frame_store import DATA_FILE, DIRECTORY, INDEX_FILE, RecordingFrames, StoredFrames, open_frames
+
+
+def _frames(directory, count=4, sizes=None):
+    files, hashes = [], []
+    for i in range(count):
+        width, height = sizes[i] if sizes else (16, 8)
+        path = os.path.join(str(directory), '%d.jpg' % i)
+        cv2.imwrite(path, np.full((height, width, 3), i * 40, np.uint8))
+        files.append(path)
+        hashes.append('hash%d' % i)
+    return files, hashes
+
+
+def _store_files(directory) -> list:
+    return sorted(os.listdir(os.path.join(str(directory), DIRECTORY)))
+
+
+def test_recorded_then_stored(tmp_path):
+    files, hashes = _frames(tmp_path)
+    recording = open_frames(str(tmp_path), files, hashes)
+    assert isinstance(recording, RecordingFrames)
+    decoded = [np.array(frame) for frame in recording]
+    assert _store_files(tmp_path) == [DATA_FILE, INDEX_FILE]
+    stored = open_frames(str(tmp_path), files, hashes)
+    assert isinstance(stored, StoredFrames)
+    assert stored.size == (16, 8) and len(stored) == 4 and stored.skipped == []
+    assert all(np.array_equal(a, b) for a, b in zip(stored, decoded))
+    # Other frames, or another order, have another key - they're decoded again
+    assert isinstance(open_frames(str(tmp_path), files[::-1], hashes[::-1]), RecordingFrames)
+    assert isinstance(open_frames(str(tmp_path), files, hashes[:3] + ['changed']), RecordingFrames)
+
+
+def test_skipped_frames_are_stored(tmp_path):
+    files, hashes = _frames(tmp_path, sizes=[(16, 8), (10, 10), (16, 8), (16, 8)])
+    list(open_frames(str(tmp_path), files, hashes, mismatch='skip'))
+    stored = open_frames(str(tmp_path), files, hashes, mismatch='skip')
+    assert isinstance(stored, StoredFrames)
+    assert stored.skipped == [files[1]] and len(list(stored)) == 3
+
+
+def test_interrupted_recording_leaves_no_store(tmp_path):
+    files, hashes = _frames(tmp_path)
+    recording = open_frames(str(tmp_path), files, hashes)
+    frames = iter(recording)
+    next(frames)
+    frames.close() # e.g. the encoder failed
+    assert _store_files(tmp_path) == [] # the partial data file is removed, and no index is written
+    assert isinstance(open_frames(str(tmp_path), files, hashes), RecordingFrames)
+
+
+def test_failed_decoding_leaves_no_store(tmp_path):
+    files, hashes = _frames(tmp_path, sizes=[(16, 8), (10, 10), (16, 8), (16, 8)])
+    with pytest.raises(ValueError):
+        list(open_frames(str(tmp_path), files, hashes, mismatch='error'))
+    assert _store_files(tmp_path) == []
+
+
+def test_recovery_from_a_broken_store(tmp_path):
+    files, hashes = _frames(tmp_path)
+    list(open_frames(str(tmp_path), files, hashes))
+    store = os.path.join(str(tmp_path), DIRECTORY)
+    # A render that crashed: its partial data file is left behind, and the index was half written
+    with open(os.path.join(store, DATA_FILE + '.99999.part'), 'wb') as f:
+        f.write(b'partial')
+    with open(os.path.join(store, INDEX_FILE), 'w') as f:
+        f.write('{"key": ')
+    recording = open_frames(str(tmp_path), files, hashes)
+    assert isinstance(recording, RecordingFrames)
+    list(recording)
+    assert _store_files(tmp_path) == [DATA_FILE, INDEX_FILE] # the crashed render's partial file is removed
+    stored = open_frames(str(tmp_path), files, hashes)
+    assert isinstance(stored, StoredFrames) and len(list(stored)) == 4
+
+
+def test_too_large_for_the_store(tmp_path):
+    files, hashes = _frames(tmp_path)
+    frames = open_frames(str(tmp_path), files, hashes, max_bytes=100)
+    assert len(list(frames)) == 4
+    assert not os.path.exists(os.path.join(str(tmp_path), DIRECTORY))
+    assert open_frames(str(tmp_path), files, [None] * 4).__class__.__name__ == 'FrameLoader' # not indexed
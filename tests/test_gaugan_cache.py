@@ -0,0 +1,64 @@
+######################### PROJECT CIM - GauGAN result cache tests
+######################### Keys, LRU eviction and hit/miss counting
+
+import os
+
+from cim.gaugan_cache import GauGANCache
+
+
+def test_key():
+    key = GauGANCache.key(b'drawing', 1)
+    assert key == GauGANCache.key(b'drawing', '1') # the style may come as a string
+    assert key != GauGANCache.key(b'drawing', 2)
+    assert key != GauGANCache.key(b'drawing2', 1)
+    assert len(key) == 64
+
+
+def test_store_fetch_and_counts(tmp_path):
+    cache = GauGANCache(str(tmp_path / 'cache'))
+    output = str(tmp_path / 'result.jpg')
+    assert not cache.lookup(b'drawing', 1) # a miss
+    cache.store(b'drawing', 1, b'image')
+    assert cache.lookup(b'drawing', 1) # counted as a hit only once it's read
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert cache.fetch(b'drawing', 1, output)
+    assert open(output, 'rb').read() == b'image'
+    assert (cache.hits, cache.misses) == (1, 1)
+    # The counts are saved once per batch, and other instances (e.g. other processes) add to them
+    cache.save_stats()
+    other = GauGANCache(str(tmp_path / 'cache'))
+    assert (other.hits, other.misses) == (1, 1)
+    assert not other.fetch(b'drawing', 2, output)
+    other.save_stats()
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_evicted_after_lookup_counts_as_miss(tmp_path):
+    cache = GauGANCache(str(tmp_path / 'cache'))
+    cache.store(b'drawing', 1, b'image')
+    assert cache.lookup(b'drawing', 1)
+    os.remove(cache._path(cache.key(b'drawing', 1))) # evicted by another process
+    assert not cache.fetch(b'drawing', 1, str(tmp_path / 'result.jpg'))
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_lru_eviction(tmp_path):
+    cache = GauGANCache(str(tmp_path / 'cache'), max_bytes=250)
+    for i in range(3):
+        cache.store(b'drawing%d' % i, 1, b'x' * 100)
+        path = cache._path(cache.key(b'drawing%d' % i, 1))
+        os.utime(path, (1000 + i, 1000 + i))
+    assert len(cache) == 2 # the oldest entry was evicted when the third was stored
+    assert not cache.lookup(b'drawing0', 1)
+    assert cache.fetch(b'drawing1', 1, str(tmp_path / 'result.jpg')) # now the most recently used
+    cache.store(b'drawing3', 1, b'x' * 100)
+    assert cache.lookup(b'drawing1', 1) and not cache.lookup(b'drawing2', 1)
+
+
+def test_purge(tmp_path):
+    cache = GauGANCache(str(tmp_path / 'cache'))
+    cache.store(b'drawing', 1, b'image')
+    cache.fetch(b'drawing', 1, str(tmp_path / 'result.jpg'))
+    cache.save_stats()
+    cache.purge()
+    assert len(cache) == 0 and (cache.hits, cache.misses) == (0, 0)
@@ -0,0 +1,85 @@
+######################### PROJECT CIM - concurrent GauGAN submission tests
+######################### Ordering, retries, timeouts and the bound on requests in flight, offline with StubGauGAN
+
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from cim.gaugan_pool import GauGANTimeout, call_with_retry, process_concurrently
+from cim.gaugan_stub import StubGauGAN
+
+
+def _drawing(value: int) -> bytes:
+    return cv2.imencode('.png', np.full((16, 16, 3), value, np.uint8))[1].tobytes()
+
+
+class _Counting:
+    """
+    Wraps a function, counting the calls running at the same time
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.running = self.most = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            self.running += 1
+            self.most = max(self.most, self.running)
+        try:
+            return self.func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+def test_results_in_jobs_order():
+    stub = StubGauGAN(latency=(0.0, 0.05), seed=1)
+    jobs = [((_drawing(i * 20),), {'style': 1}) for i in range(10)]
+    results = list(process_concurrently(stub.processImage, jobs, max_workers=4, timeout=None, retries=0))
+    assert [job for job, _, _ in results] == jobs
+    assert all(error is None for _, _, error in results)
+    expected = [stub.processImage(*args, **kwargs) for args, kwargs in jobs]
+    assert [result for _, result, _ in results] == expected
+
+
+def test_retry_until_success():
+    attempts = []
+
+    def flaky(x):
+        attempts.append(x)
+        if len(attempts) < 3:
+            raise ConnectionError("flaky")
+        return x * 2
+
+    delays = []
+    assert call_with_retry(flaky, (21,), timeout=None, retries=3, backoff=0.5, sleep=delays.append) == 42
+    assert len(attempts) == 3 and delays == [0.5, 1.0]
+
+
+def test_failures_are_reported_per_job():
+    stub = StubGauGAN(latency=0.0, failure_rate=1.0)
+    results = list(process_concurrently(stub.processImage, [((_drawing(0),), {})] * 2, max_workers=2, timeout=None,
+                                        retries=1, backoff=0.0))
+    assert all(result is None and isinstance(error, ConnectionError) for _, result, error in results)
+    assert stub.calls == 4 # each job, then its retry
+
+
+def test_timeout():
+    stub = StubGauGAN(latency=0.5)
+    with pytest.raises(GauGANTimeout):
+        call_with_retry(stub.processImage, (_drawing(0),), timeout=0.05, retries=0)
+
+
+def test_abandoned_requests_keep_their_slot():
+    # Every attempt times out and is retried: the abandoned requests still count as in flight
+    stub = _Counting(StubGauGAN(latency=0.2).processImage)
+    jobs = [((_drawing(0),), {})] * 4
+    results = list(process_concurrently(stub, jobs, max_workers=2, timeout=0.05, retries=2, backoff=0.0))
+    assert all(isinstance(error, GauGANTimeout) for _, _, error in results)
+    assert stub.most <= 2
+    time.sleep(0.3) # let the last abandoned requests finish
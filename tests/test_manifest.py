@@ -0,0 +1,97 @@
+######################### PROJECT CIM - frame manifest tests
+######################### Added, removed and modified images, and the scans skipped while the directory didn't change
+
+import itertools
+import os
+import time
+
+import cv2
+import numpy as np
+
+from cim.manifest import FrameManifest
+
+
+_settled = itertools.count(1)
+
+
+def _settle(directory):
+    # As if the directory was last changed long ago - each time at another time, as a real change would
+    ns = time.time_ns() - 3600 * 10 ** 9 + next(_settled) * 10 ** 6
+    os.utime(str(directory), ns=(ns, ns))
+
+
+def _image(directory, name, value, size=(16, 8)) -> str:
+    path = os.path.join(str(directory), name)
+    cv2.imwrite(path, np.full((size[1], size[0], 3), value, np.uint8))
+    return path
+
+
+def _names(manifest) -> list:
+    return [os.path.basename(path) for path in manifest.files()]
+
+
+def test_added_and_removed_images(tmp_path):
+    first = _image(tmp_path, '0.jpg', 0)
+    os.utime(first, (1, 1))
+    (tmp_path / 'notes.txt').write_text('not an image')
+    manifest = FrameManifest(str(tmp_path))
+    assert manifest.update()
+    assert _names(manifest) == ['0.jpg']
+    assert manifest.entry(first)['origin'] == 'uploaded' and manifest.entry(first)['width'] == 16
+    _image(tmp_path, 'pic1.png', 40)
+    assert manifest.update()
+    assert _names(manifest) == ['0.jpg', 'pic1.png'] # in the order of modification time
+    assert manifest.entry(str(tmp_path / 'pic1.png'))['origin'] == 'drawn'
+    assert manifest.frames() == [first]
+    os.remove(first)
+    assert manifest.update()
+    assert _names(manifest) == ['pic1.png'] and manifest.entry(first) is None
+    # Saved, for other processes
+    assert _names(FrameManifest(str(tmp_path))) == ['pic1.png']
+
+
+def test_modified_images(tmp_path):
+    path = _image(tmp_path, '0.jpg', 0)
+    manifest = FrameManifest(str(tmp_path))
+    manifest.update()
+    old = manifest.entry(path)
+    # Replaced by another image
+    os.replace(_image(tmp_path, 'replacement.jpg', 200, size=(32, 16)), path)
+    assert manifest.update()
+    new = manifest.entry(path)
+    assert new['hash'] != old['hash'] and (new['width'], new['height']) == (32, 16)
+    assert not manifest.update()
+    # Rewritten in place, then recorded - with its origin
+    _image(tmp_path, '0.jpg', 100)
+    manifest.record(path, 'gaugan', 3)
+    entry = manifest.entry(path)
+    assert entry['hash'] not in (old['hash'], new['hash'])
+    assert (entry['origin'], entry['style']) == ('gaugan', 3)
+    assert FrameManifest(str(tmp_path)).entry(path)['style'] == 3
+
+
+def test_unchanged_directory_is_not_scanned(tmp_path):
+    path = _image(tmp_path, '0.jpg', 0)
+    manifest = FrameManifest(str(tmp_path))
+    manifest.update()
+    _settle(tmp_path)
+    assert not manifest.update() # scanned once more, the directory having changed
+    old = manifest.entry(path)['hash']
+    # An image rewritten in place doesn't change the directory: it isn't noticed until it's recorded
+    _image(tmp_path, '0.jpg', 100)
+    assert not manifest.update()
+    assert manifest.entry(path)['hash'] == old
+    # Adding an image changes the directory: the whole directory is scanned again
+    _image(tmp_path, '1.jpg', 50)
+    _settle(tmp_path)
+    assert manifest.update()
+    assert manifest.entry(path)['hash'] != old and _names(manifest) == ['0.jpg', '1.jpg']
+
+
+def test_recently_changed_directory_is_scanned_again(tmp_path):
+    path = _image(tmp_path, '0.jpg', 0)
+    manifest = FrameManifest(str(tmp_path))
+    manifest.update()
+    assert not manifest.update() # the directory changed within the clock's resolution - scanned again
+    _image(tmp_path, '0.jpg', 100) # possibly without changing the directory's modification time
+    assert manifest.update()
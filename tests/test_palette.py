@@ -0,0 +1,49 @@
+######################### PROJECT CIM - label palette tests
+######################### Snapping drawings to the GauGAN colors through the lookup table
+
+import numpy as np
+
+from cim.palette import LabelPalette
+
+
+COLORS = {'Sky': (110, 156, 196), 'Sea': (154, 198, 218), 'Grass': (29, 195, 49), 'Tree': (140, 104, 47),
+          'Sand': (159, 150, 72), 'Cloud': (105, 105, 105), 'Fog': (106, 106, 106)}
+
+
+def test_exact_colors_keep_their_index():
+    palette = LabelPalette(COLORS, bits=4)
+    # Cloud and Fog share a lookup table cell: the cell's center is nearer to one of them, but an exact color
+    # always keeps its own index
+    rgb = palette.colors[None, :, :]
+    assert np.array_equal(palette.snap(rgb)[0], np.arange(len(palette.colors)))
+
+
+def test_snapping_to_the_nearest_color():
+    palette = LabelPalette(COLORS)
+    # Anti-aliased pixels: a few levels off a palette color
+    rgb = np.clip(palette.colors.astype(np.int16) + np.array([3, -2, 1]), 0, 255).astype(np.uint8)[None]
+    indices = palette.snap(rgb)[0]
+    expected = [np.argmin(((palette.colors.astype(np.int32) - color) ** 2).sum(axis=1)) for color in rgb[0]]
+    assert list(indices) == expected
+    assert np.array_equal(palette.to_rgb(indices), palette.colors[expected])
+
+
+def test_lookup_table():
+    palette = LabelPalette(COLORS, bits=5)
+    assert palette._lut is None # built on first use
+    lut = palette.lut
+    assert lut.shape == (2 ** 15,) and lut.dtype == np.uint8 and palette.lut is lut
+    # The table matches a brute force search over the cells' centers (ties keep the first color)
+    levels = (np.arange(32) << 3) + 4
+    grid = np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), axis=-1).reshape(-1, 1, 3)
+    expected = ((grid - palette.colors.astype(np.int64)[None]) ** 2).sum(axis=2).argmin(axis=1)
+    assert np.array_equal(lut, expected)
+
+
+def test_encode_keeps_the_indices():
+    from PIL import Image
+    import io
+    palette = LabelPalette(COLORS)
+    indices = np.random.default_rng(0).integers(0, len(palette.colors), (8, 8)).astype(np.uint8)
+    image = Image.open(io.BytesIO(palette.encode(indices)))
+    assert image.mode == 'P' and np.array_equal(np.asarray(image), indices)
@@ -0,0 +1,75 @@
+######################### PROJECT CIM - incremental segment rendering tests
+######################### Content-defined segment boundaries, and re-encoding only the segments that changed
+
+import re
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+import pytest
+
+from cim.encoder import ffmpeg_binary
+from cim.segments import SegmentRenderer, Shot, split_segments, thin_shots, _local_cues
+from cim.subtitles import Cue
+
+
+def _shots(keys) -> list:
+    return [Shot('%s.jpg' % key, key, 0.5) for key in keys]
+
+
+def _keys(segments: list) -> list:
+    return [tuple(shot.key for shot in segment) for segment in segments]
+
+
+def test_segments_cover_the_shots_in_order():
+    shots = _shots('frame%d' % i for i in range(300))
+    segments = split_segments(shots, average=16, minimum=4, maximum=48)
+    assert [shot for segment in segments for shot in segment] == shots
+    assert all(4 <= len(segment) <= 48 for segment in segments[:-1])
+    assert len(segments) > 5
+
+
+@pytest.mark.parametrize('position', [0, 57, 150, 299])
+def test_boundaries_are_stable_under_insert_and_delete(position):
+    keys = ['frame%d' % i for i in range(300)]
+    before = set(_keys(split_segments(_shots(keys))))
+    for changed in (keys[:position] + ['new'] + keys[position:], keys[:position] + keys[position + 1:]):
+        after = _keys(split_segments(_shots(changed)))
+        # Only the segments around the change differ - the segments before and after it are the same
+        assert sum(segment not in before for segment in after) <= 2
+
+
+def test_thin_shots_keep_the_duration():
+    shots = _shots('abcdefg')
+    thinned = thin_shots(shots, 3)
+    assert [shot.key for shot in thinned] == ['a', 'd', 'g']
+    assert [shot.duration for shot in thinned] == [1.5, 1.5, 0.5]
+    assert thin_shots(shots, 1) == shots
+
+
+def test_local_cues():
+    cues = [Cue(0, 2, 'a'), Cue(1.5, 4, 'b'), Cue(5, 6, 'c')]
+    assert _local_cues(cues, 1, 3) == [Cue(0, 1, 'a'), Cue(0.5, 2, 'b')]
+    assert _local_cues(cues, 4, 5) == []
+
+
+@pytest.mark.skipif(shutil.which(ffmpeg_binary()) is None, reason="ffmpeg isn't installed")
+def test_only_changed_segments_are_encoded(tmp_path):
+    shots = []
+    for i in range(40):
+        path = str(tmp_path / ('%d.jpg' % i))
+        cv2.imwrite(path, np.full((32, 32, 3), i * 6, np.uint8))
+        shots.append(Shot(path, 'frame%d' % i, 0.2))
+    renderer = SegmentRenderer(str(tmp_path), (32, 32), preset='ultrafast')
+    output = str(tmp_path / 'movie.mp4')
+    encoded, reused = renderer.render(shots, [], output)
+    assert reused == 0 and encoded == len(split_segments(shots))
+    assert renderer.render(shots, [], output) == (0, encoded) # nothing changed
+    shots[20] = shots[20]._replace(duration=1.0)
+    encoded, reused = renderer.render(shots, [Cue(0, 0.5, 'Hello')], output)
+    assert 1 <= encoded <= 2 and reused >= len(split_segments(shots)) - 2
+    # The joined movie lasts as long as its shots
+    probe = subprocess.run([ffmpeg_binary(), '-i', output], stderr=subprocess.PIPE).stderr.decode()
+    hours, minutes, seconds = re.search(r'Duration: (\d+):(\d+):([\d.]+)', probe).groups()
+    assert abs(int(hours) * 3600 + int(minutes) * 60 + float(seconds) - 8.8) < 0.05
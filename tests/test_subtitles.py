@@ -0,0 +1,45 @@
+######################### PROJECT CIM - subtitles tests
+######################### SRT parsing and writing, and the cue shown at a time
+
+from cim.subtitles import Cue, SubtitleRenderer, cues_from_lines, format_timestamp, parse_srt, read_subtitles, \
+    write_srt
+
+
+SRT = '﻿1\r\n00:00:01,000 --> 00:00:02,500\r\nHello\r\n\r\n2\r\n00:00:00,500 --> 00:00:01,200\r\nFirst\r\n' \
+      'line two\r\n\r\n3\r\n00:01:02.250 --> 01:00:00,000\r\nLong\r\n'
+
+
+def test_parse_srt():
+    assert parse_srt(SRT) == [Cue(0.5, 1.2, 'First\nline two'), Cue(1.0, 2.5, 'Hello'), Cue(62.25, 3600.0, 'Long')]
+
+
+def test_format_timestamp():
+    assert format_timestamp(0) == '00:00:00,000'
+    assert format_timestamp(3723.0456) == '01:02:03,046'
+
+
+def test_write_srt_round_trip(tmp_path):
+    path = str(tmp_path / 'cues.srt')
+    cues = [Cue(0.0, 1.5, 'One'), Cue(1.5, 2.0, '  '), Cue(2.0, 3.25, 'Two\nlines')]
+    write_srt(cues, path)
+    # The empty cue is left out, and the remaining ones are numbered in order
+    assert read_subtitles(path, 10) == [cues[0], cues[2]]
+    assert open(path, encoding='utf8').read().startswith('1\n00:00:00,000 --> 00:00:01,500\nOne\n\n2\n')
+
+
+def test_cues_from_lines():
+    assert cues_from_lines(['a', '', 'b', '  '], 10) == [Cue(0, 5, 'a'), Cue(5, 10, 'b')]
+    assert cues_from_lines(['', ' '], 10) == []
+
+
+def test_cue_at():
+    cues = [Cue(0, 10, 'long'), Cue(2, 3, 'short'), Cue(4, 5, ' '), Cue(6, 8, 'late')]
+    renderer = SubtitleRenderer(cues, (64, 32))
+    assert renderer.cue_at(1) == Cue(0, 10, 'long')
+    # Overlapping cues are joined, a line each, for as long as they're all shown
+    assert renderer.cue_at(2.5) == Cue(2, 3, 'long\nshort')
+    assert renderer.cue_at(3) == Cue(0, 10, 'long') # a cue ends before its end time
+    assert renderer.cue_at(4.5) == Cue(0, 10, 'long') # empty cues are ignored
+    assert renderer.cue_at(7) == Cue(6, 8, 'long\nlate')
+    assert renderer.cue_at(10) is None
+    assert SubtitleRenderer([], (64, 32)).cue_at(0) is None
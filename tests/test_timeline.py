@@ -0,0 +1,81 @@
+######################### PROJECT CIM - movie timeline tests
+######################### The frames' own durations and crossfades, saved with the frames, as shots
+
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from cim import encoder
+from cim.timeline import Timeline
+
+
+def _frames(directory, count=3) -> list:
+    files = []
+    for i in range(count):
+        path = os.path.join(str(directory), '%d.jpg' % i)
+        cv2.imwrite(path, np.full((8, 8, 3), i * 100, np.uint8))
+        files.append(path)
+    return files
+
+
+def test_persistence(tmp_path):
+    timeline = Timeline(str(tmp_path))
+    assert not timeline.customized
+    timeline.set('0.jpg', duration=2.0)
+    timeline.set('1.jpg', crossfade=0.5)
+    timeline.crossfade = 0.2
+    timeline.save()
+    loaded = Timeline(str(tmp_path))
+    assert loaded.customized and loaded.crossfade == 0.2
+    assert loaded.timing('0.jpg', 4) == (2.0, 0.2)
+    assert loaded.timing('1.jpg', 4) == (0.25, 0.25) # the crossfade takes at most the frame's duration
+    assert loaded.timing('2.jpg', 4) == (0.25, 0.2)
+    loaded.set('0.jpg') # back to the default timing
+    assert '0.jpg' not in Timeline(str(tmp_path)).frames
+
+
+def test_shots_without_crossfade(tmp_path):
+    files = _frames(tmp_path)
+    timeline = Timeline(str(tmp_path))
+    timeline.set('1.jpg', duration=3.0)
+    shots = timeline.shots(files, ['h0', 'h1', 'h2'], 2, (8, 8))
+    assert [(shot.file, shot.key, shot.duration) for shot in shots] == \
+        [(files[0], 'h0', 0.5), (files[1], 'h1', 3.0), (files[2], 'h2', 0.5)]
+
+
+def test_crossfade_frames(tmp_path):
+    files = _frames(tmp_path)
+    timeline = Timeline(str(tmp_path))
+    timeline.set('0.jpg', duration=1.0, crossfade=0.2)
+    shots = timeline.shots(files, ['h0', 'h1', 'h2'], 2, (8, 8), transition_fps=10)
+    # The crossfade takes the end of the frame's duration: 2 blended frames of 0.1 s, the movie's duration is kept
+    assert [shot.duration for shot in shots] == pytest.approx([0.8, 0.1, 0.1, 0.5, 0.5])
+    blends = shots[1:3]
+    assert all(os.path.dirname(shot.file) == os.path.join(str(tmp_path), Timeline.BLENDS) for shot in blends)
+    levels = [int(cv2.imread(shot.file)[4, 4, 0]) for shot in blends]
+    assert 0 < levels[0] < levels[1] < 100 # from the first frame towards the second
+    # The blended frames are made once, and forgotten when they're not used any more
+    mtimes = [os.stat(shot.file).st_mtime_ns for shot in blends]
+    again = timeline.shots(files, ['h0', 'h1', 'h2'], 2, (8, 8), transition_fps=10)
+    assert again == shots and [os.stat(shot.file).st_mtime_ns for shot in blends] == mtimes
+    timeline.set('0.jpg', duration=1.0)
+    timeline.shots(files, ['h0', 'h1', 'h2'], 2, (8, 8))
+    assert os.listdir(os.path.join(str(tmp_path), Timeline.BLENDS)) == []
+
+
+def test_last_frame_has_no_crossfade(tmp_path):
+    files = _frames(tmp_path)
+    timeline = Timeline(str(tmp_path))
+    timeline.crossfade = 0.1
+    shots = timeline.shots(files, ['h0', 'h1', 'h2'], 2, (8, 8), transition_fps=10)
+    assert sum(shot.duration for shot in shots) == pytest.approx(1.5)
+    assert shots[-1].file == files[2] and shots[-1].duration == 0.5
+
+
+def test_vfr_arguments(monkeypatch):
+    for version, expected in (((4, 4), ['-vsync', 'vfr']), ((5, 1), ['-fps_mode', 'vfr']),
+                              (None, ['-fps_mode', 'vfr'])):
+        monkeypatch.setattr(encoder, 'ffmpeg_version', lambda ffmpeg: version)
+        assert encoder.vfr_arguments('ffmpeg') == expected
@@ -0,0 +1,65 @@
+######################### PROJECT CIM - pipeline instrumentation tests
+######################### Stages are kept in memory and written at the end of a run, with the child processes' CPU time
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from cim import tracing
+
+
+@pytest.fixture
+def metrics(tmp_path, monkeypatch):
+    directory = str(tmp_path / 'metrics')
+    tracing.configure(directory)
+    monkeypatch.setattr(tracing, 'FLUSH_SECONDS', 3600.0)
+    yield directory
+    tracing.configure(None)
+
+
+def _logged(directory) -> list:
+    try:
+        with open(os.path.join(directory, tracing.LOG_FILE)) as f:
+            return f.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+
+def test_stages_are_written_at_the_end_of_the_run(metrics):
+    with tracing.run('render'):
+        with tracing.stage('decode'):
+            tracing.annotate(frames=3)
+        with tracing.stage('encode'):
+            pass
+        assert _logged(metrics) == [] # kept in memory
+    assert len(_logged(metrics)) == 2
+    records = tracing.last_run()
+    assert [record['stage'] for record in records] == ['decode', 'encode']
+    assert records[0]['frames'] == 3 and records[0]['run_name'] == 'render'
+    with open(os.path.join(metrics, tracing.PROMETHEUS_FILE)) as f:
+        assert 'cim_stage_frames{stage="decode",status="ok"} 3' in f.read()
+
+
+def test_stages_outside_a_run_are_written_when_read(metrics):
+    with tracing.stage('draw'):
+        pass
+    assert _logged(metrics) == []
+    assert [record['stage'] for record in tracing.read_records()] == ['draw']
+    assert len(_logged(metrics)) == 1
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="no resource module")
+def test_child_processes_cpu(metrics):
+    with tracing.stage('ffmpeg'):
+        subprocess.run([sys.executable, '-c', 'sum(range(10 ** 7))'], check=True)
+    record = tracing.read_records()[-1]
+    assert record['children_cpu_seconds'] > record['cpu_seconds'] # the stage's thread only waited
+
+
+def test_disabled():
+    tracing.configure(None)
+    with tracing.stage('draw') as record:
+        pass
+    assert record == {} and tracing.read_records() == []
@@ -0,0 +1,99 @@
+######################### PROJECT CIM - YouTube soundtrack tests
+######################### Offline, with the local YouTube stand-in: cache hits and misses, eviction and failed downloads
+
+import os
+import shutil
+import threading
+
+import pytest
+
+from cim.encoder import ffmpeg_binary
+from cim.youtube_audio import YouTubeAudioCache, video_id
+from cim.youtube_stub import StubYouTube
+
+
+pytestmark = pytest.mark.skipif(shutil.which(ffmpeg_binary()) is None, reason="ffmpeg isn't installed")
+
+LINKS = ['https://www.youtube.com/watch?v=%s' % key for key in ('aaaaaaaaaaa', 'bbbbbbbbbbb', 'ccccccccccc')]
+
+
+def _cache_files(cache) -> list:
+    return sorted(os.listdir(cache.directory))
+
+
+def test_video_id():
+    assert video_id('https://youtu.be/aaaaaaaaaaa?t=3') == video_id(LINKS[0]) == 'aaaaaaaaaaa'
+    with pytest.raises(ValueError):
+        video_id('https://www.youtube.com/watch?v=short')
+
+
+def test_miss_then_hit(tmp_path):
+    youtube = StubYouTube(duration=1.0)
+    cache = YouTubeAudioCache(str(tmp_path / 'cache'), opener=youtube.open)
+    first, second = str(tmp_path / 'first.mp3'), str(tmp_path / 'second.mp3')
+    downloaded = cache.fetch(LINKS[0], first)
+    # Only the smallest audio-only stream was downloaded
+    assert downloaded == youtube.bytes_sent == min(stream.filesize for stream in youtube.open(LINKS[0]).streams)
+    assert LINKS[0] in cache and LINKS[1] not in cache
+    assert cache.fetch(LINKS[0], second) == 0 and youtube.bytes_sent == downloaded
+    assert open(first, 'rb').read() == open(second, 'rb').read()
+    assert _cache_files(cache) == ['aaaaaaaaaaa.mp3']
+
+
+def test_eviction(tmp_path):
+    youtube = StubYouTube(duration=1.0)
+    cache = YouTubeAudioCache(str(tmp_path / 'cache'), opener=youtube.open)
+    saving_path = str(tmp_path / 'audio.mp3')
+    cache.fetch(LINKS[0], saving_path)
+    cache.max_bytes = 2 * cache.size() + 1 # room for two soundtracks
+    cache.fetch(LINKS[1], saving_path)
+    cache.fetch(LINKS[0], saving_path) # used again, so the other one is the least recently used
+    cache.fetch(LINKS[2], saving_path)
+    assert _cache_files(cache) == ['aaaaaaaaaaa.mp3', 'ccccccccccc.mp3']
+
+
+class _FailingStream:
+    def __init__(self, stream):
+        self.stream = stream
+        self.filesize = stream.filesize
+        self.includes_video_track = False
+
+    def stream_to_buffer(self, buffer):
+        buffer.write(self.stream.content[:1000])
+        raise ConnectionError("the connection was reset")
+
+
+def test_failed_download_then_retry(tmp_path):
+    youtube = StubYouTube(duration=1.0)
+    failures = [1]
+
+    def opener(link):
+        video = youtube.open(link)
+        if failures.pop() if failures else 0:
+            video.streams[:] = [_FailingStream(stream) for stream in video.streams.filter(only_audio=True)]
+        return video
+
+    cache = YouTubeAudioCache(str(tmp_path / 'cache'), opener=opener)
+    saving_path = str(tmp_path / 'audio.mp3')
+    with pytest.raises(ConnectionError):
+        cache.fetch(LINKS[0], saving_path)
+    # Nothing is left of the failed download: no partial mp3, no lock
+    assert _cache_files(cache) == [] and cache._downloads == {} and not os.path.exists(saving_path)
+    assert cache.fetch(LINKS[0], saving_path) > 0
+    assert _cache_files(cache) == ['aaaaaaaaaaa.mp3'] and os.path.getsize(saving_path) > 0
+
+
+def test_concurrent_fetches_download_once(tmp_path):
+    youtube = StubYouTube(duration=1.0, latency=0.01)
+    cache = YouTubeAudioCache(str(tmp_path / 'cache'), opener=youtube.open)
+    results = []
+
+    def fetch(i):
+        results.append(cache.fetch(LINKS[0], str(tmp_path / ('%s.mp3' % i))))
+    threads = [threading.Thread(target=fetch, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(0) == 3 # one download, the others waited for it
+    assert cache._downloads == {} and _cache_files(cache) == ['aaaaaaaaaaa.mp3']